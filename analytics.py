@@ -0,0 +1,284 @@
+__author__ = "Harry Baines"
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from resultslog import END_OPERATOR, HEADER, RECORD, check_header
+
+""" This module provides an offline analytics job over a results log, for nightly reports on every
+question answered. The log is read in fixed-size chunks straight into NumPy structured arrays, and
+chunks are aggregated in parallel across CPU cores with vectorised group-bys, so memory stays
+bounded however many events are recorded. It reports:
+
+    error rates by operator and by operand pair
+    the mean level at each question number of a game (level trajectories)
+    the distribution of time attack scores, from the end records of games which ran until time was up
+
+Results are written as .npy columns alongside a JSON summary of the run:
+
+    python analytics.py results.log --output nightly/
+"""
+
+# NumPy layout of one results log record, matching resultslog.RECORD byte for byte
+RECORD_DTYPE = np.dtype([("timestamp", "<f8"), ("pupil", "<u4"), ("class_id", "<u4"), ("game", "<u4"),
+                         ("mode", "u1"), ("operator", "u1"), ("correct", "u1"), ("level", "<u4"),
+                         ("left", "<i8"), ("right", "<i8"), ("answer", "<i8"), ("given", "<i8"),
+                         ("latency", "<f4")])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+# Game mode key of time attack, whose score is the number of answers correct
+TIME_ATTACK = 6
+
+
+def _split_ends(records):
+    """ Splits a chunk of records into answers and the end records of scored games.
+
+    Args:
+        records: the structured array of records.
+
+    Returns:
+        the (answers, end records) tuple of structured arrays.
+    """
+    end = records["operator"] == END_OPERATOR
+    return records[~end], records[end]
+
+
+def read_chunk(path, first, count):
+    """ Reads a chunk of records from a results log.
+
+    Args:
+        path: the path of the log file.
+        first: the index of the first record, counting from the one after the header.
+        count: the number of records to read.
+
+    Returns:
+        the structured array of records.
+    """
+    return np.fromfile(path, dtype=RECORD_DTYPE, count=count, offset=HEADER.size + first * RECORD_DTYPE.itemsize)
+
+
+def _pair_index(records, max_operand):
+    """ Returns the flat (operator, left, right) index of each basic operator record, for counting by pair.
+
+    Args:
+        records: the structured array of records.
+        max_operand: the largest operand counted by pair.
+
+    Returns:
+        the array of indexes, and the mask of records it covers.
+    """
+    width = max_operand + 1
+    operator = records["operator"].astype(np.int64)
+    left = records["left"].astype(np.int64)
+    right = records["right"].astype(np.int64)
+    mask = (operator >= 1) & (operator <= 4) & (left >= 0) & (left < width) & (right >= 0) & (right < width)
+    return ((operator * width + left) * width + right)[mask], mask
+
+
+def aggregate_chunk(path, first, count, max_operand):
+    """ Aggregates one chunk of records by operator, operand pair and game.
+
+    Args:
+        path: the path of the log file.
+        first: the index of the first record.
+        count: the number of records to read.
+        max_operand: the largest operand counted by pair.
+
+    Returns:
+        the dictionary of aggregated arrays for the chunk.
+    """
+    records, ends = _split_ends(read_chunk(path, first, count))
+    wrong = records["correct"] == 0
+    operator = records["operator"]
+
+    pairs, mask = _pair_index(records, max_operand)
+    pair_bins = 5 * (max_operand + 1) ** 2
+
+    games, game_index = np.unique(records["game"], return_inverse=True)
+    answers = np.bincount(game_index, minlength=len(games))
+    return {
+        "events": len(records),
+        "operator_answers": np.bincount(operator, minlength=256),
+        "operator_wrong": np.bincount(operator[wrong], minlength=256),
+        "pair_answers": np.bincount(pairs, minlength=pair_bins),
+        "pair_wrong": np.bincount(pairs[wrong[mask]], minlength=pair_bins),
+        "games": games,
+        "game_answers": answers,
+        "game_right": np.bincount(game_index, weights=~wrong, minlength=len(games)).astype(np.int64),
+        "game_mode": np.bincount(game_index, weights=records["mode"], minlength=len(games)).astype(np.int64) // answers,
+        "time_attack_scores": ends["given"][ends["mode"] == TIME_ATTACK],
+    }
+
+
+def trajectory_chunk(path, first, count, games, offsets, max_questions):
+    """ Sums the level at each question number of a game for one chunk of records.
+    A game's records are in the order they were answered, so each record's question number
+    is the number of the game's answers in earlier chunks plus its position in this chunk.
+
+    Args:
+        path: the path of the log file.
+        first: the index of the first record.
+        count: the number of records to read.
+        games: the sorted array of game ids in the chunk.
+        offsets: the array of records each game has in earlier chunks, aligned with games.
+        max_questions: the number of question numbers tracked - later questions are counted in the last.
+
+    Returns:
+        the (level sums, answer counts) arrays indexed by question number - 1.
+    """
+    records = _split_ends(read_chunk(path, first, count))[0]
+    game_index = np.searchsorted(games, records["game"])
+    order = np.argsort(game_index, kind="stable")
+    sorted_index = game_index[order]
+    starts = np.searchsorted(sorted_index, sorted_index)
+    position = np.empty(len(records), dtype=np.int64)
+    position[order] = np.arange(len(records)) - starts
+    number = np.minimum(offsets[game_index] + position, max_questions - 1)
+    return (np.bincount(number, weights=records["level"], minlength=max_questions),
+            np.bincount(number, minlength=max_questions))
+
+
+def _error_rate(wrong, answers):
+    """ Returns wrong / answers, or NaN where nothing was answered.
+
+    Args:
+        wrong: the array of wrong answer counts.
+        answers: the array of answer counts.
+
+    Returns:
+        the array of error rates.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(answers > 0, wrong / np.maximum(answers, 1), np.nan)
+
+
+def analyse(path, output, workers=None, chunk_records=1000000, max_operand=100, max_questions=200):
+    """ Analyses a results log, writing .npy columns and a JSON summary to an output directory.
+
+    Args:
+        path: the path of the results log.
+        output: the directory to write results to.
+        workers: the number of worker processes, or None for one per CPU core.
+        chunk_records: the number of records aggregated by each task.
+        max_operand: the largest operand counted by pair.
+        max_questions: the number of question numbers tracked in level trajectories.
+
+    Returns:
+        the dictionary summarising the run.
+
+    Raises:
+        ValueError: if the log has an unsupported record version.
+    """
+    start = time.perf_counter()
+    check_header(path)
+    total = (os.path.getsize(path) - HEADER.size) // RECORD_DTYPE.itemsize
+    chunks = [(first, min(chunk_records, total - first)) for first in range(0, total, chunk_records)]
+
+    operator_answers = np.zeros(256, dtype=np.int64)
+    operator_wrong = np.zeros(256, dtype=np.int64)
+    pair_answers = np.zeros(5 * (max_operand + 1) ** 2, dtype=np.int64)
+    pair_wrong = np.zeros_like(pair_answers)
+    game_parts = []
+    score_parts = [np.zeros(0, dtype=np.int64)]
+    level_sums = np.zeros(max_questions)
+    level_counts = np.zeros(max_questions, dtype=np.int64)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+
+        # First pass - totals by operator, pair and game
+        futures = [pool.submit(aggregate_chunk, path, first, count, max_operand) for first, count in chunks]
+        for future in futures:
+            part = future.result()
+            operator_answers += part["operator_answers"]
+            operator_wrong += part["operator_wrong"]
+            pair_answers += part["pair_answers"]
+            pair_wrong += part["pair_wrong"]
+            game_parts.append((part["games"], part["game_answers"], part["game_right"], part["game_mode"]))
+            score_parts.append(part["time_attack_scores"])
+
+        # Number every game's records across chunks, then sum levels by question number in a second pass
+        all_games = np.unique(np.concatenate([part[0] for part in game_parts] + [np.zeros(0, np.uint32)]))
+        seen = np.zeros(len(all_games), dtype=np.int64)
+        futures = []
+        for (first, count), (games, answers, right, mode) in zip(chunks, game_parts):
+            index = np.searchsorted(all_games, games)
+            futures.append(pool.submit(trajectory_chunk, path, first, count, games, seen[index], max_questions))
+            seen[index] += answers
+        for future in futures:
+            sums, counts = future.result()
+            level_sums += sums
+            level_counts += counts
+
+    # Per-game totals, merged across chunks
+    game_answers = np.zeros(len(all_games), dtype=np.int64)
+    game_right = np.zeros(len(all_games), dtype=np.int64)
+    game_mode = np.zeros(len(all_games), dtype=np.uint8)
+    for games, answers, right, mode in game_parts:
+        index = np.searchsorted(all_games, games)
+        game_answers[index] += answers
+        game_right[index] += right
+        game_mode[index] = mode
+    scores = np.concatenate(score_parts)
+
+    # Columnar output
+    os.makedirs(output, exist_ok=True)
+    used = np.flatnonzero(operator_answers)
+    width = max_operand + 1
+    columns = {
+        "operator_keys": used.astype(np.uint8),
+        "operator_answers": operator_answers[used],
+        "operator_error_rate": _error_rate(operator_wrong[used], operator_answers[used]),
+        "pair_answers": pair_answers.reshape(5, width, width),
+        "pair_error_rate": _error_rate(pair_wrong, pair_answers).reshape(5, width, width),
+        "level_trajectory": np.where(level_counts > 0, level_sums / np.maximum(level_counts, 1), np.nan),
+        "level_trajectory_answers": level_counts,
+        "game_ids": all_games,
+        "game_modes": game_mode,
+        "game_answers": game_answers,
+        "game_right": game_right,
+        "time_attack_scores": np.bincount(scores, minlength=1),
+    }
+    for name, column in columns.items():
+        np.save(os.path.join(output, name + ".npy"), column)
+
+    elapsed = time.perf_counter() - start
+    answers = int(operator_answers.sum())
+    summary = {
+        "events": int(total),
+        "answers": answers,
+        "games": int(len(all_games)),
+        "chunks": len(chunks),
+        "seconds": elapsed,
+        "events_per_second": total / elapsed if elapsed else None,
+        "error_rate": float(operator_wrong.sum() / answers) if answers else None,
+        "time_attack_games": int(len(scores)),
+        "time_attack_mean_score": float(scores.mean()) if len(scores) else None,
+    }
+    with open(os.path.join(output, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+# Main function to analyse a results log from the command line
+def main():
+    parser = argparse.ArgumentParser(description="Analyse a Maths Game results log.")
+    parser.add_argument("log", help="results log file to analyse")
+    parser.add_argument("--output", required=True, help="directory to write .npy columns and summary.json to")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-records", type=int, default=1000000)
+    parser.add_argument("--max-operand", type=int, default=100)
+    parser.add_argument("--max-questions", type=int, default=200)
+    args = parser.parse_args()
+
+    summary = analyse(args.log, args.output, args.workers, args.chunk_records, args.max_operand, args.max_questions)
+    print(json.dumps(summary, indent=2))
+    print("Analysed " + str(summary["events"]) + " events in " + format(summary["seconds"], ".2f") + " s")
+
+# Program entry point
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+__author__ = "Harry Baines"
+
+import argparse
+import json
+import platform
+import random
+import time
+import tracemalloc
+
+import operators
+from difficulty import SkillModel
+from leaderboard import Leaderboard
+from mathengine import MathEngine
+
+""" This module provides a reproducible benchmark harness for the hot paths of the math engine -
+question generation, answer checking, level adaptation, per-session memory and leaderboards. Benchmarks run
+headless against a stub window with a fixed seed, and results are written as JSON so runs can
+be compared between commits, for example:
+
+    python benchmark.py --output before.json
+"""
+
+# Names of the question generators in MathEngine's function dictionary
+_GENERATOR_NAMES = {1: "add", 2: "sub", 3: "mult", 4: "div", 5: "random"}
+
+# Most memory in bytes a started session may hold, so a server can host a whole school in little memory
+SESSION_BUDGET = 640
+
+
+class StubWindow(object):
+
+    """ This class stands in for AnswerWindow, binding to every engine event
+        and counting the updates it would make to the UI. """
+
+    def __init__(self, engine):
+        """ Constructor to initialise a new StubWindow instance.
+
+        Args:
+            engine: the MathEngine instance to bind to.
+        """
+        self.updates = 0
+        for event in ("info", "time", "question", "result", "finished"):
+            engine.bind(event, self._update)
+
+    def _update(self, value):
+        """ Counts a UI update.
+
+        Args:
+            value: the event value.
+        """
+        self.updates += 1
+
+
+def _engine(math_key, max_level=10):
+    """ Creates an engine seeded from the benchmark's seeded random number generator.
+
+    Args:
+        math_key: the key of the game mode.
+        max_level: the highest maximum bound the engine's level can reach.
+
+    Returns:
+        the new MathEngine instance.
+    """
+    return MathEngine(math_key, seed=random.getrandbits(64), max_level=max_level)
+
+
+def _best_of(repeats, func):
+    """ Times a function several times and returns the fastest run.
+
+    Args:
+        repeats: the number of times to run the function.
+        func: the function to time.
+
+    Returns:
+        the fastest run time in seconds.
+    """
+    best = float("inf")
+    for i in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_generators(iterations, repeats):
+    """ Measures questions per second for each question generator at the starting level.
+
+    Args:
+        iterations: the number of questions generated per run.
+        repeats: the number of runs.
+
+    Returns:
+        the dictionary of questions per second keyed by generator name.
+    """
+    results = {}
+    for key, name in _GENERATOR_NAMES.items():
+        engine = _engine(key)
+        StubWindow(engine)
+        generator = engine.math_func_dict[key]
+
+        def run():
+            for i in range(iterations):
+                generator()
+
+        results[name] = iterations / _best_of(repeats, run)
+    return results
+
+
+def bench_division_levels(iterations, repeats):
+    """ Measures the division generator at every level up to the maximum level.
+    The first question at a level builds that level's pair table, so it is timed separately.
+    The expected number of attempts the old retry loop needed is included for comparison.
+
+    Args:
+        iterations: the number of questions generated per run.
+        repeats: the number of runs.
+
+    Returns:
+        the list of results for each level.
+    """
+    engine = _engine(4)
+    results = []
+    for level in range(engine._start_max, engine._max_level + 1):
+        engine._max_bound = level
+        operators._pair_tables.clear()
+
+        start = time.perf_counter()
+        engine.get_div_question()
+        cold = time.perf_counter() - start
+
+        def run():
+            for i in range(iterations):
+                engine.get_div_question()
+
+        pairs = (level - engine._min_bound + 1) ** 2
+        valid = len(operators.get_pair_table("/", engine._min_bound, level))
+        results.append({"level": level, "cold_seconds": cold, "questions_per_second": iterations / _best_of(repeats, run),
+                        "table_size": valid, "retry_loop_expected_attempts": pairs / valid})
+    return results
+
+
+def bench_level_scaling(iterations, repeats, levels=(10, 100, 1000, 10000, 100000)):
+    """ Measures generating questions for every registered operator and expression template as
+    the maximum level grows. Operands are generated constructively, so the cost should stay flat.
+
+    Args:
+        iterations: the number of questions generated per run.
+        repeats: the number of runs.
+        levels: the maximum levels to measure, each played from a minimum bound of 1.
+
+    Returns:
+        the dictionary of questions per second keyed by level, then by operator name.
+    """
+    results = {}
+    for level in levels:
+        engine = _engine(9, level)
+        engine._max_bound = level
+        results[str(level)] = {}
+        for key in operators.basic_keys() + operators.expression_keys():
+
+            def run():
+                for i in range(iterations):
+                    engine._draw(key)
+
+            results[str(level)][operators.get_operator(key).name] = iterations / _best_of(repeats, run)
+    return results
+
+
+def bench_answers(iterations, repeats):
+    """ Measures the cost of checking an answer, including level adaptation and the next question,
+    and the cost of level adaptation on its own. Answers alternate between runs of right and wrong
+    so the level moves up and down.
+
+    Args:
+        iterations: the number of answers checked per run.
+        repeats: the number of runs.
+
+    Returns:
+        the dictionary of answers per second for check_answer, and for monitor_level with each difficulty model.
+    """
+    engine = _engine(5)
+    StubWindow(engine)
+    engine.start()
+    entries = [None if (i // 4) % 2 == 0 else "0" for i in range(iterations)]
+
+    def run_check():
+        for entry in entries:
+            engine.check_answer(entry if entry is not None else str(engine.question.answer))
+
+    def run_monitor():
+        for entry in entries:
+            engine._correct = entry is None
+            engine.monitor_level()
+
+    results = {"check_answer": iterations / _best_of(repeats, run_check),
+               "monitor_level": iterations / _best_of(repeats, run_monitor)}
+    engine.set_difficulty(SkillModel())
+    results["monitor_level_skill"] = iterations / _best_of(repeats, run_monitor)
+    return results
+
+
+def bench_grading(iterations, repeats, batch_size=50):
+    """ Measures grading answer sheets in batches against checking answers one at a time.
+    A quarter of the entries are not whole numbers and a quarter are wrong. Sheets are issued
+    before grading is timed, so issuing is reported separately - check_answer includes
+    generating each next question.
+
+    Args:
+        iterations: the number of answers graded per run.
+        repeats: the number of runs.
+        batch_size: the number of answers in each batch.
+
+    Returns:
+        the dictionary of answers per second for each path, and questions issued per second.
+    """
+    def entry(i, question):
+        return "x" if i % 4 == 0 else str(question.answer + (i % 4 == 1))
+
+    def run_single():
+        engine = _engine(5)
+        engine.start()
+        for i in range(iterations):
+            engine.check_answer(entry(i, engine.question))
+
+    issue_best = grade_best = float("inf")
+    for repeat in range(repeats):
+        engine = _engine(5)
+        engine.start()
+        start = time.perf_counter()
+        sheets = [engine.issue_sheet(batch_size, iterations) for i in range(iterations // batch_size)]
+        issue_best = min(issue_best, time.perf_counter() - start)
+        batches = [[(question_id, entry(i, question)) for i, (question_id, question) in enumerate(sheet)] for sheet in sheets]
+
+        start = time.perf_counter()
+        for batch in batches:
+            engine.grade_batch(batch)
+        grade_best = min(grade_best, time.perf_counter() - start)
+
+    answers = iterations // batch_size * batch_size
+    return {"batch_size": batch_size, "check_answer": iterations / _best_of(repeats, run_single),
+            "grade_batch": answers / grade_best, "issue_sheet_questions": answers / issue_best}
+
+
+def bench_sessions(sessions, repeats):
+    """ Measures the memory held by each started engine session, and the cost of
+    taking and restoring a snapshot of a session's state, in memory and packed as bytes.
+
+    Args:
+        sessions: the number of sessions to create.
+        repeats: the number of runs.
+
+    Returns:
+        the dictionary of bytes per session, whether that is within SESSION_BUDGET, and snapshots per second.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    engines = [_engine(5) for i in range(sessions)]
+    for engine in engines:
+        engine.start()
+    per_session = (tracemalloc.get_traced_memory()[0] - before) / sessions
+    tracemalloc.stop()
+
+    def run():
+        for engine in engines:
+            MathEngine.restore(engine.snapshot())
+
+    def run_packed():
+        for engine in engines:
+            MathEngine.unpack(engine.pack())
+
+    return {"bytes_per_session": per_session, "within_budget": per_session <= SESSION_BUDGET,
+            "snapshot_restores_per_second": sessions / _best_of(repeats, run),
+            "packed_bytes": len(engines[0].pack()), "pack_unpacks_per_second": sessions / _best_of(repeats, run_packed)}
+
+
+def bench_leaderboard(pupils, repeats):
+    """ Measures submitting scores to a leaderboard and ranking pupils on it.
+
+    Args:
+        pupils: the number of pupils on the leaderboard.
+        repeats: the number of runs.
+
+    Returns:
+        the dictionary of submits and ranks per second.
+    """
+    scores = [(random.randrange(pupils), random.randrange(60)) for i in range(pupils)]
+
+    def run_submit():
+        board = Leaderboard()
+        for timestamp, (pupil, score) in enumerate(scores):
+            board.submit(pupil, score, timestamp)
+        return board
+
+    board = run_submit()
+
+    def run_rank():
+        for pupil, score in scores:
+            board.rank(pupil)
+
+    return {"pupils": pupils, "submits_per_second": pupils / _best_of(repeats, run_submit),
+            "ranks_per_second": pupils / _best_of(repeats, run_rank)}
+
+
+def run_benchmarks(seed=212, iterations=100000, repeats=5):
+    """ Runs every benchmark with a fixed seed.
+
+    Args:
+        seed: the random seed.
+        iterations: the number of operations per run.
+        repeats: the number of runs, of which the fastest is reported.
+
+    Returns:
+        the dictionary of benchmark results.
+    """
+    random.seed(seed)
+    return {
+        "meta": {"seed": seed, "iterations": iterations, "repeats": repeats,
+                 "python": platform.python_version(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "generators": bench_generators(iterations, repeats),
+        "division_levels": bench_division_levels(iterations, repeats),
+        "level_scaling": bench_level_scaling(iterations // 10, repeats),
+        "answers": bench_answers(iterations, repeats),
+        "grading": bench_grading(iterations, repeats),
+        "sessions": bench_sessions(iterations // 10, repeats),
+        "leaderboard": bench_leaderboard(iterations, repeats),
+    }
+
+
+# Main function to run the benchmarks and write the results
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Maths Game engine.")
+    parser.add_argument("--seed", type=int, default=212)
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="file to write JSON results to (default: print them)")
+    args = parser.parse_args()
+
+    results = json.dumps(run_benchmarks(args.seed, args.iterations, args.repeats), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(results + "\n")
+    else:
+        print(results)
+
+# Program entry point
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+__author__ = "Harry Baines"
+
+from abc import ABC, abstractmethod
+
+from operators import basic_keys
+
+""" This module provides the difficulty models which adapt the game to each player. A model is
+told the result of every answer, moves the engine's operand bounds, and chooses the operator of
+each question in the mixed game modes. Every update is O(1) so a model can run inside
+check_answer for every session on a busy server.
+
+StreakModel is the original rule - the maximum bound moves by one after three right or three
+wrong answers in a row. SkillModel tracks a separate skill estimate for each operator.
+"""
+
+
+class DifficultyModel(ABC):
+
+    """ This class defines the interface of a difficulty model. Models read and
+        update the engine's bounds and counters directly, as the engine calls
+        them from monitor_level and get_rand_operator. """
+
+    __slots__ = ()
+
+    @abstractmethod
+    def update(self, engine, operator, correct):
+        """ Adjusts the engine's level after an answer.
+
+        Args:
+            engine: the MathEngine which checked the answer.
+            operator: the operator key of the question answered.
+            correct: True if the answer was correct.
+        """
+
+    def resume(self, engine):
+        """ Adapts the model to a level carried over into the engine from an earlier game.
+
+        Args:
+            engine: the MathEngine whose bounds were resumed.
+        """
+
+    def choose_operator(self, engine, operators):
+        """ Chooses the operator of the next question in a mixed game mode,
+        setting the engine's bounds for it if they depend on the operator.
+
+        Args:
+            engine: the MathEngine asking the question.
+            operators: the tuple of operator keys to choose from.
+
+        Returns:
+            the operator key.
+        """
+        return engine._rng.choice(operators)
+
+
+class StreakModel(DifficultyModel):
+
+    """ This class implements the original difficulty rule. Answering 3 questions
+        correctly in a row increases the maximum bound, and answering 3 questions
+        incorrectly in a row decreases it. The model holds no state of its own,
+        so one instance is shared by every engine. """
+
+    __slots__ = ()
+
+    def update(self, engine, operator, correct):
+        """ Adjusts the engine's maximum bound using its streak counters.
+        The maximum bound stays between the engine's starting maximum (4) and its max level.
+
+        Args:
+            engine: the MathEngine which checked the answer.
+            operator: the operator key of the question answered.
+            correct: True if the answer was correct.
+        """
+        if correct:
+            engine._consec_right += 1
+            engine._consec_wrong = 0
+
+            # Dynamically increase level
+            if (engine._consec_right == 3) and (engine._max_bound != engine._max_level):
+                engine._max_bound += 1
+                engine._consec_right = 0
+        else:
+            engine._consec_wrong += 1
+            engine._consec_right = 0
+
+            # Dynamically decrease level
+            if (engine._consec_wrong == 3) and (engine._max_bound != engine._start_max):
+                engine._max_bound -= 1
+                engine._consec_wrong = 0
+
+
+class SkillModel(DifficultyModel):
+
+    """ This class keeps a skill estimate and a level for each operator. Skill is an
+        exponentially weighted average of the player's accuracy, and is used to ask
+        weaker operators more often. The level moves Elo-style towards the point
+        where the player gets the target share of questions right, and sets both
+        the minimum and maximum bound, so easy questions drop out as the player improves. """
+
+    __slots__ = ("_skills", "_levels", "_alpha", "_step", "_target")
+
+    def __init__(self, start_level=4, alpha=0.2, step=1.5, target=0.8):
+        """ Constructor to initialise a new SkillModel instance.
+
+        Args:
+            start_level: the starting maximum bound for every operator.
+            alpha: the weight of the newest answer in each skill estimate.
+            step: how far the level moves after an unexpected answer.
+            target: the share of questions the player should get right.
+        """
+        self._skills = dict.fromkeys(basic_keys(), 0.5)
+        self._levels = dict.fromkeys(basic_keys(), float(start_level))
+        self._alpha = alpha
+        self._step = step
+        self._target = target
+
+    def update(self, engine, operator, correct):
+        """ Updates the operator's skill and level. The engine's bounds only move when the
+        operator's level reaches a new whole number, so a prefetcher's buffer is not thrown
+        away after every answer. Expression templates are tracked separately from the basic operators.
+
+        Args:
+            engine: the MathEngine which checked the answer.
+            operator: the operator key of the question answered.
+            correct: True if the answer was correct.
+        """
+        score = 1.0 if correct else 0.0
+        skill = self._skills.get(operator, 0.5)
+        self._skills[operator] = skill + self._alpha * (score - skill)
+        previous = self._levels.get(operator, float(engine._start_max))
+        level = min(float(engine._max_level), max(float(engine._start_max), previous + self._step * (score - self._target)))
+        self._levels[operator] = level
+        if int(round(level)) != int(round(previous)):
+            self._set_bounds(engine, operator)
+
+    def resume(self, engine):
+        """ Starts every operator's level from the level carried over into the engine,
+        so the first question doesn't drop the player back to the starting level.
+
+        Args:
+            engine: the MathEngine whose bounds were resumed.
+        """
+        for operator in set(self._levels).union(engine.operator_keys):
+            self._levels[operator] = float(engine._max_bound)
+
+    def choose_operator(self, engine, operators):
+        """ Chooses an operator, favouring those the player is weakest at.
+
+        Args:
+            engine: the MathEngine asking the question.
+            operators: the tuple of operator keys to choose from.
+
+        Returns:
+            the operator key.
+        """
+        weights = [1.25 - self._skills.get(operator, 0.5) for operator in operators]
+        pick = engine._rng.next64() * sum(weights) / 2.0 ** 64
+        operator = operators[-1]
+        for i in range(len(operators) - 1):
+            pick -= weights[i]
+            if pick < 0:
+                operator = operators[i]
+                break
+        self._set_bounds(engine, operator)
+        return operator
+
+    def _set_bounds(self, engine, operator):
+        """ Sets the engine's bounds from an operator's level.
+
+        Args:
+            engine: the MathEngine to update.
+            operator: the operator key.
+        """
+        engine._max_bound = int(round(self._levels.get(operator, float(engine._start_max))))
+        engine._min_bound = engine._start_min + (engine._max_bound - engine._start_max) // 2
+
+    def skill(self, operator):
+        """ Returns the player's skill estimate for an operator.
+
+        Args:
+            operator: the operator key.
+
+        Returns:
+            the estimated accuracy between 0 and 1.
+        """
+        return self._skills.get(operator, 0.5)
+
+    def level(self, operator):
+        """ Returns the player's level for an operator.
+
+        Args:
+            operator: the operator key.
+
+        Returns:
+            the level as a maximum bound, or None if the operator has not been answered.
+        """
+        return self._levels.get(operator)
+
+
+# The streak rule holds no state, so every engine can share one instance
+STREAK_MODEL = StreakModel()
+
+# Names of the models which can be chosen from the command line
+MODELS = ("streak", "skill")
+
+
+def make_model(name):
+    """ Returns a difficulty model for one session.
+
+    Args:
+        name: the name of the model - 'streak' or 'skill'.
+
+    Returns:
+        the DifficultyModel.
+
+    Raises:
+        ValueError: if the name is not a known model.
+    """
+    if name == "streak":
+        return STREAK_MODEL
+    if name == "skill":
+        return SkillModel()
+    raise ValueError("Unknown difficulty model: " + str(name))
@@ -0,0 +1,161 @@
+__author__ = "Harry Baines"
+
+import json
+import math
+import threading
+
+""" This module provides low-overhead timing instrumentation for the math engine. Timings are
+kept in log-scale histograms which record each sample in constant time and memory, covering
+how long pupils take to answer, how long each question generator takes and how long answers
+take to check. Instrumentation is switched on at runtime with mathengine.set_profiler and costs
+a single check per answer while it is off.
+"""
+
+# Number of histogram buckets for each doubling of time
+_SUB_BUCKETS = 4
+
+# Smallest and largest binary exponents tracked - roughly 1 nanosecond to 18 hours
+_MIN_EXP = -30
+_MAX_EXP = 16
+
+
+class Histogram(object):
+
+    """ This class records durations in log-scale buckets, each a quarter of a
+        doubling wide, so percentiles are accurate to within about 25%. """
+
+    __slots__ = ("_counts", "_count", "_total", "_min", "_max")
+
+    def __init__(self):
+        """ Constructor to initialise a new, empty Histogram instance. """
+        self._counts = [0] * ((_MAX_EXP - _MIN_EXP + 1) * _SUB_BUCKETS)
+        self._count = 0
+        self._total = 0.0
+        self._min = math.inf
+        self._max = 0.0
+
+    def record(self, seconds):
+        """ Records one duration.
+
+        Args:
+            seconds: the duration in seconds.
+        """
+        self._count += 1
+        self._total += seconds
+        if seconds < self._min:
+            self._min = seconds
+        if seconds > self._max:
+            self._max = seconds
+
+        mantissa, exponent = math.frexp(seconds)
+        if seconds <= 0 or exponent < _MIN_EXP:
+            index = 0
+        elif exponent > _MAX_EXP:
+            index = len(self._counts) - 1
+        else:
+            index = (exponent - _MIN_EXP) * _SUB_BUCKETS + int((mantissa - 0.5) * 2 * _SUB_BUCKETS)
+        self._counts[index] += 1
+
+    def _bucket_upper(self, index):
+        """ Returns the upper bound of a bucket in seconds.
+
+        Args:
+            index: the bucket index.
+
+        Returns:
+            the largest duration counted in the bucket.
+        """
+        exponent, sub = divmod(index, _SUB_BUCKETS)
+        return math.ldexp(0.5 + (sub + 1) / (2.0 * _SUB_BUCKETS), exponent + _MIN_EXP)
+
+    def percentile(self, point):
+        """ Returns an estimate of a percentile of the recorded durations.
+
+        Args:
+            point: the percentile between 0 and 100.
+
+        Returns:
+            the estimated duration in seconds, or None if nothing has been recorded.
+        """
+        if not self._count:
+            return None
+        target = self._count * point / 100.0
+        seen = 0
+        for index, n in enumerate(self._counts):
+            seen += n
+            if n and seen >= target:
+                return min(self._max, max(self._min, self._bucket_upper(index)))
+        return self._max
+
+    def summary(self):
+        """ Returns a summary of the recorded durations.
+
+        Returns:
+            the dictionary of count, mean, minimum, maximum and percentiles in seconds.
+        """
+        if not self._count:
+            return {"count": 0}
+        return {"count": self._count, "mean": self._total / self._count, "min": self._min, "max": self._max,
+                "p50": self.percentile(50), "p90": self.percentile(90), "p99": self.percentile(99)}
+
+    @property
+    def count(self):
+        """ Returns the number of durations recorded.
+
+        Returns:
+            the sample count.
+        """
+        return self._count
+
+
+class Profiler(object):
+
+    """ This class holds a named Histogram for each instrumented path, creating
+        histograms the first time a name is recorded. """
+
+    def __init__(self):
+        """ Constructor to initialise a new Profiler instance. """
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        """ Records one duration against a name.
+
+        Args:
+            name: the name of the instrumented path, e.g. 'check_answer'.
+            seconds: the duration in seconds.
+        """
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        histogram.record(seconds)
+
+    def histogram(self, name):
+        """ Returns the histogram for a name.
+
+        Args:
+            name: the name of the instrumented path.
+
+        Returns:
+            the Histogram, or None if nothing has been recorded for the name.
+        """
+        return self._histograms.get(name)
+
+    def summary(self):
+        """ Returns a summary of every histogram.
+
+        Returns:
+            the dictionary of histogram summaries keyed by name.
+        """
+        return {name: self._histograms[name].summary() for name in sorted(self._histograms)}
+
+    def export(self, path):
+        """ Writes the summary of every histogram to a JSON file.
+
+        Args:
+            path: the path of the file to write.
+        """
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+            f.write("\n")
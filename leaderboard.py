@@ -0,0 +1,468 @@
+__author__ = "Harry Baines"
+
+import os
+import random
+import struct
+import time
+
+""" This module provides class-wide and school-wide leaderboards for the time attack and unlimited
+game modes. Each leaderboard keeps every pupil's best score in an indexable skip list, so a new
+score is inserted and any pupil's rank is found in O(log n) time as games finish. Best scores are
+appended to a binary file as they improve, and at startup the file is read in bulk and each skip
+list is built straight from the sorted scores in linear time.
+"""
+
+# Game modes which are scored on leaderboards - time attack and unlimited mode
+SCORED_MODES = (6, 7)
+
+# Binary layout of one best score: mode, class, pupil, score and the time it was achieved
+ENTRY = struct.Struct("<BIIId")
+
+
+class _Node(object):
+
+    """ This class holds one entry of a RankedList, with a forward link and
+        the number of entries it skips over at each of its levels. """
+
+    __slots__ = ("key", "value", "next", "width")
+
+    def __init__(self, key, value, levels):
+        self.key = key
+        self.value = value
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+
+class RankedList(object):
+
+    """ This class implements an indexable skip list. Entries are kept sorted by
+        key, and each link records how many entries it skips, so inserting,
+        removing, finding the rank of a key and finding the entry at a rank all
+        take O(log n) time. Keys must be unique. """
+
+    _MAX_LEVELS = 24
+
+    def __init__(self, seed=None):
+        """ Constructor to initialise a new, empty RankedList instance.
+
+        Args:
+            seed: the seed for choosing the level of each entry, or None.
+        """
+        self._head = _Node(None, None, self._MAX_LEVELS)
+        self._size = 0
+        self._rng = random.Random(seed)
+
+    def __len__(self):
+        """ Returns the number of entries.
+
+        Returns:
+            the entry count.
+        """
+        return self._size
+
+    def _find(self, key):
+        """ Finds the last node before the key at every level.
+
+        Args:
+            key: the key to search for.
+
+        Returns:
+            the list of nodes before the key, and the list of entries skipped at each level.
+        """
+        chain = [None] * self._MAX_LEVELS
+        steps = [0] * self._MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self._MAX_LEVELS)):
+            following = node.next[level]
+            while following is not None and following.key < key:
+                steps[level] += node.width[level]
+                node = following
+                following = node.next[level]
+            chain[level] = node
+        return chain, steps
+
+    def insert(self, key, value=None):
+        """ Inserts an entry.
+
+        Args:
+            key: the key to sort the entry by.
+            value: the value stored with the key.
+        """
+        chain, steps = self._find(key)
+        levels = 1
+        while levels < self._MAX_LEVELS and self._rng.random() < 0.5:
+            levels += 1
+
+        node = _Node(key, value, levels)
+        skipped = 0
+        for level in range(levels):
+            previous = chain[level]
+            node.next[level] = previous.next[level]
+            previous.next[level] = node
+            node.width[level] = previous.width[level] - skipped
+            previous.width[level] = skipped + 1
+            skipped += steps[level]
+        for level in range(levels, self._MAX_LEVELS):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        """ Removes the entry with a key.
+
+        Args:
+            key: the key of the entry.
+
+        Raises:
+            KeyError: if there is no entry with the key.
+        """
+        chain, steps = self._find(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+
+        levels = len(node.next)
+        for level in range(levels):
+            previous = chain[level]
+            previous.width[level] += node.width[level] - 1
+            previous.next[level] = node.next[level]
+        for level in range(levels, self._MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def rank(self, key):
+        """ Returns the number of entries with keys before a key.
+
+        Args:
+            key: the key to rank.
+
+        Returns:
+            the 0-based rank the key has, or would have if it were inserted.
+        """
+        chain, steps = self._find(key)
+        return sum(steps)
+
+    def _node_at(self, index):
+        """ Returns the node at a 0-based index.
+
+        Args:
+            index: the index, between 0 and the number of entries - 1.
+
+        Returns:
+            the _Node.
+        """
+        remaining = index + 1
+        node = self._head
+        for level in reversed(range(self._MAX_LEVELS)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def items(self, start=0, stop=None):
+        """ Returns the entries between two ranks.
+
+        Args:
+            start: the 0-based rank of the first entry.
+            stop: the rank after the last entry, or None for the end.
+
+        Returns:
+            the list of (key, value) tuples.
+        """
+        stop = self._size if stop is None else min(stop, self._size)
+        if start >= stop:
+            return []
+        node = self._node_at(start)
+        entries = []
+        for i in range(stop - start):
+            entries.append((node.key, node.value))
+            node = node.next[0]
+        return entries
+
+    def load(self, entries):
+        """ Builds the list from entries which are already sorted by key, in linear time.
+        Levels follow the position of each entry, giving a perfectly balanced list.
+
+        Args:
+            entries: the list of (key, value) tuples in key order.
+
+        Raises:
+            ValueError: if the list is not empty.
+        """
+        if self._size:
+            raise ValueError("RankedList.load needs an empty list")
+
+        max_levels = self._MAX_LEVELS
+        last = [self._head] * max_levels
+        last_position = [0] * max_levels
+        position = 0
+        for key, value in entries:
+            position += 1
+            levels = (position & -position).bit_length()
+            node = _Node(key, value, levels if levels < max_levels else max_levels)
+            for level in range(levels if levels < max_levels else max_levels):
+                previous = last[level]
+                previous.next[level] = node
+                previous.width[level] = position - last_position[level]
+                last[level] = node
+                last_position[level] = position
+        for level in range(max_levels):
+            last[level].width[level] = position + 1 - last_position[level]
+        self._size = position
+
+
+class Leaderboard(object):
+
+    """ This class ranks pupils by their best score, highest first. Ties go to
+        the pupil who reached the score first. """
+
+    def __init__(self):
+        """ Constructor to initialise a new, empty Leaderboard instance. """
+        self._ranks = RankedList()
+        self._best = {}
+
+    def __len__(self):
+        """ Returns the number of pupils on the leaderboard.
+
+        Returns:
+            the pupil count.
+        """
+        return len(self._best)
+
+    def submit(self, pupil, score, timestamp):
+        """ Puts a pupil's score on the leaderboard if it beats their best.
+
+        Args:
+            pupil: the pupil id.
+            score: the score.
+            timestamp: the time the score was achieved.
+
+        Returns:
+            True if the score is the pupil's new best.
+        """
+        key = (-score, timestamp, pupil)
+        best = self._best.get(pupil)
+        if best is not None:
+            if best <= key:
+                return False
+            self._ranks.remove(best)
+        self._ranks.insert(key, pupil)
+        self._best[pupil] = key
+        return True
+
+    def rank(self, pupil):
+        """ Returns a pupil's position on the leaderboard.
+
+        Args:
+            pupil: the pupil id.
+
+        Returns:
+            the 1-based position, or None if the pupil has no score.
+        """
+        best = self._best.get(pupil)
+        if best is None:
+            return None
+        return self._ranks.rank(best) + 1
+
+    def best(self, pupil):
+        """ Returns a pupil's best score.
+
+        Args:
+            pupil: the pupil id.
+
+        Returns:
+            the score, or None if the pupil has no score.
+        """
+        best = self._best.get(pupil)
+        return None if best is None else -best[0]
+
+    def top(self, count=10):
+        """ Returns the highest scores.
+
+        Args:
+            count: the number of scores to return.
+
+        Returns:
+            the list of (pupil, score) tuples, best first.
+        """
+        return [(pupil, -key[0]) for key, pupil in self._ranks.items(0, count)]
+
+    def _load(self, keys):
+        """ Fills an empty leaderboard from best score keys.
+
+        Args:
+            keys: the list of (-score, timestamp, pupil) keys, one per pupil.
+        """
+        keys.sort()
+        self._ranks.load([(key, key[2]) for key in keys])
+        self._best = {key[2]: key for key in keys}
+
+
+class LeaderboardStore(object):
+
+    """ This class keeps a leaderboard for every class and one for the whole school
+        in each scored game mode, saving best scores to a file as they improve.
+        The file is rewritten without beaten scores once they make up most of it. """
+
+    def __init__(self, path, buffer_size=65536):
+        """ Constructor to initialise a new LeaderboardStore instance, loading any saved scores.
+
+        Args:
+            path: the path of the scores file.
+            buffer_size: the number of bytes buffered before scores are written to disk.
+        """
+        self._path = path
+        self._buffer_size = buffer_size
+        self._boards = {}
+        self._entries = 0
+        self._load()
+        self._file = open(path, "ab", buffering=buffer_size)
+
+    def _load(self):
+        """ Loads saved scores, building each leaderboard in bulk. """
+        if not os.path.exists(self._path):
+            return
+        with open(self._path, "rb") as f:
+            data = f.read()
+
+        # Drop any partly written entry left by a crash
+        partial = len(data) % ENTRY.size
+        data = data[:len(data) - partial]
+
+        # Keep the best score of each pupil for each class
+        best = {}
+        for mode, class_id, pupil, score, timestamp in ENTRY.iter_unpack(data):
+            key = (-score, timestamp, pupil)
+            previous = best.get((mode, class_id, pupil))
+            if previous is None or key < previous:
+                best[(mode, class_id, pupil)] = key
+        self._entries = len(data) // ENTRY.size
+
+        # The school leaderboard holds each pupil's best score across classes
+        boards = {}
+        school = {}
+        for (mode, class_id, pupil), key in best.items():
+            boards.setdefault((mode, class_id), []).append(key)
+            previous = school.get((mode, pupil))
+            if previous is None or key < previous:
+                school[(mode, pupil)] = key
+        for (mode, pupil), key in school.items():
+            boards.setdefault((mode, None), []).append(key)
+        for board_key, keys in boards.items():
+            self._board(*board_key)._load(keys)
+
+        # Rewrite the file without beaten scores once they make up most of it
+        if partial or self._entries > 2 * len(best):
+            self._compact(best)
+
+    def _compact(self, best):
+        """ Rewrites the scores file with only the best scores.
+
+        Args:
+            best: the dictionary of (-score, timestamp, pupil) keys keyed by (mode, class id, pupil).
+        """
+        with open(self._path + ".tmp", "wb") as f:
+            for (mode, class_id, pupil), key in best.items():
+                f.write(ENTRY.pack(mode, class_id, pupil, -key[0], key[1]))
+        os.replace(self._path + ".tmp", self._path)
+        self._entries = len(best)
+
+    def _board(self, mode, class_id):
+        """ Returns a leaderboard, creating it if needed.
+
+        Args:
+            mode: the game mode key.
+            class_id: the class id, or None for the school.
+
+        Returns:
+            the Leaderboard.
+        """
+        board = self._boards.get((mode, class_id))
+        if board is None:
+            board = self._boards[(mode, class_id)] = Leaderboard()
+        return board
+
+    def submit(self, mode, pupil, class_id, score, timestamp=None):
+        """ Adds a finished game's score to the class and school leaderboards.
+
+        Args:
+            mode: the game mode key (6 or 7).
+            pupil: the pupil id.
+            class_id: the class id.
+            score: the score.
+            timestamp: the time the game finished, or None for now.
+
+        Returns:
+            True if the score is the pupil's new best in their class.
+
+        Raises:
+            ValueError: if the game mode is not scored.
+        """
+        if mode not in SCORED_MODES:
+            raise ValueError("Game mode is not scored: " + str(mode))
+        timestamp = time.time() if timestamp is None else timestamp
+        if not self._board(mode, class_id).submit(pupil, score, timestamp):
+            return False
+        self._board(mode, None).submit(pupil, score, timestamp)
+        self._file.write(ENTRY.pack(mode, class_id, pupil, score, timestamp))
+        self._entries += 1
+        return True
+
+    def attach(self, engine, pupil, class_id):
+        """ Submits the score of an engine's game when it finishes, if the game is scored.
+
+        Args:
+            engine: the MathEngine instance.
+            pupil: the pupil id.
+            class_id: the class id.
+        """
+        def submit_score(summary):
+            if engine.score is not None:
+                self.submit(engine.math_key, pupil, class_id, engine.score)
+
+        if engine.math_key in SCORED_MODES:
+            engine.bind("finished", submit_score)
+
+    def top(self, mode, count=10, class_id=None):
+        """ Returns the highest scores in a game mode.
+
+        Args:
+            mode: the game mode key.
+            count: the number of scores to return.
+            class_id: the class id, or None for the school.
+
+        Returns:
+            the list of (pupil, score) tuples, best first.
+        """
+        board = self._boards.get((mode, class_id))
+        return [] if board is None else board.top(count)
+
+    def rank(self, mode, pupil, class_id=None):
+        """ Returns a pupil's position and best score in a game mode.
+
+        Args:
+            mode: the game mode key.
+            pupil: the pupil id.
+            class_id: the class id, or None for the school.
+
+        Returns:
+            the (1-based position, number of pupils, best score) tuple, or None if the pupil has no score.
+        """
+        board = self._boards.get((mode, class_id))
+        if board is None or board.rank(pupil) is None:
+            return None
+        return board.rank(pupil), len(board), board.best(pupil)
+
+    def flush(self):
+        """ Writes buffered scores to disk. """
+        self._file.flush()
+
+    def close(self):
+        """ Writes buffered scores to disk and closes the scores file. """
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,152 @@
+__author__ = "Harry Baines"
+
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+
+""" This module provides a cache of each pupil's packed engine state, so a pupil's level carries
+over between games and between restarts. States are kept in memory in least recently used order
+and stored in a SQLite database. The most recently active pupils are bulk loaded at startup, new
+states are written behind in batches, and inactive pupils are evicted from memory once the cache
+is full - an evicted pupil is read back from the database the next time they play.
+"""
+
+_log = logging.getLogger(__name__)
+
+
+class LevelCache(object):
+
+    """ This class maps pupil ids to the packed state of their last game, as
+        returned by MathEngine.pack. Saved states are written to the database
+        whenever enough have built up, or when flush is called. """
+
+    def __init__(self, path, capacity=10000, flush_every=256, clock=time.time):
+        """ Constructor to initialise a new LevelCache instance, loading the most recently active pupils.
+
+        Args:
+            path: the path of the SQLite database file.
+            capacity: the maximum number of pupils held in memory.
+            flush_every: the number of unsaved states which triggers a write to the database.
+            clock: the wall clock function used to record when each pupil last played.
+        """
+        self._capacity = capacity
+        self._flush_every = flush_every
+        self._clock = clock
+        self._states = OrderedDict()
+        self._dirty = {}
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS levels (pupil INTEGER PRIMARY KEY, state BLOB NOT NULL, "
+                         "updated REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS levels_updated ON levels (updated)")
+
+        # Bulk load the most recent pupils, oldest first so the newest end up most recently used
+        rows = self._db.execute("SELECT pupil, state FROM levels ORDER BY updated DESC LIMIT ?", (capacity,)).fetchall()
+        for pupil, state in reversed(rows):
+            self._states[pupil] = state
+
+    def __len__(self):
+        """ Returns the number of pupils held in memory.
+
+        Returns:
+            the pupil count.
+        """
+        return len(self._states)
+
+    def get(self, pupil):
+        """ Returns the packed state of a pupil's last game, reading it from the database if it was evicted.
+
+        Args:
+            pupil: the pupil id.
+
+        Returns:
+            the packed state bytes, or None if the pupil has not played before.
+        """
+        state = self._states.get(pupil)
+        if state is not None:
+            self._states.move_to_end(pupil)
+            return state
+
+        if pupil in self._dirty:
+            state = self._dirty[pupil][0]
+        else:
+            row = self._db.execute("SELECT state FROM levels WHERE pupil = ?", (pupil,)).fetchone()
+            if row is None:
+                return None
+            state = row[0]
+        self._remember(pupil, state)
+        return state
+
+    def put(self, pupil, state):
+        """ Saves the packed state of a pupil's game. It is written to the database later.
+
+        Args:
+            pupil: the pupil id.
+            state: the packed state bytes.
+        """
+        self._remember(pupil, state)
+        self._dirty[pupil] = (state, self._clock())
+        if len(self._dirty) >= self._flush_every:
+            self.flush()
+
+    def _remember(self, pupil, state):
+        """ Holds a pupil's state in memory, evicting the least recently used pupils once the cache is full.
+        Unsaved states stay queued for writing when their pupil is evicted.
+
+        Args:
+            pupil: the pupil id.
+            state: the packed state bytes.
+        """
+        self._states[pupil] = state
+        self._states.move_to_end(pupil)
+        while len(self._states) > self._capacity:
+            self._states.popitem(last=False)
+
+    def attach(self, engine, pupil):
+        """ Carries a pupil's level into an engine which hasn't started yet, and saves
+        the engine's state when its game finishes.
+
+        A saved state which can't be read, for example one written by an older version, is logged
+        and dropped, and the pupil starts from the first level.
+
+        Args:
+            engine: the MathEngine instance.
+            pupil: the pupil id.
+        """
+        try:
+            engine.resume_level(self.get(pupil))
+        except ValueError as e:
+            _log.warning("Dropping unreadable saved level for pupil %d: %s", pupil, e)
+            self.forget(pupil)
+        engine.bind("finished", lambda summary: self.put(pupil, engine.pack()))
+
+    def forget(self, pupil):
+        """ Removes a pupil's saved state from memory and the database.
+
+        Args:
+            pupil: the pupil id.
+        """
+        self._states.pop(pupil, None)
+        self._dirty.pop(pupil, None)
+        with self._db:
+            self._db.execute("DELETE FROM levels WHERE pupil = ?", (pupil,))
+
+    def flush(self):
+        """ Writes every unsaved state to the database in one transaction. """
+        if not self._dirty:
+            return
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO levels (pupil, state, updated) VALUES (?, ?, ?)",
+                                 [(pupil, state, updated) for pupil, (state, updated) in self._dirty.items()])
+        self._dirty.clear()
+
+    def close(self):
+        """ Writes every unsaved state and closes the database. """
+        self.flush()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
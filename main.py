@@ -1,6 +1,16 @@
 __author__ = "Harry Baines"
 
-from mathengine import *
+import os
+import random
+import sys
+import time
+
+from levelcache import LevelCache
+from mathengine import MathEngine
+from prefetch import PrefetchWorker, QuestionPrefetcher
+from render import RenderBatcher
+from scheduler import QuestionScheduler
+from timerwheel import TimerWheel
 
 import tkinter as tk
 from tkinter import ttk
@@ -14,33 +24,61 @@ they wish. The game supports tailored learning and dynamically increases the lev
 for mathematical question generation.
 """
 
+# Whether the ttk styles have been configured in this process
+_styles_configured = False
+
+# Database carrying the player's level between games, and the pupil id the player is saved under
+LEVELS_PATH = os.path.join(os.path.expanduser("~"), ".maths_game_levels.db")
+DEFAULT_PUPIL = 0
+
+
+def configure_styles(font_name):
+    """ Configures the custom ttk widget styles used by every window.
+    Styles are shared by the whole process, so they are only configured once.
+
+    Args:
+        font_name: the font name used in the system.
+    """
+    global _styles_configured
+    if _styles_configured:
+        return
+
+    style = ttk.Style()
+    style.configure("Option.TButton", foreground="royal blue", font=font_name + " 20 bold", padding=(20,60,20,60))
+    style.configure(".", foreground="royal blue")
+    style.configure("Enter.TButton", font=font_name + " 18 bold", padding=(2,20,2,20))
+    style.configure("Back.TButton", font=font_name + " 14 bold", padding=5)
+    style.configure("Entry.TEntry", font=font_name + " 40 bold", padding=(2,20,2,20))
+    _styles_configured = True
+
+
 class AnswerWindow(tk.Toplevel):
 
     """ This class provides a simple implementation of an answer window
         displayed to the user and uses Toplevel on top of the master window. 
-        An instance of this class is created once the user has selected a game 
-        mode on the home screen in the HomeFrame class. """
+        A single instance of this class is created the first time the user
+        selects a game mode on the home screen in the HomeFrame class, and
+        is hidden and reused for every game mode after that. """
 
-    def __init__(self, home, master, math_key):
+    def __init__(self, home, master):
         """ Constructor to initialise a new Toplevel window.
 
         Args:
             home: the HomeFrame object reference.
             master: the master window currently displayed.
-            math_key: the key used to access relevant math mode function in the dictionary.
         """
         tk.Toplevel.__init__(self)
+        self.withdraw()
 
         # Initialise instance variables
         self._master = master
-        self._master.withdraw()
         self._home = home
         self._font_name = self._home.font_name
         self._geom_string = self._home.geom_string
         self._bg_col = "#80ff80"
-        
-        # New math engine instance for math functionality
-        self._mathengine = MathEngine(self)   
+        self._mathengine = None
+        self._timer = None
+        self._render = RenderBatcher(self)
 
         # Window details
         self.title("Maths Game")
@@ -48,37 +86,26 @@ class AnswerWindow(tk.Toplevel):
         self.configure(background=self._bg_col)
         self.geometry(self._geom_string)
         self.resizable(width=False, height=False)
-        self.bind('<Return>', lambda event: self._mathengine.check_answer())
-
-        # Widget custom styling
-        self._style = ttk.Style()
-        self._style.configure(".", foreground="royal blue")
-        self._style.configure("Enter.TButton", font=self._font_name + " 18 bold", padding=(2,20,2,20))
-        self._style.configure("Back.TButton", font=self._font_name + " 14 bold", padding=5)
-        self._style.configure("Entry.TEntry", font=self._font_name + " 40 bold", padding=(2,20,2,20))
+        self.bind('<Return>', lambda event: self.check_answer())
+        self.protocol("WM_DELETE_WINDOW", self.go_home)
 
         # Math type label
-        self._math_type_lbl = tk.Label(self, text=self._home.button_names[math_key-1], bg=self._bg_col, fg="medium blue", font=self._font_name + " 74 bold")
+        self._math_type_var = tk.StringVar()
+        self._math_type_lbl = tk.Label(self, textvariable=self._math_type_var, bg=self._bg_col, fg="medium blue", font=self._font_name + " 74 bold")
         self._math_type_lbl.grid(row=0, column=0, columnspan=4)
 
         # Info label for user
         self._info_var = tk.StringVar()
-        self._info_var.set("Answer as many as you can!")
         self._info_lbl = tk.Label(self, textvariable=self._info_var, font=self._font_name + " 26 bold", bg=self._bg_col)
         self._info_lbl.grid(row=1, column=1)
 
         # Time label for time attack mode
         self._time_var = tk.StringVar()
-        self._time_var.set("")
         self._time_lbl = tk.Label(self, textvariable=self._time_var, font=self._font_name + " 30 bold", bg=self._bg_col, fg="red")
         self._time_lbl.grid(row=2, column=1)
-        
-        # Call relevant math function to obtain the question to display
-        self._math_func = self._mathengine.math_func_dict[math_key]
-        self._question_var = tk.StringVar()
-        self._question_var.set(self._math_func())
 
         # Label for question
+        self._question_var = tk.StringVar()
         self._questionLbl = tk.Label(self, textvariable=self._question_var, bg=self._bg_col, font=self._font_name + " 88 bold")
         self._questionLbl.grid(row=3, columnspan=4, pady=5)
 
@@ -91,26 +118,89 @@ class AnswerWindow(tk.Toplevel):
         self._user_entry = tk.StringVar()
         self._entry = ttk.Entry(self, textvariable=self._user_entry, style="Entry.TEntry", width=5, justify="center", font=self._font_name + " 42 bold")
         self._entry.grid(row=5, columnspan=2)
-        self._entry.delete(0, 'end')
-        self._entry.focus()
 
         # Entry button
-        self._entryBtn = ttk.Button(self, text="ENTER", style="Enter.TButton", width=10, command=self._mathengine.check_answer)
+        self._entryBtn = ttk.Button(self, text="ENTER", style="Enter.TButton", width=10, command=self.check_answer)
         self._entryBtn.grid(row=6, columnspan=2)
 
         # Return home
         self._goHomeButton = ttk.Button(self, text="BACK", style="Back.TButton", command=self.go_home)
         self._goHomeButton.grid(row=7, columnspan=2, pady=5)
 
+    def start_game(self, math_key):
+        """ Resets this window and shows it for a new game.
+
+        Args:
+            math_key: the key used to access relevant math mode function in the dictionary.
+        """
+        self._master.withdraw()
+
+        # Reset window state from any previous game, drawn with the first question in one update
+        self._render.set(self._math_type_var, self._home.button_names[math_key-1])
+        self._render.set(self._info_var, "Answer as many as you can!")
+        self._render.set(self._time_var, "")
+        self._render.set(self._was_correct_var, "")
+        self._render.set(self._user_entry, "")
+
+        # New math engine instance for math functionality
+        # Questions are dealt without recent repeats and prefetched in the background, with
+        # both seeded from the engine's seed so the game can be replayed
+        self._mathengine = MathEngine(math_key)
+        scheduler = QuestionScheduler(rng=random.Random(self._mathengine.seed))
+        self._home.levels.attach(self._mathengine, DEFAULT_PUPIL)
+        self._mathengine.set_scheduler(scheduler)
+        self._mathengine.set_prefetcher(QuestionPrefetcher(self._home.prefetch_worker, self._mathengine.operator_keys,
+                                                           seed=self._mathengine.seed + 1,
+                                                           source=scheduler.next_question,
+                                                           discard=scheduler.requeue))
+        self._mathengine.bind("info", self._show_info)
+        self._mathengine.bind("time", self._show_time)
+        self._render.set(self._question_var, self._mathengine.start().text)
+        self._mathengine.bind("result", self._show_result)
+        self._mathengine.bind("question", self.update_top_level)
+        self._mathengine.bind("finished", self._finish)
+
+        self.geometry(self._geom_string)
+        self.deiconify()
+        self._render.focus(self._entry)
+        if self._mathengine.timer_running:
+            self._update_timer()
+
+    def check_answer(self):
+        """ Passes the user's entry to the math engine to be checked. """
+        if self._mathengine is not None and not self._mathengine.finished:
+            self._mathengine.check_answer(self.user_entry)
+
     def go_home(self):
-        """ Returns to the HomeFrame and removes this top level window. """
-        self.destroy()
+        """ Finishes the current game, which returns to the HomeFrame. """
+        if self._mathengine is not None:
+            self._mathengine.finish()
+
+    def _finish(self, summary):
+        """ Returns to the HomeFrame and hides this top level window until the next game.
+
+        Args:
+            summary: the summary string to display, or None.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._home.report_timing:
+            print("Render: " + str(self._render.stats()))
+        self.withdraw()
         self._master.geometry(self._geom_string)
         self._master.deiconify()
 
         # Displays summary if necessary
-        if self._mathengine.display_info:
-            self.display_summary("You got:\n\n" + str(self._mathengine.total_right) + " answer(s) correct.\n" + str(self._mathengine.total_wrong) + " answer(s) wrong.")
+        if summary is not None:
+            self.display_summary(summary)
+
+    def _update_timer(self):
+        """ Updates the time attack timer using the home window's shared timer wheel until the engine stops it. """
+        self._timer = None
+        delay = self._mathengine.update_timer()
+        if delay is not None:
+            self._timer = self._home.timers.call_later(delay, self._update_timer)
 
     def display_summary(self, result_str):
         """ Displays a summary pop up window with details on how the user performed.
@@ -118,14 +208,46 @@ class AnswerWindow(tk.Toplevel):
         Args:
             result_str: the result string to display.
         """
-        tk.messagebox.showinfo("Summary", result_str)
+        messagebox.showinfo("Summary", result_str)
+
+    def update_top_level(self, question):
+        """ Updates this top level window after a result has been checked and displayed.
 
-    def update_top_level(self):
-        """ Updates this top level window after a result has been checked and displayed. """
+        Args:
+            question: the next Question to display.
+        """
         self.user_entry = ""
 
-        # Get next question
-        self._question_var.set(self._math_func())
+        # Display next question
+        self._render.set(self._question_var, question.text)
+
+    def _show_result(self, result):
+        """ Displays whether the user was right or wrong.
+
+        Args:
+            result: the AnswerResult returned by the math engine.
+        """
+        self.result_str = result.message
+
+        # Clear entry and retry if the entry was invalid
+        if not result.valid:
+            self.user_entry = ""
+
+    def _show_info(self, info_str):
+        """ Displays brief info on the current game mode.
+
+        Args:
+            info_str: the info string to display.
+        """
+        self.info_var = info_str
+
+    def _show_time(self, time_str):
+        """ Displays the time remaining in the time attack game mode.
+
+        Args:
+            time_str: the time string to display.
+        """
+        self.set_time = time_str
 
     @property
     def user_entry(self):
@@ -139,12 +261,13 @@ class AnswerWindow(tk.Toplevel):
     @user_entry.setter
     def user_entry(self, entry_str):
         """ Empties the user entry box - used for validation inside the math engine.
+        The change is drawn in the next render update.
 
         Args:
             entry_str: the string to set the user entry box to.
         """
-        self._user_entry.set(entry_str)
-        self._entry.focus()
+        self._render.set(self._user_entry, entry_str)
+        self._render.focus(self._entry)
 
     @property
     def result_str(self):
@@ -162,7 +285,7 @@ class AnswerWindow(tk.Toplevel):
         Args
             result_str: the string to set the result string to.
         """
-        self._was_correct_var.set(result_str)
+        self._render.set(self._was_correct_var, result_str)
 
     @property
     def info_var(self):
@@ -180,7 +303,7 @@ class AnswerWindow(tk.Toplevel):
         Args:
             info_str: the string to set the info variable to.
         """
-        self.info_var.set(info_str)
+        self._render.set(self._info_var, info_str)
 
     @property
     def time_var(self, time_str):
@@ -198,27 +321,30 @@ class AnswerWindow(tk.Toplevel):
         Returns:
             the value currently in the string variable.
         """
-        self._time_var.set(time_str)
+        self._render.set(self._time_var, time_str)
 
 
 class HomeFrame(tk.Frame):
 
     """ This class implements a simple home window which is displayed
         to the user when the program begins. An AnswerWindow instance
-        will be created when the user selects a game mode. """
+        will be created the first time the user selects a game mode. """
 
-    def __init__(self, master):
+    def __init__(self, master, report_timing=False):
         """ Constructor to initialise a new HomeFrame window.
         This window is displayed to the user when the program starts.
 
         Args:
             master: the master window to display.
+            report_timing: True to print how long each game mode takes to open.
         """
         self._bg_col = "#80ff80"
         tk.Frame.__init__(self, master, bg=self._bg_col)
         
         # Initialise instance variables
         self._master = master
+        self._answer_win = None
+        self._report_timing = report_timing
         self._geom_string = "1200x650+200+50"
         self._font_name = "Tahoma"
         self._button_names = ["Addition", "Subtraction", "Multiplication", "Division", 
@@ -230,8 +356,7 @@ class HomeFrame(tk.Frame):
         self.pack()
         
         # Custom widget styling
-        self._style = ttk.Style()
-        self._style.configure("Option.TButton", foreground="royal blue", font=self._font_name + " 20 bold", padding=(20,60,20,60))
+        configure_styles(self._font_name)
 
         # Home window widgets
         self._titleLabel = tk.Label(self, text="Maths Game!", bg=self._bg_col, fg="medium blue", font=self._font_name + " 50 bold")
@@ -245,7 +370,7 @@ class HomeFrame(tk.Frame):
 
             # Lambda command for each button - opens answer window for given game mode
             button = ttk.Button(self, text=self._button_names[i-1], style="Option.TButton",
-                                command=lambda key=i: AnswerWindow(self, self._master, key)) 
+                                command=lambda key=i: self.open_game(key))
 
             # Button placement
             row = 3 if i > 4 else 2 
@@ -255,6 +380,34 @@ class HomeFrame(tk.Frame):
         self._name_lbl = tk.Label(self, text="2017 Harry Baines", font=self._font_name + " 14", bg=self._bg_col)
         self._name_lbl.grid(row=row+1, columnspan=len(self._button_names), pady=20)
 
+        # Shared timer wheel for time attack countdowns, driven from the Tk event loop
+        self._timers = TimerWheel()
+        self._prefetch_worker = PrefetchWorker()
+        self._advance_timers()
+
+        # The player's level is saved as soon as each game finishes
+        self._levels = LevelCache(LEVELS_PATH, flush_every=1)
+
+    def open_game(self, math_key):
+        """ Shows the answer window for a game mode, creating the window the first time.
+
+        Args:
+            math_key: the key used to access relevant math mode function in the dictionary.
+        """
+        start = time.perf_counter()
+        if self._answer_win is None:
+            self._answer_win = AnswerWindow(self, self._master)
+        self._answer_win.start_game(math_key)
+
+        if self._report_timing:
+            self.update_idletasks()
+            print("Mode switch (" + self._button_names[math_key-1] + "): " + format((time.perf_counter() - start) * 1000, ".1f") + " ms")
+
+    def _advance_timers(self):
+        """ Fires due timers on the shared timer wheel once every tick. """
+        self._timers.advance()
+        self.after(int(self._timers.tick * 1000), self._advance_timers)
+
     @property
     def geom_string(self):
         """ Accessor to obtain the string of window geometry values.
@@ -264,6 +417,42 @@ class HomeFrame(tk.Frame):
         """
         return self._geom_string
 
+    @property
+    def timers(self):
+        """ Accessor to obtain the timer wheel shared by all answer windows.
+
+        Returns:
+            the TimerWheel instance.
+        """
+        return self._timers
+
+    @property
+    def report_timing(self):
+        """ Accessor to obtain whether timings should be printed.
+
+        Returns:
+            True if timings are printed.
+        """
+        return self._report_timing
+
+    @property
+    def levels(self):
+        """ Accessor to obtain the cache carrying the player's level between games.
+
+        Returns:
+            the LevelCache instance.
+        """
+        return self._levels
+
+    @property
+    def prefetch_worker(self):
+        """ Accessor to obtain the worker which prefetches questions for the answer window.
+
+        Returns:
+            the PrefetchWorker instance.
+        """
+        return self._prefetch_worker
+
     @property
     def font_name(self):
         """ Accessor to obtain the font name being used in the system.
@@ -283,11 +472,19 @@ class HomeFrame(tk.Frame):
         return self._button_names
 
 
-# Main function to create a new HomeFrame instance
+# Main function to create a new HomeFrame instance - pass --timing to print startup, mode switch and render times
 def main():
+    start = time.perf_counter()
+    report_timing = "--timing" in sys.argv[1:]
     root = tk.Tk()
-    game = HomeFrame(root)
-    root.mainloop()
+    game = HomeFrame(root, report_timing)
+    if report_timing:
+        root.update_idletasks()
+        print("Startup: " + format((time.perf_counter() - start) * 1000, ".1f") + " ms")
+    try:
+        root.mainloop()
+    finally:
+        game.levels.close()
 
 # Program entry point
 if __name__ == "__main__":
@@ -1,50 +1,386 @@
 __author__ = "Harry Baines"
 
+import math
+import os
 import random
+import struct
 import time
+from collections import namedtuple
+
+from difficulty import STREAK_MODEL
+from operators import Expression, basic_keys, expression_keys, get_operator
 
 """ This module provides an engine which implements simple mathamatics aimed at 5-7 year olds.
-Once the user has selected a mathematical game mode to play, an AnswerWindow will be displayed 
-to the user and they can input their entry. The user can go back and select another game mode if 
-they wish. The game supports tailored learning and dynamically increases the level
+The engine holds no UI state - once the user has selected a mathematical game mode to play,
+a window such as AnswerWindow passes each entry to the engine and displays the results it
+returns. The user can go back and select another game mode if they wish. The game supports tailored learning and dynamically increases the level
 for mathematical question generation.
 """
 
+# Profiler recording engine timings, or None while instrumentation is switched off
+_profiler = None
+
+
+def set_profiler(profiler):
+    """ Switches timing instrumentation on or off for every engine.
+
+    Args:
+        profiler: the instrumentation.Profiler to record timings to, or None to switch off.
+    """
+    global _profiler
+    _profiler = profiler
+
+
+def get_profiler():
+    """ Returns the profiler currently recording engine timings.
+
+    Returns:
+        the instrumentation.Profiler, or None if instrumentation is switched off.
+    """
+    return _profiler
+
+
+# Binary layout of a packed engine snapshot: version, mode, flags, min bound, max bound, max level,
+# streak counters, totals, time remaining (NaN if none), then the current question's operator and operands
+_PACKED = struct.Struct("<BBBIIIHHIIdBqqq")
+_PACKED_VERSION = 1
+
+# Flag bits of a packed snapshot
+_CORRECT, _BEGUN_TIME_ATTACK, _BEGUN_UNLIMITED, _TIMED_OUT, _FINISHED = 1, 2, 4, 8, 16
+
+# Mask keeping random number generator state to 64 bits
+_MASK64 = (1 << 64) - 1
+
+
+class SessionRandom(object):
+
+    """ This class provides a small random number generator for one game, using
+        the SplitMix64 algorithm. Its whole state is a single integer, so every
+        engine can own one in little memory and a game can be replayed from its seed.
+        Draws are somewhat slower than random.Random's, as they run in Python. """
+
+    __slots__ = ("_state",)
+
+    def __init__(self, seed):
+        """ Constructor to initialise a new SessionRandom instance.
+
+        Args:
+            seed: the integer seed.
+        """
+        self._state = seed & _MASK64
+
+    def next64(self):
+        """ Returns the next random 64-bit integer.
+
+        Returns:
+            the random integer.
+        """
+        self._state = z = (self._state + 0x9E3779B97F4A7C15) & _MASK64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+        return z ^ (z >> 31)
+
+    def randrange(self, start, stop=None):
+        """ Returns a random integer from a range. The range is mapped onto 64 random bits,
+        so the bias for any range a game uses is far too small to measure.
+
+        Args:
+            start: the start of the range, or its stop if no stop is given.
+            stop: the end of the range (exclusive), or None.
+
+        Returns:
+            the random integer.
+        """
+        if stop is None:
+            start, stop = 0, start
+        return start + ((self.next64() * (stop - start)) >> 64)
+
+    def randint(self, a, b):
+        """ Returns a random integer between a and b inclusive.
+
+        Args:
+            a: the smallest value.
+            b: the largest value.
+
+        Returns:
+            the random integer.
+        """
+        return a + ((self.next64() * (b - a + 1)) >> 64)
+
+    def choice(self, seq):
+        """ Returns a random item from a non-empty sequence.
+
+        Args:
+            seq: the sequence.
+
+        Returns:
+            the chosen item.
+        """
+        return seq[(self.next64() * len(seq)) >> 64]
+
+
+# The outcome of checking an entry, along with the question to display next
+AnswerResult = namedtuple("AnswerResult", ["valid", "correct", "message", "question", "next_question", "game_over",
+                                           "given", "latency", "level"])
+
+
+def make_question(operator, left, right):
+    """ Builds a question from an operator and its operands, calculating its answer.
+
+    Args:
+        operator: the key of a registered operator, for example 1-4.
+        left: the left operand.
+        right: the right operand.
+
+    Returns:
+        the Question.
+    """
+    return get_operator(operator).make(left, right)
+
+
+def parse_entry(entry):
+    """ Parses a user entry as a whole number without raising exceptions, so bursts of bad
+    input cost no more than good input. Spaces are ignored and a leading sign is allowed.
+
+    Args:
+        entry: the entry string, or an int already parsed by the caller.
+
+    Returns:
+        the int value, or None if the entry is not a whole number.
+    """
+    if type(entry) is int:
+        return entry
+    if not isinstance(entry, str):
+        return None
+    if entry.isdigit() and entry.isascii() and len(entry) < 4300:
+        return int(entry)
+    text = entry.replace(" ", "").strip()
+    digits = text[1:] if text[:1] in ("+", "-") else text
+    if digits.isdigit() and digits.isascii() and len(digits) < 4300:
+        return int(text)
+    return None
+
+
+def _message(correct, answer):
+    """ Returns the message shown after an answer is checked.
+
+    Args:
+        correct: True if the answer was correct.
+        answer: the correct answer.
+
+    Returns:
+        the message string.
+    """
+    if correct:
+        return "That is correct, well done! (Press BACK to stop)"
+    return "Not right, the correct answer is: " + str(answer) + " (Press BACK to stop)"
+
+
+def generate_question(operator, min_bound, max_bound, rng=random):
+    """ Generates a question for an operator at the given level without touching any engine state.
+    Subtraction never gives a negative answer and division always gives a whole number.
+    Operands are generated constructively, so the cost is the same at any level.
+
+    Args:
+        operator: the key of a registered operator or expression template.
+        min_bound: the minimum operand value for the level.
+        max_bound: the maximum operand value for the level.
+        rng: the random number generator to draw operands from.
+
+    Returns:
+        the generated Question.
+    """
+    return get_operator(operator).generate(min_bound, max_bound, rng)
+
+
 class MathEngine(object):
 
     """ This class provides methods for each mathematical game mode that a user
         could select. Values are randomly generated for the operands in the
-        equation. This class can send and receive data from the relevant
-        'entry_win' window to update UI changes depending on current state. """
-
-    def __init__(self, entry_win):
+        equation. The engine has no UI of its own - answers are passed in and
+        results are returned, and any window can bind callbacks to the
+        'info', 'time', 'question', 'result' and 'finished' events to
+        update UI changes depending on current state. Session state is held in
+        slots and the function dictionary is shared by every instance, keeping
+        each engine small when many sessions are hosted at once. """
+
+    __slots__ = ("_math_key", "_clock", "_seed", "_rng", "_listeners", "_min_bound", "_max_bound",
+                 "_consec_right", "_consec_wrong", "_total_right", "_total_wrong", "_correct",
+                 "_answer", "_question", "_asked_at", "_begun_time_attack", "_begun_unlimited",
+                 "_end_time", "_timed_out", "_finished", "_prefetcher", "_scheduler",
+                 "_difficulty", "_sheet", "_issued", "_max_level")
+
+    # Math variables shared by every player
+    _start_min = 1
+    _start_max = 4
+    _start_time = 15
+
+    # Most answer sheet questions which can be outstanding at once, keeping each session's memory bounded
+    _max_sheet = 100
+
+    def __init__(self, math_key, clock=time.monotonic, seed=None, max_level=10):
         """  Constructor to initialise a new MathEngine instance.
 
         Args:
-            entry_win: the window instance reference to make UI changes.
+            math_key: the key used to access relevant math mode function in the dictionary.
+            clock: the monotonic clock function used to time the time attack game mode.
+            seed: the seed for this engine's random number generator, or None for a random seed.
+            max_level: the highest maximum bound the level can reach, for example 100 for two-digit operands.
         """
 
-        # Source instance of user entry
-        self._entry_win = entry_win
+        # Selected game mode and callbacks bound to engine events
+        self._math_key = math_key
+        self._clock = clock
+
+        # Each engine owns its random number generator, so a game can be replayed from its seed
+        self._seed = int.from_bytes(os.urandom(8), "big") if seed is None else seed
+        self._rng = SessionRandom(self._seed)
+        self._listeners = None
 
         # Math variables to monitor player
-        self._start_min = 1
-        self._start_max = 4
-        self._max_level = 10
+        self._max_level = max_level
         self._min_bound = self._start_min
         self._max_bound = self._start_max
 
         self._consec_right = self._consec_wrong = 0
         self._total_right = self._total_wrong = 0
         self._correct = True
+        self._answer = None
+        self._question = None
+        self._asked_at = None
 
         self._begun_time_attack = False
         self._begun_unlimited = False
-        self._start_time = 15
+        self._end_time = None
+        self._timed_out = False
+        self._finished = False
+        self._prefetcher = None
+        self._scheduler = None
+        self._difficulty = STREAK_MODEL
+        self._sheet = None
+        self._issued = 0
+
+    def bind(self, event, callback):
+        """ Registers a callback to be called whenever the given engine event occurs.
+
+        Args:
+            event: the event name - 'info', 'time', 'question', 'result' or 'finished'.
+            callback: the function to call with the event value.
+        """
+        if self._listeners is None:
+            self._listeners = {}
+        self._listeners.setdefault(event, []).append(callback)
+
+    def _emit(self, event, value):
+        """ Calls every callback bound to the given event.
+
+        Args:
+            event: the event name.
+            value: the value to pass to each callback.
+        """
+        if self._listeners is not None:
+            for callback in self._listeners.get(event, ()):
+                callback(value)
+
+    def start(self):
+        """ Begins the selected game mode and returns the first question.
+
+        Returns:
+            the first Question to display.
+        """
+        return self.next_question()
+
+    def next_question(self):
+        """ Generates the next question for the selected game mode.
+
+        Returns:
+            the next Question to display.
+        """
+        self._generate()
+        self._emit("question", self._question)
+        return self._question
+
+    def _generate(self):
+        """ Generates the next question for the selected game mode, timing the
+        generator if instrumentation is switched on. Questions taken from a prefetcher
+        are timed as prefetch.get, as the prefetcher times their generation itself.
+        """
+        profiler = _profiler
+        if profiler is None:
+            self._next()
+        else:
+            prefetched = self._prefetcher is not None and self._question is not None
+            start = time.perf_counter()
+            self._next()
+            if prefetched:
+                profiler.record("prefetch.get", time.perf_counter() - start)
+            elif self._question is not None:
+                profiler.record("generate." + get_operator(self._question.operator).name, time.perf_counter() - start)
+
+    def _next(self):
+        """ Makes the next question current, taking it from the prefetcher once the game has begun. """
+        if self._prefetcher is not None and self._question is not None:
+            self._ask(self._prefetcher.get())
+        else:
+            self._math_funcs[self._math_key](self)
 
-        # Dictionary of function names
-        self._math_func_dict = {1: self.get_add_question, 2: self.get_sub_question, 3: self.get_mult_question, 4: self.get_div_question, 
-                                5: self.get_rand_operator, 6: self.time_attack, 7: self.unlimited_mode, 8: quit}
+    def set_prefetcher(self, prefetcher):
+        """ Takes upcoming questions from a prefetcher instead of generating them when asked.
+        The prefetcher is told whenever the level changes, and is closed when the game finishes.
+
+        Args:
+            prefetcher: the prefetch.QuestionPrefetcher drawing from this engine's operator_keys, or None.
+        """
+        self._prefetcher = prefetcher
+        if prefetcher is not None:
+            prefetcher.invalidate(self._min_bound, self._max_bound)
+
+    def set_scheduler(self, scheduler):
+        """ Chooses questions with a scheduler instead of drawing operands independently each time.
+        The scheduler is told the result of every answer so wrong answers can be reviewed.
+
+        Args:
+            scheduler: the scheduler.QuestionScheduler to use, or None.
+        """
+        self._scheduler = scheduler
+
+    def set_difficulty(self, model):
+        """ Adapts the game with a difficulty model instead of the original streak rule.
+        The model is told the result of every answer and chooses the operator in the mixed modes.
+        Questions taken from a prefetcher keep the prefetcher's own operator mix. Set the model
+        before resuming a level, so the model starts from the resumed level too.
+
+        Args:
+            model: the difficulty.DifficultyModel to use, or None for the streak rule.
+        """
+        self._difficulty = STREAK_MODEL if model is None else model
+
+    def _draw(self, operator):
+        """ Draws a question for an operator at the current level.
+
+        Args:
+            operator: the key of a registered operator or expression template.
+
+        Returns:
+            the drawn Question.
+        """
+        if self._scheduler is not None:
+            return self._scheduler.next_question(operator, self._min_bound, self._max_bound)
+        return generate_question(operator, self._min_bound, self._max_bound, self._rng)
+
+    def _ask(self, question):
+        """ Makes a question the current question and starts timing the answer.
+
+        Args:
+            question: the Question to ask.
+
+        Returns:
+            the question string.
+        """
+        self._question = question
+        self._answer = question.answer
+        self._asked_at = self._clock()
+        return question.text
 
     def get_add_question(self):
         """ Returns a mathematical question string based on addition.
@@ -52,29 +388,16 @@ class MathEngine(object):
         Returns:
             the addition question string.
         """
-        operands = self.get_operands()
-        self._answer = operands[0] + operands[1]
-        question = str(operands[0]) + " + " + str(operands[1]) + " = ?"
-        return question
+        return self._ask(self._draw(1))
 
     def get_sub_question(self):
         """ Returns a mathematical question string based on subtraction.
-        If the calculated result is negative, the operands are flipped.
+        Operands are drawn from the level's non-negative subtraction pairs.
 
         Returns:
             the subtraction question string.
         """
-        operands = self.get_operands()
-
-        # Flips operands if answer is -ve
-        if operands[0] - operands[1] < 0:
-            temp = operands[0]
-            operands[0] = operands[1]
-            operands[1] = temp
-
-        self._answer = operands[0] - operands[1]
-        question = str(operands[0]) + " - " + str(operands[1]) + " = ?"
-        return question
+        return self._ask(self._draw(2))
 
     def get_mult_question(self):
         """ Returns a mathematical question string based on multiplication.
@@ -82,40 +405,38 @@ class MathEngine(object):
         Returns:
             the multiplication question string.
         """
-        operands = self.get_operands()
-        self._answer = operands[0] * operands[1]
-        question = str(operands[0]) + " x " + str(operands[1]) + " = ?"
-        return question
+        return self._ask(self._draw(3))
 
     def get_div_question(self):
         """ Returns a mathematical question string based on division.
-        If the calculated result is a decimal, the operands are re-calculated.
+        Operands are drawn from the level's pairs which divide to a whole number.
 
         Returns:
             the division question string.
         """
-        while True:
-            operands = self.get_operands()
-            result = operands[0] / operands[1]
-            if result == int(result):
-                break
+        return self._ask(self._draw(4))
 
-        self._answer = operands[0] / operands[1]
-        question = str(operands[0]) + " / " + str(operands[1]) + " = ?"
-        return question
+    def get_expression_question(self):
+        """ Returns a question string based on a random three-operand expression, such as
+        a + b x c, which is answered using the order of operations.
+
+        Returns:
+            the expression question string.
+        """
+        return self._ask(self._draw(self._rng.choice(expression_keys())))
 
     def time_attack(self):
         """ Returns a question string based on a random mathematical operator (+, -, *, /).
         Random questions are generated within the maximum time specified (e.g. 15 seconds).
+        The timer starts here, and the caller then calls update_timer to display the time remaining.
 
         Returns:
             the random mathematical operator question string.
         """
         if not self._begun_time_attack:
-            self._sec = self._start_time
-            self._entry_win.info_var = "Random sums in 15 seconds!"
+            self._end_time = self._clock() + self._start_time
+            self._emit("info", "Random sums in 15 seconds!")
             self._begun_time_attack = True
-            self.update_timer()
 
         return self.get_rand_operator()
 
@@ -127,7 +448,7 @@ class MathEngine(object):
             the random mathematical operator question string.
         """
         if not self._begun_unlimited:
-            self._entry_win.info_var = "Get one wrong, you lose!"
+            self._emit("info", "Get one wrong, you lose!")
             self._begun_unlimited = True
 
         # Ask next question if correct
@@ -135,14 +456,14 @@ class MathEngine(object):
             return self.get_rand_operator()
 
     def get_rand_operator(self):
-        """ Returns a question string based on a random mathematical operator (+, -, *, /).
+        """ Returns a question string based on a random registered operator, such as +, -, x or /.
         This method is used in the random sums, time attack and unlimited game modes.
 
         Returns:
-            the random mathematical operator question string after calling relevant math operator method.
+            the random mathematical operator question string.
         """
-        rand_operator = random.randint(1,4)
-        return self._math_func_dict[rand_operator]()
+        rand_operator = self._difficulty.choose_operator(self, basic_keys())
+        return self._ask(self._draw(rand_operator))
 
     def get_operands(self):
         """ Returns a list of 2 new randomly generated operands for use in the next mathematical equation.
@@ -158,79 +479,261 @@ class MathEngine(object):
         Returns:
             the new randomly generated operand.
         """
-        return random.randint(self._min_bound, self._max_bound)
+        return self._rng.randint(self._min_bound, self._max_bound)
 
     def update_timer(self):
-        """ Updates the timer by 1 second and is used in the time attack game mode.
+        """ Updates the time remaining and is used in the time attack game mode.
+        Time is measured from the monotonic clock, so a late call still shows the right time.
+
+        Returns:
+            the number of seconds until the timer next needs updating,
+            or None if the time is up or the game has finished.
         """
-        self._entry_win.set_time = "Time: " + str(self._sec)
-        self._sec -= 1
-        self._entry_win.after(1000, self.update_timer)
+        if self._finished:
+            return None
 
-        # Return home if finished and reset relevant variables
-        if self._sec == -1:
-            self._entry_win.go_home()
-            self._sec = self._start_time
-            if self._total_right != 0:
-                self._entry_win.display_summary("You got " + str(self._total_right) + " answer(s) correct in " + str(self._start_time) + " seconds!")
+        remaining = self._end_time - self._clock()
+        self._emit("time", "Time: " + str(max(0, math.ceil(remaining))))
 
-    def check_answer(self):
+        # Finish the game once time is up
+        if remaining <= 0:
+            self._timed_out = True
+            self.finish()
+            return None
+        return remaining - math.floor(remaining) or 1.0
+
+    def check_answer(self, entry):
         """ Checks the user entry against a pre-calculated answer from the randomly generated operands.
+        Invalid entries are reported in the result rather than raised.
 
-        Raises:
-            ValueError: if the entry is not a whole number.
+        Args:
+            entry: the user's entry string.
+
+        Returns:
+            the AnswerResult for the entry.
         """
-        entry = self._entry_win.user_entry
-        try:
-            # User gets question right if entry is whole number
-            if int(entry) == self._answer:
-                self._correct = True
-                self._entry_win.result_str = "That is correct, well done! (Press BACK to stop)"
+        question = self._question
+        profiler = _profiler
+        if profiler is not None:
+            start = time.perf_counter()
 
-            # User gets question wrong
-            else:
-                self._correct = False
-                self._entry_win.result_str = "Not right, the correct answer is: " + str(int(self._answer)) + " (Press BACK to stop)"
+        # Answers can't be given once the game has finished or time is up
+        if self.timer_running and self._clock() >= self._end_time:
+            self.update_timer()
+        if self._finished:
+            result = AnswerResult(False, False, "The game has finished!", question, None, True, None, None, self._max_bound)
+            self._emit("result", result)
+            return result
+
+        # User gets question right if entry is whole number
+        value = parse_entry(entry)
+        if value is None:
+            # Inform user of invalid input - the same question is asked again
+            result = AnswerResult(False, False, "Not right, enter a whole number! (Press BACK to stop)", question, question, False,
+                                  None, None, self._max_bound)
+            self._emit("result", result)
+            return result
+
+        latency = self._clock() - self._asked_at
+        level = self._max_bound
+        self._correct = value == self._answer
+        message = _message(self._correct, self._answer)
+
+        if self._scheduler is not None:
+            self._scheduler.record(question, self._correct)
+        self.monitor_level()
 
-            self.monitor_level()
+        # Go home or carry on depending on selected game mode
+        game_over = not self._correct and self._begun_unlimited
+        next_question = None
+        if not game_over:
+            self._generate()
+            next_question = self._question
+
+        result = AnswerResult(True, self._correct, message, question, next_question, game_over, value, latency, level)
+        self._emit("result", result)
+        if game_over:
+            self.finish()
+        else:
+            self._emit("question", next_question)
 
-        except ValueError:
-        	# Inform user of invalid input - clear entry and retry
-            self._entry_win.result_str = "Not right, enter a whole number! (Press BACK to stop)"
-            self._entry_win.user_entry = ""
+        if profiler is not None:
+            profiler.record("answer_latency", latency)
+            profiler.record("check_answer", time.perf_counter() - start)
+        return result
 
     def monitor_level(self):
-        """ Monitors the current level the user is on.
-        Answering 3 questions correctly in a row increases the maximum bound for random number generation.
-        Answering 3 questions incorrectly in a row decreases the maximum bound for random number generation.
-        Max level = 1-10, min level = 1-4
+        """ Monitors the current level the user is on, passing the result of the last
+        answer to the difficulty model. By default answering 3 questions correctly in a row
+        increases the maximum bound for random number generation, and answering 3 questions
+        incorrectly in a row decreases it.
         """
 
-        # Update consecutive and total variables
+        bounds = (self._min_bound, self._max_bound)
+
+        # Update total variables and let the difficulty model adjust the level
         if self._correct:
-            self._consec_right += 1
-            self._consec_wrong = 0
             self._total_right += 1
-
-            # Dynamically increase level
-            if (self._consec_right == 3) and (self._max_bound != self._max_level):
-                self._max_bound += 1
-                self._consec_right = 0
         else:
-            self._consec_wrong += 1
-            self._consec_right = 0
             self._total_wrong += 1
-            
-            # Dynamically decrease level
-            if (self._consec_wrong == 3) and (self._max_bound != self._start_max):
-                self._max_bound -= 1
-                self._consec_wrong = 0
+        self._difficulty.update(self, self._question.operator, self._correct)
 
-        # Go home or carry on depending on selected game mode
-        if (not self._correct and self._begun_unlimited):
-            self._entry_win.go_home()
-        else:
-            self._entry_win.update_top_level()
+        # Buffered questions are for the old level once it changes
+        if self._prefetcher is not None and bounds != (self._min_bound, self._max_bound):
+            self._prefetcher.invalidate(self._min_bound, self._max_bound)
+
+    def issue_sheet(self, count, limit=None):
+        """ Issues an answer sheet of questions at the current level, to be graded with grade_batch.
+        Questions stay on the sheet until they are answered with a whole number, and no more than
+        the limit can be outstanding at once.
+
+        Args:
+            count: the number of questions.
+            limit: the most questions which can be outstanding, or None for the engine's default.
+
+        Returns:
+            the list of (question id, Question) tuples.
+
+        Raises:
+            ValueError: if the count is negative or would take the outstanding questions over the limit.
+        """
+        if self._sheet is None:
+            self._sheet = {}
+        limit = self._max_sheet if limit is None else limit
+        if count < 0 or len(self._sheet) + count > limit:
+            raise ValueError("Too many questions outstanding - at most " + str(limit) + " can be issued")
+        operators = self.operator_keys
+        issued_at = self._clock()
+        questions = []
+        for i in range(count):
+            operator = operators[0] if len(operators) == 1 else self._difficulty.choose_operator(self, operators)
+            self._issued += 1
+            question = self._draw(operator)
+            self._sheet[self._issued] = (question, issued_at)
+            questions.append((self._issued, question))
+        return questions
+
+    def grade_batch(self, answers):
+        """ Grades a batch of answers to questions on the answer sheet in one call. Entries are
+        validated without raising exceptions, and the level is updated once for the whole batch,
+        so bursts of submissions cost little more than a single answer each.
+        A wrong answer in unlimited mode ends the game, and later answers in the batch are rejected.
+
+        Args:
+            answers: the list of (question id, entry) pairs, where each entry is a string or an int.
+
+        Returns:
+            the list of AnswerResult tuples, one for each pair in order.
+        """
+        profiler = _profiler
+        if profiler is not None:
+            start = time.perf_counter()
+        if self.timer_running and self._clock() >= self._end_time:
+            self.update_timer()
+
+        sheet = self._sheet or {}
+        now = self._clock()
+        level = self._max_bound
+        results = []
+        graded = []
+        for question_id, entry in answers:
+            if self._finished or (graded and not graded[-1][1] and self._begun_unlimited):
+                results.append(AnswerResult(False, False, "The game has finished!", None, None, True, None, None, level))
+                continue
+            issued = sheet.get(question_id) if type(question_id) is int else None
+            if issued is None:
+                results.append(AnswerResult(False, False, "Unknown question!", None, None, False, None, None, level))
+                continue
+            question = issued[0]
+            value = parse_entry(entry)
+            if value is None:
+                results.append(AnswerResult(False, False, "Not right, enter a whole number! (Press BACK to stop)", question,
+                                            question, False, None, None, level))
+                continue
+
+            del sheet[question_id]
+            correct = value == question.answer
+            game_over = not correct and self._begun_unlimited
+            graded.append((question, correct))
+            results.append(AnswerResult(True, correct, _message(correct, question.answer), question, None, game_over,
+                                        value, now - issued[1], level))
+
+        if graded:
+            self.monitor_batch(graded)
+        for result in results:
+            self._emit("result", result)
+        if graded and not graded[-1][1] and self._begun_unlimited:
+            self.finish()
+
+        if profiler is not None:
+            profiler.record("grade_batch", time.perf_counter() - start)
+        return results
+
+    def monitor_batch(self, graded):
+        """ Monitors the level for a batch of graded answers, passing each result to the
+        scheduler and difficulty model in order but checking for a change of level once.
+
+        Args:
+            graded: the list of (Question, correct) tuples in the order they were answered.
+        """
+        bounds = (self._min_bound, self._max_bound)
+        scheduler = self._scheduler
+        update = self._difficulty.update
+        for question, correct in graded:
+            if scheduler is not None:
+                scheduler.record(question, correct)
+            update(self, question.operator, correct)
+
+        right = sum(1 for question, correct in graded if correct)
+        self._total_right += right
+        self._total_wrong += len(graded) - right
+        self._correct = graded[-1][1]
+
+        # Buffered questions are for the old level once it changes
+        if self._prefetcher is not None and bounds != (self._min_bound, self._max_bound):
+            self._prefetcher.invalidate(self._min_bound, self._max_bound)
+
+    def finish(self):
+        """ Finishes the current game, passing any summary to the 'finished' callbacks.
+        Calling this method more than once has no further effect.
+        """
+        if self._finished:
+            return
+        self._finished = True
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+        self._emit("finished", self.summary())
+
+    def summary(self):
+        """ Returns a summary of how the user performed in the current game.
+
+        Returns:
+            the summary string, or None if there is nothing to display.
+        """
+        if self._begun_time_attack:
+            if self._timed_out and self._total_right != 0:
+                return "You got " + str(self._total_right) + " answer(s) correct in " + str(self._start_time) + " seconds!"
+            return None
+
+        if self.display_info:
+            return "You got:\n\n" + str(self._total_right) + " answer(s) correct.\n" + str(self._total_wrong) + " answer(s) wrong."
+        return None
+
+    @property
+    def score(self):
+        """ Returns the score of a finished time attack or unlimited mode game, for leaderboards.
+        A time attack game only scores if it ran until time was up.
+
+        Returns:
+            the number of answers correct, or None if the game has no score.
+        """
+        if not self._finished:
+            return None
+        if self._begun_time_attack:
+            return self._total_right if self._timed_out else None
+        if self._begun_unlimited:
+            return self._total_right
+        return None
 
     @property
     def display_info(self):
@@ -244,6 +747,65 @@ class MathEngine(object):
             return True
         return False
 
+    @property
+    def timer_running(self):
+        """ Determines if the time attack timer needs updating every second.
+
+        Returns:
+            True if the timer is running.
+            False if there is no timer or the game has finished.
+        """
+        return self._begun_time_attack and not self._finished
+
+    @property
+    def finished(self):
+        """ Returns whether the current game has finished.
+
+        Returns:
+            True if the game has finished.
+        """
+        return self._finished
+
+    @property
+    def operator_keys(self):
+        """ Returns the operator keys questions in the selected game mode are drawn from.
+
+        Returns:
+            the tuple of operator keys.
+        """
+        if self._math_key in basic_keys():
+            return (self._math_key,)
+        if self._math_key == 9:
+            return expression_keys()
+        return basic_keys()
+
+    @property
+    def seed(self):
+        """ Returns the seed of this engine's random number generator.
+
+        Returns:
+            the seed.
+        """
+        return self._seed
+
+    @property
+    def math_key(self):
+        """ Returns the key of the selected game mode.
+
+        Returns:
+            the game mode key.
+        """
+        return self._math_key
+
+    @property
+    def question(self):
+        """ Returns the question currently being asked.
+
+        Returns:
+            the current Question.
+        """
+        return self._question
+
     @property
     def total_right(self):
         """ Returns the total number of questions answered correctly by the user.
@@ -269,4 +831,125 @@ class MathEngine(object):
         Returns:
             the dictionary of mathametical functions.
         """
-        return self._math_func_dict
+        return {key: func.__get__(self) for key, func in self._math_funcs.items()}
+
+    def _quit(self):
+        """ Quits the program. """
+        quit()
+
+    def snapshot(self):
+        """ Returns a snapshot of this engine's state which can be stored and restored later.
+        Bound callbacks and the random number generator are not included in the snapshot.
+
+        Returns:
+            the tuple of state values.
+        """
+        remaining = None if self._end_time is None else self._end_time - self._clock()
+        return (self._math_key, self._min_bound, self._max_bound, self._consec_right, self._consec_wrong,
+                self._total_right, self._total_wrong, self._correct, self._answer, self._question,
+                self._begun_time_attack, self._begun_unlimited, remaining, self._timed_out, self._finished,
+                self._max_level)
+
+    @classmethod
+    def restore(cls, state, clock=time.monotonic):
+        """ Creates a new engine from a snapshot of another engine's state.
+
+        Args:
+            state: the tuple of state values returned by snapshot.
+            clock: the monotonic clock function used to time the time attack game mode.
+
+        Returns:
+            the restored MathEngine instance.
+        """
+        engine = cls(state[0], clock)
+        (engine._min_bound, engine._max_bound, engine._consec_right, engine._consec_wrong,
+         engine._total_right, engine._total_wrong, engine._correct, engine._answer, engine._question,
+         engine._begun_time_attack, engine._begun_unlimited, remaining, engine._timed_out, engine._finished,
+         engine._max_level) = state[1:]
+        if remaining is not None:
+            engine._end_time = clock() + remaining
+        if engine._question is not None:
+            engine._asked_at = clock()
+        return engine
+
+    def pack(self):
+        """ Returns a compact binary snapshot of this engine's state, for storing on disk.
+        Like snapshot, bound callbacks and the random number generator are not included.
+
+        Returns:
+            the packed snapshot bytes.
+        """
+        remaining = math.nan if self._end_time is None else self._end_time - self._clock()
+        flags = ((self._correct and _CORRECT) | (self._begun_time_attack and _BEGUN_TIME_ATTACK) |
+                 (self._begun_unlimited and _BEGUN_UNLIMITED) | (self._timed_out and _TIMED_OUT) |
+                 (self._finished and _FINISHED))
+        question = self._question
+        if question is None:
+            operator, operands = 0, (0, 0, 0)
+        else:
+            operator, operands = question.operator, question.operands or (question.left, question.right, 0)
+        return _PACKED.pack(_PACKED_VERSION, self._math_key, flags, self._min_bound, self._max_bound, self._max_level,
+                            min(self._consec_right, 65535), min(self._consec_wrong, 65535), self._total_right,
+                            self._total_wrong, remaining, operator, *operands)
+
+    @classmethod
+    def unpack(cls, data, clock=time.monotonic):
+        """ Creates a new engine from a packed snapshot of another engine's state.
+
+        Args:
+            data: the bytes returned by pack.
+            clock: the monotonic clock function used to time the time attack game mode.
+
+        Returns:
+            the restored MathEngine instance.
+
+        Raises:
+            ValueError: if the data is not a packed snapshot.
+        """
+        if len(data) != _PACKED.size or data[0] != _PACKED_VERSION:
+            raise ValueError("Not a packed engine snapshot")
+        (version, math_key, flags, min_bound, max_bound, max_level, consec_right, consec_wrong, total_right,
+         total_wrong, remaining, operator, a, b, c) = _PACKED.unpack(data)
+
+        engine = cls(math_key, clock, max_level=max_level)
+        engine._min_bound, engine._max_bound = min_bound, max_bound
+        engine._consec_right, engine._consec_wrong = consec_right, consec_wrong
+        engine._total_right, engine._total_wrong = total_right, total_wrong
+        engine._correct = bool(flags & _CORRECT)
+        engine._begun_time_attack = bool(flags & _BEGUN_TIME_ATTACK)
+        engine._begun_unlimited = bool(flags & _BEGUN_UNLIMITED)
+        engine._timed_out = bool(flags & _TIMED_OUT)
+        engine._finished = bool(flags & _FINISHED)
+        if not math.isnan(remaining):
+            engine._end_time = clock() + remaining
+        if operator:
+            entry = get_operator(operator)
+            engine._ask(entry.make((a, b, c)) if isinstance(entry, Expression) else entry.make(a, b))
+        return engine
+
+    def resume_level(self, data):
+        """ Carries a pupil's level over from a packed snapshot of an earlier game, before this game starts.
+        The bounds and streak counters are kept, limited to this engine's levels, while the totals start again.
+        The difficulty model is told, so its own levels start from the resumed bounds.
+
+        Args:
+            data: the bytes returned by pack, or None to keep the starting level.
+
+        Raises:
+            ValueError: if the data is not a packed snapshot.
+        """
+        if data is None:
+            return
+        if len(data) != _PACKED.size or data[0] != _PACKED_VERSION:
+            raise ValueError("Not a packed engine snapshot")
+        min_bound, max_bound, max_level, consec_right, consec_wrong = _PACKED.unpack(data)[3:8]
+        self._max_bound = min(max(max_bound, self._start_max), self._max_level)
+        self._min_bound = min(max(min_bound, self._start_min), self._max_bound)
+        self._consec_right, self._consec_wrong = consec_right, consec_wrong
+        self._difficulty.resume(self)
+        if self._prefetcher is not None:
+            self._prefetcher.invalidate(self._min_bound, self._max_bound)
+
+    # Dictionary of function names, shared by every instance
+    _math_funcs = {1: get_add_question, 2: get_sub_question, 3: get_mult_question, 4: get_div_question,
+                   5: get_rand_operator, 6: time_attack, 7: unlimited_mode, 8: _quit, 9: get_expression_question}
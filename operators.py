@@ -0,0 +1,387 @@
+__author__ = "Harry Baines"
+
+from collections import namedtuple
+
+""" This module provides the registry of operators and expression templates questions are built
+from. Each entry declares how its operands are generated, the constraints they meet and how its
+answer is calculated. Operands are generated constructively - subtraction orders its pair and
+division multiplies a divisor by a quotient - so every question costs O(1) however large the
+number range, with no retries. Templates combine two operators into three-operand expressions,
+answered using the order of operations:
+
+    register(Expression(19, "add_div_add", (1, 4), False, my_operands))
+"""
+
+# A generated question and its pre-calculated answer. Expressions also keep all of their
+# operands, with left and right holding the first and last
+Question = namedtuple("Question", ["operator", "left", "right", "answer", "text", "operands"], defaults=(None,))
+
+# Cache of valid operand pair tables, keyed by (operator, min bound, max bound)
+_pair_tables = {}
+
+# Widest level whose division pairs are drawn from a table, keeping the original distribution
+TABLE_SPAN = 32
+
+# Registered operators and expression templates, keyed by operator key
+_registry = {}
+
+# Sorted keys of the registered operators and expression templates, or None until they are next needed
+_basic_keys = None
+_expression_keys = None
+
+
+def get_pair_table(operator, min_bound, max_bound):
+    """ Returns a table of every valid operand pair for the given operator and level.
+    Tables are built once per (min_bound, max_bound) level and cached, so a question
+    can be drawn from a table in O(1) rather than by retrying random operands.
+
+    Subtraction pairs are stored with the larger operand first, keeping one entry for each
+    ordered draw so the distribution matches flipping negative results. Division pairs are
+    every (dividend, divisor) which divide to a whole number.
+
+    Args:
+        operator: the operator symbol, either "-" or "/".
+        min_bound: the minimum operand value for the level.
+        max_bound: the maximum operand value for the level.
+
+    Returns:
+        the tuple of valid (left, right) operand pairs.
+
+    Raises:
+        ValueError: if no table exists for the operator.
+    """
+    key = (operator, min_bound, max_bound)
+    table = _pair_tables.get(key)
+    if table is None:
+        values = range(min_bound, max_bound + 1)
+        if operator == "-":
+            table = tuple((max(a, b), min(a, b)) for a in values for b in values)
+        elif operator == "/":
+            table = tuple((a, b) for a in values for b in values if a % b == 0)
+        else:
+            raise ValueError("No operand pair table for operator: " + str(operator))
+        _pair_tables[key] = table
+    return table
+
+
+def any_pair(min_bound, max_bound, rng):
+    """ Returns two independent operands from the level.
+
+    Args:
+        min_bound: the minimum operand value.
+        max_bound: the maximum operand value.
+        rng: the random number generator.
+
+    Returns:
+        the (left, right) operand pair.
+    """
+    return rng.randint(min_bound, max_bound), rng.randint(min_bound, max_bound)
+
+
+def ordered_pair(min_bound, max_bound, rng):
+    """ Returns two operands from the level with the larger first, so subtracting them is never negative.
+    One ordered draw is made from the whole square of pairs, giving exactly the distribution
+    and random number sequence of drawing from the subtraction pair table.
+
+    Args:
+        min_bound: the minimum operand value.
+        max_bound: the maximum operand value.
+        rng: the random number generator.
+
+    Returns:
+        the (left, right) operand pair.
+    """
+    width = max_bound - min_bound + 1
+    index = rng.randrange(width * width)
+    a = min_bound + index // width
+    b = min_bound + index % width
+    return (a, b) if a >= b else (b, a)
+
+
+def divisible_pair(min_bound, max_bound, rng):
+    """ Returns two operands from the level where the first divides by the second to a whole number.
+    Narrow levels draw from the division pair table. Wider levels choose the divisor and then
+    a quotient which keeps the dividend within the level.
+
+    Args:
+        min_bound: the minimum operand value.
+        max_bound: the maximum operand value.
+        rng: the random number generator.
+
+    Returns:
+        the (left, right) operand pair.
+    """
+    if max_bound - min_bound < TABLE_SPAN:
+        return rng.choice(get_pair_table("/", min_bound, max_bound))
+    right = rng.randint(min_bound, max_bound)
+    quotient = rng.randint(-(-min_bound // right), max_bound // right)
+    return right * quotient, right
+
+
+class Operator(object):
+
+    """ This class describes a binary operator - its symbol, its precedence in
+        expressions, how its answer is calculated and how operands meeting its
+        constraints are generated. """
+
+    __slots__ = ("key", "name", "symbol", "precedence", "apply", "valid", "operands")
+
+    def __init__(self, key, name, symbol, precedence, apply, valid, operands):
+        """ Constructor to initialise a new Operator instance.
+
+        Args:
+            key: the operator key.
+            name: the name used in timings.
+            symbol: the symbol used in question strings.
+            precedence: the precedence in expressions - higher is calculated first.
+            apply: the function called with (left, right) to calculate the answer.
+            valid: the function called with (left, right) to check the operands meet the constraints.
+            operands: the function called with (min bound, max bound, rng) to generate valid operands in O(1).
+        """
+        self.key = key
+        self.name = name
+        self.symbol = symbol
+        self.precedence = precedence
+        self.apply = apply
+        self.valid = valid
+        self.operands = operands
+
+    def make(self, left, right):
+        """ Builds a question from operands, calculating its answer.
+
+        Args:
+            left: the left operand.
+            right: the right operand.
+
+        Returns:
+            the Question.
+        """
+        return Question(self.key, left, right, self.apply(left, right),
+                        str(left) + " " + self.symbol + " " + str(right) + " = ?")
+
+    def generate(self, min_bound, max_bound, rng):
+        """ Generates a question at the given level.
+
+        Args:
+            min_bound: the minimum operand value.
+            max_bound: the maximum operand value.
+            rng: the random number generator.
+
+        Returns:
+            the Question.
+        """
+        left, right = self.operands(min_bound, max_bound, rng)
+        return self.make(left, right)
+
+
+class Expression(object):
+
+    """ This class describes a three-operand expression template such as a + b x c.
+        Answers follow the order of operations, with optional brackets around the
+        first two operands, and every step must meet its operator's constraints. """
+
+    __slots__ = ("key", "name", "operators", "brackets", "operands")
+
+    def __init__(self, key, name, operators, brackets, operands):
+        """ Constructor to initialise a new Expression instance.
+
+        Args:
+            key: the operator key of the template.
+            name: the name used in timings.
+            operators: the (first, second) operator keys.
+            brackets: True if the first two operands are bracketed.
+            operands: the function called with (min bound, max bound, rng) to generate valid
+                (a, b, c) operands in O(1).
+        """
+        self.key = key
+        self.name = name
+        self.operators = operators
+        self.brackets = brackets
+        self.operands = operands
+
+    def evaluate(self, a, b, c):
+        """ Calculates the answer of the expression using the order of operations.
+
+        Args:
+            a: the first operand.
+            b: the second operand.
+            c: the third operand.
+
+        Returns:
+            the answer.
+
+        Raises:
+            ValueError: if a step breaks its operator's constraints.
+        """
+        first, second = _registry[self.operators[0]], _registry[self.operators[1]]
+        if self.brackets or first.precedence >= second.precedence:
+            return _step(second, _step(first, a, b), c)
+        return _step(first, a, _step(second, b, c))
+
+    def make(self, operands):
+        """ Builds a question from operands, calculating its answer.
+
+        Args:
+            operands: the (a, b, c) operands.
+
+        Returns:
+            the Question.
+
+        Raises:
+            ValueError: if the operands break the template's constraints.
+        """
+        a, b, c = operands
+        first, second = _registry[self.operators[0]], _registry[self.operators[1]]
+        text = str(a) + " " + first.symbol + " " + str(b)
+        if self.brackets:
+            text = "(" + text + ")"
+        text += " " + second.symbol + " " + str(c) + " = ?"
+        return Question(self.key, a, c, self.evaluate(a, b, c), text, tuple(operands))
+
+    def generate(self, min_bound, max_bound, rng):
+        """ Generates a question at the given level.
+
+        Args:
+            min_bound: the minimum operand value.
+            max_bound: the maximum operand value.
+            rng: the random number generator.
+
+        Returns:
+            the Question.
+        """
+        return self.make(self.operands(min_bound, max_bound, rng))
+
+
+def _step(operator, left, right):
+    """ Calculates one step of an expression, checking its constraints.
+
+    Args:
+        operator: the Operator.
+        left: the left operand.
+        right: the right operand.
+
+    Returns:
+        the result of the step.
+
+    Raises:
+        ValueError: if the operands break the operator's constraints.
+    """
+    if not operator.valid(left, right):
+        raise ValueError("Operands " + str(left) + " and " + str(right) + " are not valid for " + operator.name)
+    return operator.apply(left, right)
+
+
+def register(entry):
+    """ Registers an operator or expression template, replacing any with the same key.
+
+    Args:
+        entry: the Operator or Expression.
+
+    Returns:
+        the registered entry.
+    """
+    global _basic_keys, _expression_keys
+    _registry[entry.key] = entry
+    _basic_keys = _expression_keys = None
+    return entry
+
+
+def get_operator(key):
+    """ Returns a registered operator or expression template.
+
+    Args:
+        key: the operator key.
+
+    Returns:
+        the Operator or Expression.
+
+    Raises:
+        ValueError: if nothing is registered with the key.
+    """
+    entry = _registry.get(key)
+    if entry is None:
+        raise ValueError("Unknown operator: " + str(key))
+    return entry
+
+
+def basic_keys():
+    """ Returns the keys of every registered two-operand operator.
+
+    Returns:
+        the sorted tuple of keys.
+    """
+    global _basic_keys
+    if _basic_keys is None:
+        _basic_keys = tuple(sorted(key for key, entry in _registry.items() if isinstance(entry, Operator)))
+    return _basic_keys
+
+
+def expression_keys():
+    """ Returns the keys of every registered expression template.
+
+    Returns:
+        the sorted tuple of keys.
+    """
+    global _expression_keys
+    if _expression_keys is None:
+        _expression_keys = tuple(sorted(key for key, entry in _registry.items() if isinstance(entry, Expression)))
+    return _expression_keys
+
+
+def _always(left, right):
+    """ Accepts any pair of operands. """
+    return True
+
+
+# Basic operators - subtraction never gives a negative answer and division always gives a whole number
+register(Operator(1, "add", "+", 1, lambda left, right: left + right, _always, any_pair))
+register(Operator(2, "sub", "-", 1, lambda left, right: left - right, lambda left, right: left >= right, ordered_pair))
+register(Operator(3, "mult", "x", 2, lambda left, right: left * right, _always, any_pair))
+register(Operator(4, "div", "/", 2, lambda left, right: left // right,
+                  lambda left, right: right != 0 and left % right == 0, divisible_pair))
+
+
+def _three(min_bound, max_bound, rng):
+    """ Returns three independent operands from the level. """
+    return rng.randint(min_bound, max_bound), rng.randint(min_bound, max_bound), rng.randint(min_bound, max_bound)
+
+
+def _product_minus(min_bound, max_bound, rng):
+    """ Returns operands for a x b - c. The product is at least min_bound, so some c can always be taken away. """
+    a, b = any_pair(min_bound, max_bound, rng)
+    return a, b, rng.randint(min_bound, min(max_bound, a * b))
+
+
+def _minus_product(min_bound, max_bound, rng):
+    """ Returns operands for a - b x c, choosing a just above the product so the answer stays within the level's width. """
+    b, c = any_pair(min_bound, max_bound, rng)
+    return b * c + rng.randint(0, max_bound - min_bound), b, c
+
+
+def _difference_times(min_bound, max_bound, rng):
+    """ Returns operands for (a - b) x c. """
+    a, b = ordered_pair(min_bound, max_bound, rng)
+    return a, b, rng.randint(min_bound, max_bound)
+
+
+def _plus_quotient(min_bound, max_bound, rng):
+    """ Returns operands for a + b / c. """
+    b, c = divisible_pair(min_bound, max_bound, rng)
+    return rng.randint(min_bound, max_bound), b, c
+
+
+def _quotient_plus(min_bound, max_bound, rng):
+    """ Returns operands for a / b + c. """
+    a, b = divisible_pair(min_bound, max_bound, rng)
+    return a, b, rng.randint(min_bound, max_bound)
+
+
+# Three-operand expressions using the order of operations
+register(Expression(11, "add_mult", (1, 3), False, _three))
+register(Expression(12, "mult_add", (3, 1), False, _three))
+register(Expression(13, "mult_sub", (3, 2), False, _product_minus))
+register(Expression(14, "sub_mult", (2, 3), False, _minus_product))
+register(Expression(15, "bracket_add_mult", (1, 3), True, _three))
+register(Expression(16, "bracket_sub_mult", (2, 3), True, _difference_times))
+register(Expression(17, "add_div", (1, 4), False, _plus_quotient))
+register(Expression(18, "div_add", (4, 1), False, _quotient_plus))
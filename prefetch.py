@@ -0,0 +1,189 @@
+__author__ = "Harry Baines"
+
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+from mathengine import generate_question, get_profiler
+from operators import get_operator
+
+""" This module provides a question prefetcher which keeps a small buffer of upcoming questions
+for each game, so the next question is ready as soon as an answer has been checked. Buffers are
+filled by a background worker shared between games, and are thrown away whenever the engine
+changes level so a stale question is never asked. Thrown away questions can be handed back to
+their source, so a scheduler's reviews are not lost.
+"""
+
+
+class PrefetchWorker(object):
+
+    """ This class runs a background thread which refills the buffers of any
+        prefetchers which have fallen below their refill point. One worker
+        can be shared by every prefetcher in the process. """
+
+    def __init__(self):
+        """ Constructor to initialise a new PrefetchWorker instance and start its thread. """
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="question-prefetch", daemon=True)
+        self._thread.start()
+
+    def request(self, prefetcher):
+        """ Asks the worker to refill a prefetcher's buffer.
+
+        Args:
+            prefetcher: the QuestionPrefetcher to refill.
+        """
+        self._pending.put(prefetcher)
+
+    def _run(self):
+        """ Refills buffers until the worker is stopped. """
+        while True:
+            prefetcher = self._pending.get()
+            if prefetcher is None:
+                break
+            prefetcher._fill()
+
+    def stop(self):
+        """ Stops the worker thread once pending refills are done. """
+        self._pending.put(None)
+        self._thread.join()
+
+
+class QuestionPrefetcher(object):
+
+    """ This class holds a bounded buffer of generated questions for one game
+        at the engine's current level. Questions are taken from the front of
+        the buffer, and the buffer is refilled in the background once it runs
+        low. If it is ever empty, a question is generated straight away. """
+
+    def __init__(self, worker, operators, size=8, seed=None, source=None, discard=None):
+        """ Constructor to initialise a new QuestionPrefetcher instance.
+
+        Args:
+            worker: the PrefetchWorker which refills the buffer.
+            operators: the operator keys (1-4) questions are drawn from.
+            size: the maximum number of questions buffered.
+            seed: the seed for the prefetcher's random number generator, or None.
+            source: the function called with (operator, min bound, max bound) to get each question,
+                for example QuestionScheduler.next_question, or None to generate questions directly.
+            discard: the function called with the list of questions thrown away without being asked,
+                for example QuestionScheduler.requeue, or None.
+        """
+        self._worker = worker
+        self._operators = tuple(operators)
+        self._size = size
+        self._rng = random.Random(seed)
+        self._source = source
+        self._discard = discard
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._bounds = None
+        self._generation = 0
+        self._requested = False
+        self._closed = False
+
+    def _generate(self, bounds):
+        """ Generates one question at the given level, timing the generator if instrumentation is switched on.
+
+        Args:
+            bounds: the (min bound, max bound) tuple of the level.
+
+        Returns:
+            the generated Question.
+        """
+        operator = self._operators[0] if len(self._operators) == 1 else self._rng.choice(self._operators)
+        profiler = get_profiler()
+        if profiler is not None:
+            start = time.perf_counter()
+        if self._source is not None:
+            question = self._source(operator, bounds[0], bounds[1])
+        else:
+            question = generate_question(operator, bounds[0], bounds[1], self._rng)
+        if profiler is not None:
+            profiler.record("generate." + get_operator(question.operator).name, time.perf_counter() - start)
+        return question
+
+    def _fill(self):
+        """ Fills the buffer up to its size at the current level. Called by the worker.
+        Questions generated for a level which has since been invalidated are discarded.
+        """
+        with self._lock:
+            self._requested = False
+            generation = self._generation
+            bounds = self._bounds
+            missing = self._size - len(self._buffer)
+
+        for i in range(missing):
+            if self._closed or generation != self._generation:
+                return
+            question = self._generate(bounds)
+            with self._lock:
+                stale = generation != self._generation or len(self._buffer) >= self._size
+                if not stale:
+                    self._buffer.append(question)
+            if stale:
+                self._throw_away([question])
+                return
+
+    def _throw_away(self, questions):
+        """ Hands questions which will never be asked back to the discard function, if there is one.
+
+        Args:
+            questions: the list of unasked Questions.
+        """
+        if self._discard is not None and questions:
+            self._discard(questions)
+
+    def _request_fill(self):
+        """ Asks the worker to refill the buffer unless a refill is already pending. Called with the lock held. """
+        if not self._requested and not self._closed:
+            self._requested = True
+            self._worker.request(self)
+
+    def invalidate(self, min_bound, max_bound):
+        """ Throws away buffered questions and starts buffering for a new level.
+        The thrown away questions are passed to the discard function.
+
+        Args:
+            min_bound: the minimum operand value for the new level.
+            max_bound: the maximum operand value for the new level.
+        """
+        with self._lock:
+            self._bounds = (min_bound, max_bound)
+            self._generation += 1
+            stale = list(self._buffer)
+            self._buffer.clear()
+            self._request_fill()
+        self._throw_away(stale)
+
+    def get(self):
+        """ Returns the next question at the current level.
+
+        Returns:
+            the next Question.
+        """
+        with self._lock:
+            question = self._buffer.popleft() if self._buffer else None
+            bounds = self._bounds
+            if len(self._buffer) <= self._size // 2:
+                self._request_fill()
+
+        if question is None:
+            question = self._generate(bounds)
+        return question
+
+    def close(self):
+        """ Stops any further refills and empties the buffer. """
+        with self._lock:
+            self._closed = True
+            self._buffer.clear()
+
+    def __len__(self):
+        """ Returns the number of questions currently buffered.
+
+        Returns:
+            the buffer length.
+        """
+        return len(self._buffer)
@@ -0,0 +1,168 @@
+__author__ = "Harry Baines"
+
+import numpy as np
+
+from operators import TABLE_SPAN, any_pair, basic_keys, divisible_pair, get_operator, get_pair_table, ordered_pair
+
+""" This module provides vectorised generation of large batches of questions using NumPy,
+for printing worksheets and pre-generating question pools. Batches follow the same rules
+as the MathEngine generators - subtraction never gives a negative answer and division always
+gives a whole number - and question strings are only built when they are asked for.
+"""
+
+# Operand generators which batches reproduce with vectorised draws
+_BATCH_OPERANDS = (any_pair, ordered_pair, divisible_pair)
+
+
+class QuestionBatch(object):
+
+    """ This class holds a batch of generated questions as parallel NumPy arrays
+        of operator keys, operands and answers. """
+
+    def __init__(self, operators, left, right, answers):
+        """ Constructor to initialise a new QuestionBatch instance.
+
+        Args:
+            operators: the array of operator keys.
+            left: the array of left operands.
+            right: the array of right operands.
+            answers: the array of answers.
+        """
+        self._operators = operators
+        self._left = left
+        self._right = right
+        self._answers = answers
+
+    def __len__(self):
+        """ Returns the number of questions in the batch.
+
+        Returns:
+            the batch size.
+        """
+        return len(self._operators)
+
+    def question_string(self, index):
+        """ Returns the question string for a single question in the batch.
+
+        Args:
+            index: the index of the question.
+
+        Returns:
+            the question string, in the same format as MathEngine.
+        """
+        symbol = get_operator(int(self._operators[index])).symbol
+        return str(self._left[index]) + " " + symbol + " " + str(self._right[index]) + " = ?"
+
+    def iter_questions(self):
+        """ Yields the question string and answer for each question in the batch.
+
+        Returns:
+            a generator of (question string, answer) tuples.
+        """
+        symbols = {key: get_operator(key).symbol for key in np.unique(self._operators).tolist()}
+        symbols = [symbols[key] for key in self._operators.tolist()]
+        for left, symbol, right, answer in zip(self._left.tolist(), symbols, self._right.tolist(), self._answers.tolist()):
+            yield str(left) + " " + symbol + " " + str(right) + " = ?", answer
+
+    @property
+    def operators(self):
+        """ Returns the array of operator keys.
+
+        Returns:
+            the operator key array.
+        """
+        return self._operators
+
+    @property
+    def left(self):
+        """ Returns the array of left operands.
+
+        Returns:
+            the left operand array.
+        """
+        return self._left
+
+    @property
+    def right(self):
+        """ Returns the array of right operands.
+
+        Returns:
+            the right operand array.
+        """
+        return self._right
+
+    @property
+    def answers(self):
+        """ Returns the array of answers.
+
+        Returns:
+            the answer array.
+        """
+        return self._answers
+
+
+def generate_batch(size, min_bound, max_bound, operators=None, weights=None, seed=None):
+    """ Generates a batch of questions for the given level and operator mix.
+
+    Args:
+        size: the number of questions to generate.
+        min_bound: the minimum operand value for the level.
+        max_bound: the maximum operand value for the level.
+        operators: the operator keys to choose from, or None for every registered operator.
+        weights: the relative weight of each operator, or None for an even mix.
+        seed: the seed for reproducible batches, or None.
+
+    Returns:
+        the generated QuestionBatch.
+
+    Raises:
+        ValueError: if an operator key is unknown or can't be batched, or the weights don't match the operators.
+    """
+    operators = np.asarray(basic_keys() if operators is None else operators, dtype=np.int64)
+    for key in operators.tolist():
+        if key not in basic_keys():
+            raise ValueError("Unknown operator key: " + str(key))
+        if get_operator(key).operands not in _BATCH_OPERANDS:
+            raise ValueError("Operator can't be generated in a batch: " + str(key))
+    ordered = [key for key in operators.tolist() if get_operator(key).operands is ordered_pair]
+    divisible = [key for key in operators.tolist() if get_operator(key).operands is divisible_pair]
+
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.shape != operators.shape:
+            raise ValueError("Expected one weight for each operator")
+        weights = weights / weights.sum()
+
+    rng = np.random.default_rng(seed)
+    ops = rng.choice(operators, size=size, p=weights)
+    left = rng.integers(min_bound, max_bound + 1, size=size, dtype=np.int64)
+    right = rng.integers(min_bound, max_bound + 1, size=size, dtype=np.int64)
+
+    # Larger operand first so subtraction answers are never negative
+    sub = np.isin(ops, ordered)
+    high = np.maximum(left, right)
+    low = np.minimum(left, right)
+    left = np.where(sub, high, left)
+    right = np.where(sub, low, right)
+
+    # Division operands are drawn from the level's table of whole number pairs at narrow levels,
+    # and built as divisor x quotient at wider ones, as operators.divisible_pair does
+    div = np.isin(ops, divisible)
+    div_count = int(np.count_nonzero(div))
+    if div_count and max_bound - min_bound < TABLE_SPAN:
+        table = np.array(get_pair_table("/", min_bound, max_bound), dtype=np.int64)
+        picks = table[rng.integers(0, len(table), size=div_count)]
+        left[div] = picks[:, 0]
+        right[div] = picks[:, 1]
+    elif div_count:
+        divisors = rng.integers(min_bound, max_bound + 1, size=div_count, dtype=np.int64)
+        quotients = rng.integers(-(-min_bound // divisors), max_bound // divisors + 1, dtype=np.int64)
+        left[div] = divisors * quotients
+        right[div] = divisors
+
+    # Operators calculate their answers with arithmetic NumPy applies element-wise
+    answers = np.empty(size, dtype=np.int64)
+    for key in np.unique(ops).tolist():
+        mask = ops == key
+        answers[mask] = get_operator(key).apply(left[mask], right[mask])
+    return QuestionBatch(ops, left, right, answers)
@@ -0,0 +1,101 @@
+__author__ = "Harry Baines"
+
+import time
+
+from instrumentation import Histogram
+
+""" This module provides a render batcher which collects changes to a window's Tk variables and
+focus, and applies them in one coalesced update once the event loop is idle. An answer changes
+several labels at once, so batching them means one redraw per answer rather than one for each
+label. Values which have not changed and focus which is already in place are skipped. Redraws
+and frame times are counted, so responsiveness can be checked on slow machines.
+"""
+
+
+class RenderBatcher(object):
+
+    """ This class queues variable sets and focus requests for a window and
+        applies them together from an after_idle callback. Only the latest
+        value queued for each variable is applied. """
+
+    def __init__(self, widget, clock=time.perf_counter):
+        """ Constructor to initialise a new RenderBatcher instance.
+
+        Args:
+            widget: the Tk widget whose event loop applies the updates.
+            clock: the clock function used to time frames.
+        """
+        self._widget = widget
+        self._clock = clock
+        self._pending = {}
+        self._focus = None
+        self._scheduled_at = None
+        self._frames = 0
+        self._sets = 0
+        self._skipped = 0
+        self._focus_calls = 0
+        self._frame_times = Histogram()
+        self._latencies = Histogram()
+
+    def set(self, variable, value):
+        """ Queues a value to be set on a Tk variable in the next frame.
+
+        Args:
+            variable: the tk.Variable to set.
+            value: the value to set.
+        """
+        self._pending[str(variable)] = (variable, value)
+        self._schedule()
+
+    def focus(self, widget):
+        """ Queues a widget to be given focus in the next frame.
+
+        Args:
+            widget: the widget to focus.
+        """
+        self._focus = widget
+        self._schedule()
+
+    def _schedule(self):
+        """ Asks the event loop to apply the queued updates once it is idle, unless it already has been. """
+        if self._scheduled_at is None:
+            self._scheduled_at = self._clock()
+            self._widget.after_idle(self.flush)
+
+    def flush(self):
+        """ Applies every queued update now. Variables already holding their queued value are not set again.
+        The next change is scheduled as normal even if applying an update raises, for example while
+        the window is being destroyed.
+        """
+        scheduled_at, self._scheduled_at = self._scheduled_at, None
+        if scheduled_at is None:
+            return
+        start = self._clock()
+        pending, self._pending = self._pending, {}
+        focus, self._focus = self._focus, None
+        try:
+            for variable, value in pending.values():
+                if variable.get() == value:
+                    self._skipped += 1
+                else:
+                    variable.set(value)
+                    self._sets += 1
+
+            if focus is not None and self._widget.focus_get() is not focus:
+                focus.focus()
+                self._focus_calls += 1
+        finally:
+            end = self._clock()
+            self._frames += 1
+            self._frame_times.record(end - start)
+            self._latencies.record(end - scheduled_at)
+
+    def stats(self):
+        """ Returns the number of frames and redraws, and frame time statistics.
+
+        Returns:
+            the dictionary of frames, variables set, sets skipped, focus calls, and
+            summaries of the time each frame took to apply and the wait from the first queued change.
+        """
+        return {"frames": self._frames, "sets": self._sets, "skipped": self._skipped, "focus_calls": self._focus_calls,
+                "frame_seconds": self._frame_times.summary(), "latency_seconds": self._latencies.summary()}
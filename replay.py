@@ -0,0 +1,221 @@
+__author__ = "Harry Baines"
+
+import argparse
+import json
+import time
+from collections import namedtuple
+
+from difficulty import make_model
+from mathengine import MathEngine
+
+""" This module provides recording and replay of games, for debugging and regression benchmarking.
+A game is recorded with its engine's seed, max level and difficulty model, every action taken
+(each answer entered and each timer update) and every clock reading the engine made. Replaying
+feeds the same actions and clock readings to a new engine with the same settings, so every result
+matches the recording exactly - including answer latencies and when a time attack game runs out.
+"""
+
+# A recorded game - its mode, seed, actions, clock readings, the results it produced, and the max level
+# and difficulty model it was played with. Recordings saved without the last two used the defaults
+Recording = namedtuple("Recording", ["math_key", "seed", "actions", "clock_readings", "results", "max_level",
+                                     "difficulty"], defaults=(10, "streak"))
+
+
+def _result_fields(result):
+    """ Returns the parts of an AnswerResult which are compared between recording and replay.
+
+    Args:
+        result: the AnswerResult.
+
+    Returns:
+        the list of result fields.
+    """
+    text = None if result.question is None else result.question.text
+    next_text = None if result.next_question is None else result.next_question.text
+    return [result.valid, result.correct, text, next_text, result.game_over, result.given, result.latency, result.level]
+
+
+class SessionRecorder(object):
+
+    """ This class plays a game on a new engine while recording it. Answers and timer
+        updates must be made through the recorder so they are included. """
+
+    def __init__(self, math_key, seed=None, clock=time.monotonic, max_level=10, difficulty="streak"):
+        """ Constructor to initialise a new SessionRecorder instance.
+
+        Args:
+            math_key: the key of the game mode to play.
+            seed: the seed for the engine, or None for a random seed.
+            clock: the monotonic clock function the engine reads.
+            max_level: the highest maximum bound the level can reach.
+            difficulty: the name of the difficulty model the game adapts with.
+
+        Raises:
+            ValueError: if the difficulty model is unknown.
+        """
+        self._clock = clock
+        self._actions = []
+        self._clock_readings = []
+        self._results = []
+        self._difficulty = difficulty
+        self._engine = MathEngine(math_key, self._read_clock, seed, max_level)
+        self._engine.set_difficulty(make_model(difficulty))
+        self._engine.bind("result", lambda result: self._results.append(_result_fields(result)))
+
+    def _read_clock(self):
+        """ Reads the clock on behalf of the engine, recording the reading.
+
+        Returns:
+            the clock reading.
+        """
+        reading = self._clock()
+        self._clock_readings.append(reading)
+        return reading
+
+    def start(self):
+        """ Begins the game and returns the first question.
+
+        Returns:
+            the first Question to display.
+        """
+        self._actions.append(["start"])
+        return self._engine.start()
+
+    def check_answer(self, entry):
+        """ Checks an entry, recording it.
+
+        Args:
+            entry: the user's entry string.
+
+        Returns:
+            the AnswerResult for the entry.
+        """
+        self._actions.append(["answer", entry])
+        return self._engine.check_answer(entry)
+
+    def update_timer(self):
+        """ Updates the time attack timer, recording the update.
+
+        Returns:
+            the number of seconds until the timer next needs updating, or None.
+        """
+        self._actions.append(["timer"])
+        return self._engine.update_timer()
+
+    def finish(self):
+        """ Finishes the game, recording it. """
+        self._actions.append(["finish"])
+        self._engine.finish()
+
+    def recording(self):
+        """ Returns the recording of the game so far.
+
+        Returns:
+            the Recording.
+        """
+        return Recording(self._engine.math_key, self._engine.seed, list(self._actions), list(self._clock_readings),
+                         list(self._results), self._engine._max_level, self._difficulty)
+
+    @property
+    def engine(self):
+        """ Returns the engine playing the recorded game.
+
+        Returns:
+            the MathEngine instance.
+        """
+        return self._engine
+
+
+def replay(recording):
+    """ Replays a recorded game on a new engine.
+
+    Args:
+        recording: the Recording to replay.
+
+    Returns:
+        the list of result fields produced by the replay, to compare with recording.results.
+
+    Raises:
+        ValueError: if the replay reads the clock more often than the recording did.
+    """
+    readings = iter(recording.clock_readings)
+
+    def clock():
+        try:
+            return next(readings)
+        except StopIteration:
+            raise ValueError("Replay has diverged from the recording")
+
+    results = []
+    engine = MathEngine(recording.math_key, clock, recording.seed, recording.max_level)
+    engine.set_difficulty(make_model(recording.difficulty))
+    engine.bind("result", lambda result: results.append(_result_fields(result)))
+    for action in recording.actions:
+        if action[0] == "start":
+            engine.start()
+        elif action[0] == "answer":
+            engine.check_answer(action[1])
+        elif action[0] == "timer":
+            engine.update_timer()
+        elif action[0] == "finish":
+            engine.finish()
+    return results
+
+
+def verify(recording):
+    """ Replays a recorded game and checks that every result matches the recording.
+
+    Args:
+        recording: the Recording to check.
+
+    Returns:
+        True if the replay matches the recording exactly.
+    """
+    try:
+        return replay(recording) == [list(result) for result in recording.results]
+    except ValueError:
+        return False
+
+
+def save_recording(recording, path):
+    """ Saves a recording as JSON. Clock readings are stored exactly.
+
+    Args:
+        recording: the Recording to save.
+        path: the path of the file to write.
+    """
+    with open(path, "w") as f:
+        json.dump(recording._asdict(), f)
+
+
+def load_recording(path):
+    """ Loads a recording saved by save_recording.
+
+    Args:
+        path: the path of the file to read.
+
+    Returns:
+        the Recording.
+    """
+    with open(path) as f:
+        return Recording(**json.load(f))
+
+
+# Main function to replay recordings and report whether they still match
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Maths Game sessions.")
+    parser.add_argument("recordings", nargs="+", help="recording files to replay")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    mismatched = 0
+    for path in args.recordings:
+        matches = verify(load_recording(path))
+        mismatched += not matches
+        print(path + ": " + ("ok" if matches else "MISMATCH"))
+    print("Replayed " + str(len(args.recordings)) + " recording(s) in " + format(time.perf_counter() - start, ".3f") + " s")
+    raise SystemExit(1 if mismatched else 0)
+
+# Program entry point
+if __name__ == "__main__":
+    main()
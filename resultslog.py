@@ -0,0 +1,287 @@
+__author__ = "Harry Baines"
+
+import json
+import os
+import struct
+import time
+from collections import namedtuple
+
+""" This module provides a persistent, append-only log of every question answered in the game.
+Each answer is packed into a fixed-size binary record and written through a buffered writer,
+so logging adds almost nothing to the cost of checking an answer. The log starts with a header
+holding the record layout version, so logs from an older layout are refused rather than misread. Per-pupil and per-class
+totals are kept as rollups alongside the log, so statistics can be queried without scanning it. A game which ends
+with a score, such as a time attack game which ran until time was up, is closed with an end record holding the score.
+"""
+
+# Binary layout of one record: timestamp, pupil, class, game, mode, operator, correct, level,
+# left operand, right operand, answer, answer given and latency in seconds
+RECORD = struct.Struct("<dIIIBBBIqqqqf")
+
+# Header at the start of every log: magic bytes and the record layout version
+HEADER = struct.Struct("<4sI")
+_MAGIC = b"MGRL"
+RECORD_VERSION = 3
+
+# Operator key of a game's end record, whose answer given is the game's score
+END_OPERATOR = 0
+
+# One answered question read back from the log
+Record = namedtuple("Record", ["timestamp", "pupil", "class_id", "game", "mode", "operator", "correct", "level",
+                               "left", "right", "answer", "given", "latency"])
+
+# Range of answers which can be stored in a record
+_INT_MIN = -2 ** 63
+_INT_MAX = 2 ** 63 - 1
+
+# Highest level which can be recorded. Answers at this level, such as a x b + c, still fit in a record
+MAX_LEVEL = 2 ** 31 - 1
+
+
+def check_header(path):
+    """ Checks that a results log was written with the current record layout.
+
+    Args:
+        path: the path of the log file.
+
+    Raises:
+        ValueError: if the log has no header or an unsupported record version.
+    """
+    with open(path, "rb") as f:
+        data = f.read(HEADER.size)
+    if len(data) < HEADER.size or HEADER.unpack(data)[0] != _MAGIC:
+        raise ValueError("Not a results log, or written by an older version: " + str(path))
+    version = HEADER.unpack(data)[1]
+    if version != RECORD_VERSION:
+        raise ValueError("Unsupported results log version " + str(version) + ": " + str(path))
+
+
+def read_records(path, offset=HEADER.size):
+    """ Reads records from a results log.
+
+    Args:
+        path: the path of the log file.
+        offset: the byte offset of the first record to read, by default the first after the header.
+
+    Returns:
+        a generator of Record tuples.
+
+    Raises:
+        ValueError: if the log has an unsupported record version.
+    """
+    check_header(path)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            data = f.read(RECORD.size * 4096)
+            for fields in RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]):
+                yield Record(*fields)
+            if len(data) < RECORD.size * 4096:
+                break
+
+
+class ResultsLog(object):
+
+    """ This class appends answered questions to a binary results log and keeps
+        running totals for each pupil and class. Totals are saved to a rollup file
+        next to the log every so often, and when the log is reopened only the
+        records written since the last rollup are read. """
+
+    def __init__(self, path, buffer_size=65536, rollup_every=50000):
+        """ Constructor to initialise a new ResultsLog instance, opening the log for appending.
+
+        Args:
+            path: the path of the log file.
+            buffer_size: the number of bytes buffered before the log is written to disk.
+            rollup_every: the number of records between saving the rollups.
+
+        Raises:
+            ValueError: if an existing log has an unsupported record version.
+        """
+        self._path = path
+        self._rollup_path = path + ".rollup"
+        self._rollup_every = rollup_every
+        self._pupils = {}
+        self._classes = {}
+        self._next_game = 1
+        self._offset = HEADER.size
+        self._load_rollups()
+
+        self._file = open(path, "ab", buffering=buffer_size)
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(_MAGIC, RECORD_VERSION))
+        self._since_rollup = 0
+
+    def _load_rollups(self):
+        """ Loads the saved rollups and adds any records written after them.
+
+        Raises:
+            ValueError: if the log has an unsupported record version.
+        """
+        if os.path.exists(self._rollup_path):
+            with open(self._rollup_path) as f:
+                rollups = json.load(f)
+            self._pupils = {int(k): v for k, v in rollups["pupils"].items()}
+            self._classes = {int(k): v for k, v in rollups["classes"].items()}
+            self._next_game = rollups["next_game"]
+            self._offset = rollups["offset"]
+
+        if os.path.exists(self._path) and os.path.getsize(self._path):
+
+            # Drop any partly written record left by a crash
+            check_header(self._path)
+            size = os.path.getsize(self._path) - HEADER.size
+            if size % RECORD.size:
+                with open(self._path, "r+b") as f:
+                    f.truncate(HEADER.size + size - size % RECORD.size)
+
+            for record in read_records(self._path, self._offset):
+                if record.operator != END_OPERATOR:
+                    self._add_to_rollups(record.pupil, record.class_id, record.correct, record.latency)
+                self._next_game = max(self._next_game, record.game + 1)
+
+    def _add_to_rollups(self, pupil, class_id, correct, latency):
+        """ Adds one answer to the running totals.
+
+        Args:
+            pupil: the pupil id.
+            class_id: the class id.
+            correct: True if the answer was correct.
+            latency: the time taken to answer in seconds.
+        """
+        for totals, key in ((self._pupils, pupil), (self._classes, class_id)):
+            entry = totals.get(key)
+            if entry is None:
+                entry = totals[key] = [0, 0, 0.0]
+            entry[0 if correct else 1] += 1
+            entry[2] += latency
+
+    def new_game(self):
+        """ Returns a new game id, unique within this log.
+
+        Returns:
+            the game id.
+        """
+        game = self._next_game
+        self._next_game += 1
+        return game
+
+    def record(self, pupil, class_id, game, mode, result, timestamp=None):
+        """ Appends a checked answer to the log. Invalid entries are not recorded.
+
+        Args:
+            pupil: the pupil id.
+            class_id: the class id.
+            game: the game id returned by new_game.
+            mode: the game mode key.
+            result: the AnswerResult returned by the math engine.
+            timestamp: the time of the answer, or None for now.
+        """
+        if not result.valid:
+            return
+
+        question = result.question
+        given = min(_INT_MAX, max(_INT_MIN, result.given))
+        self._file.write(RECORD.pack(time.time() if timestamp is None else timestamp, pupil, class_id, game, mode,
+                                     question.operator, result.correct, result.level, question.left, question.right,
+                                     question.answer, given, result.latency))
+        self._add_to_rollups(pupil, class_id, result.correct, result.latency)
+
+        self._since_rollup += 1
+        if self._since_rollup >= self._rollup_every:
+            self.save_rollups()
+
+    def record_end(self, pupil, class_id, game, mode, score, timestamp=None):
+        """ Appends the end record of a game with a score. Its operator is END_OPERATOR, its answer
+        given is the score, and its other fields are zero. End records are not counted in the totals.
+
+        Args:
+            pupil: the pupil id.
+            class_id: the class id.
+            game: the game id returned by new_game.
+            mode: the game mode key.
+            score: the game's score.
+            timestamp: the time the game ended, or None for now.
+        """
+        self._file.write(RECORD.pack(time.time() if timestamp is None else timestamp, pupil, class_id, game, mode,
+                                     END_OPERATOR, False, 0, 0, 0, 0, score, 0.0))
+
+    def attach(self, engine, pupil, class_id):
+        """ Records every answer checked by an engine as a new game, followed by an end record
+        if the game finishes with a score.
+
+        Args:
+            engine: the MathEngine instance to record.
+            pupil: the pupil id.
+            class_id: the class id.
+
+        Returns:
+            the game id.
+        """
+        def record_score(summary):
+            if engine.score is not None:
+                self.record_end(pupil, class_id, game, mode, engine.score)
+
+        game = self.new_game()
+        mode = engine.math_key
+        engine.bind("result", lambda result: self.record(pupil, class_id, game, mode, result))
+        engine.bind("finished", record_score)
+        return game
+
+    def save_rollups(self):
+        """ Writes buffered records to disk and saves the rollups covering them. """
+        self._file.flush()
+        rollups = {"offset": self._file.tell(), "next_game": self._next_game,
+                   "pupils": self._pupils, "classes": self._classes}
+        with open(self._rollup_path + ".tmp", "w") as f:
+            json.dump(rollups, f)
+        os.replace(self._rollup_path + ".tmp", self._rollup_path)
+        self._since_rollup = 0
+
+    def close(self):
+        """ Saves the rollups and closes the log. """
+        if not self._file.closed:
+            self.save_rollups()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _stats(self, entry):
+        """ Converts running totals into a statistics dictionary.
+
+        Args:
+            entry: the [right, wrong, total latency] list, or None.
+
+        Returns:
+            the dictionary of statistics.
+        """
+        right, wrong, latency = entry or (0, 0, 0.0)
+        answered = right + wrong
+        return {"right": right, "wrong": wrong, "accuracy": right / answered if answered else None,
+                "mean_latency": latency / answered if answered else None}
+
+    def pupil_stats(self, pupil):
+        """ Returns the statistics for one pupil.
+
+        Args:
+            pupil: the pupil id.
+
+        Returns:
+            the dictionary of right, wrong, accuracy and mean latency.
+        """
+        return self._stats(self._pupils.get(pupil))
+
+    def class_stats(self, class_id):
+        """ Returns the statistics for one class.
+
+        Args:
+            class_id: the class id.
+
+        Returns:
+            the dictionary of right, wrong, accuracy and mean latency.
+        """
+        return self._stats(self._classes.get(class_id))
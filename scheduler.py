@@ -0,0 +1,191 @@
+__author__ = "Harry Baines"
+
+import random
+import threading
+from collections import deque
+
+from mathengine import generate_question, make_question
+from operators import TABLE_SPAN, get_pair_table
+
+""" This module provides a question scheduler which stops a pupil being asked the same question
+again too soon. Each level's question space is dealt like a shuffled deck, so every question at a
+level is asked once before any is repeated, and questions the pupil got wrong are brought back a
+few questions later for another try. Each draw costs O(1) whatever the size of the level.
+Subtraction and division are dealt from pair tables, so at wider levels, and for expression
+templates, questions are generated independently instead - repeats are rare at those sizes anyway.
+"""
+
+
+class _Deck(object):
+
+    """ This class deals every operand pair for one operator and level in a random order,
+        using a Fisher-Yates shuffle which is carried out one draw at a time. Addition and
+        multiplication decks calculate pairs from their index, so they start in O(1) at
+        any level. Subtraction and division decks are built from the level's pair table,
+        which costs O(width ** 2), so they are only dealt for levels narrower than TABLE_SPAN. """
+
+    def __init__(self, operator, min_bound, max_bound):
+        """ Constructor to initialise a new _Deck instance.
+
+        Args:
+            operator: the operator key (1-4).
+            min_bound: the minimum operand value for the level.
+            max_bound: the maximum operand value for the level.
+        """
+        self._min_bound = min_bound
+        self._width = max_bound - min_bound + 1
+
+        # Addition and multiplication use every ordered pair, so pairs are calculated from their index
+        if operator == 2:
+            self._pairs = sorted(set(get_pair_table("-", min_bound, max_bound)))
+        elif operator == 4:
+            self._pairs = get_pair_table("/", min_bound, max_bound)
+        else:
+            self._pairs = None
+
+        self._size = self._width ** 2 if self._pairs is None else len(self._pairs)
+        self._swaps = {}
+        self._dealt = 0
+        self._last = None
+
+    def _pair(self, index):
+        """ Returns the operand pair at an index of the question space.
+
+        Args:
+            index: the index of the pair.
+
+        Returns:
+            the (left, right) operand pair.
+        """
+        if self._pairs is not None:
+            return self._pairs[index]
+        return (self._min_bound + index // self._width, self._min_bound + index % self._width)
+
+    def deal(self, rng):
+        """ Deals the next operand pair, reshuffling once every pair has been dealt.
+
+        Args:
+            rng: the random number generator used to shuffle.
+
+        Returns:
+            the (left, right) operand pair.
+        """
+        if self._dealt == self._size:
+            self._swaps.clear()
+            self._dealt = 0
+
+        # Swap a random undealt position into the next dealt position
+        i = self._dealt
+        j = rng.randrange(i, self._size)
+
+        # Don't repeat the last pair of the previous shuffle straight away
+        if i == 0 and self._size > 1 and self._swaps.get(j, j) == self._last:
+            j = (j + 1) % self._size
+
+        swaps = self._swaps
+        value = swaps.get(j, j)
+        swaps[j] = swaps.get(i, i)
+        swaps[i] = value
+        self._dealt += 1
+        self._last = value
+        return self._pair(value)
+
+
+class QuestionScheduler(object):
+
+    """ This class chooses the operands of each question for one pupil. Questions
+        are dealt without replacement from each level's question space, and any
+        question answered wrongly is asked again after a gap of a few questions.
+        The scheduler can be shared with a prefetching thread, so draws are locked. """
+
+    def __init__(self, review_gap=3, max_reviews=32, rng=None):
+        """ Constructor to initialise a new QuestionScheduler instance.
+
+        Args:
+            review_gap: the number of questions asked before a wrong answer is reviewed.
+            max_reviews: the maximum number of wrong answers waiting to be reviewed.
+            rng: the random number generator used to shuffle, or None for a new one.
+        """
+        self._review_gap = review_gap
+        self._max_reviews = max_reviews
+        self._rng = rng or random.Random()
+        self._decks = {}
+        self._reviews = {}
+        self._asked_reviews = {}
+        self._draws = 0
+        self._lock = threading.Lock()
+
+    def next_question(self, operator, min_bound, max_bound):
+        """ Returns the next question for an operator at the given level.
+        A question due to be reviewed for the operator is returned first.
+
+        Args:
+            operator: the key of a registered operator or expression template.
+            min_bound: the minimum operand value for the level.
+            max_bound: the maximum operand value for the level.
+
+        Returns:
+            the next Question.
+        """
+        dealt = operator in (1, 3) or (operator in (2, 4) and max_bound - min_bound < TABLE_SPAN)
+        with self._lock:
+            self._draws += 1
+            reviews = self._reviews.get(operator)
+            if reviews and reviews[0][0] <= self._draws:
+                question = reviews.popleft()[1]
+                self._asked_reviews[question] = self._asked_reviews.get(question, 0) + 1
+                return question
+            if not dealt:
+                return generate_question(operator, min_bound, max_bound, self._rng)
+
+            key = (operator, min_bound, max_bound)
+            deck = self._decks.get(key)
+            if deck is None:
+                deck = self._decks[key] = _Deck(operator, min_bound, max_bound)
+            left, right = deck.deal(self._rng)
+        return make_question(operator, left, right)
+
+    def record(self, question, correct):
+        """ Records the pupil's answer to a question, scheduling a review if it was wrong.
+
+        Args:
+            question: the Question which was answered.
+            correct: True if the answer was correct.
+        """
+        with self._lock:
+            self._forget_review(question)
+            if correct:
+                return
+            reviews = self._reviews.setdefault(question.operator, deque())
+            if len(reviews) < self._max_reviews:
+                reviews.append((self._draws + self._review_gap, question))
+
+    def requeue(self, questions):
+        """ Takes back questions which were drawn but never asked, such as those thrown away
+        by a prefetcher when the level changes. Any reviews among them are due again straight away.
+
+        Args:
+            questions: the unasked Questions, in the order they were drawn.
+        """
+        with self._lock:
+            for question in reversed(questions):
+                if self._forget_review(question):
+                    self._reviews.setdefault(question.operator, deque()).appendleft((self._draws, question))
+
+    def _forget_review(self, question):
+        """ Stops tracking a review question which has been answered or taken back. Called with the lock held.
+
+        Args:
+            question: the Question.
+
+        Returns:
+            True if the question was a review waiting to be asked.
+        """
+        count = self._asked_reviews.get(question)
+        if count is None:
+            return False
+        if count == 1:
+            del self._asked_reviews[question]
+        else:
+            self._asked_reviews[question] = count - 1
+        return True
@@ -0,0 +1,520 @@
+__author__ = "Harry Baines"
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+
+from difficulty import MODELS, make_model
+from instrumentation import Profiler
+from leaderboard import LeaderboardStore
+from levelcache import LevelCache
+from mathengine import MathEngine, get_profiler, set_profiler
+from prefetch import PrefetchWorker, QuestionPrefetcher
+from resultslog import MAX_LEVEL, ResultsLog
+from timerwheel import TimerWheel
+
+""" This module provides a server which hosts many concurrent MathEngine games in one process,
+for example for a whole classroom. Sessions are created, looked up and expired by session id,
+and each keeps the engine's adaptive difficulty along with the time attack and unlimited mode
+rules. Answers can be recorded to a results log for each pupil and class. Clients talk to the server over a simple line-based protocol:
+
+    NEW <mode key> [<pupil id> <class id>]   starts a new game and returns its session id and first question
+    ANSWER <session id> <entry>   checks an entry and returns the result and next question
+    SHEET <session id> <count>   issues an answer sheet of questions and returns their ids
+    GRADE <session id> <JSON list of [question id, entry] pairs>   grades a batch of answers from a sheet
+    END <session id>          finishes a game and returns its summary
+    STATS                     returns the number of live sessions and any engine timings
+    TOP <mode key> [<class id>]   returns the top 10 scores for time attack (6) or unlimited mode (7)
+    RANK <mode key> <pupil id> [<class id>]   returns a pupil's position and best score
+    PROFILE ON|OFF            switches engine timing instrumentation on or off
+
+Every response is a single line of JSON. Games started without a pupil id are anonymous, so
+they are not recorded, ranked or given a pupil's saved level.
+"""
+
+
+class SessionLimitError(Exception):
+
+    """ Raised when a new session is requested but the server is already full. """
+
+
+class Session(object):
+
+    """ This class holds one game hosted by the server - its engine, when it was
+        last used, and the time attack timer handle if one is running. """
+
+    def __init__(self, session_id, engine, now):
+        """ Constructor to initialise a new Session instance.
+
+        Args:
+            session_id: the unique id of the session.
+            engine: the MathEngine instance playing the game.
+            now: the current monotonic time.
+        """
+        self._session_id = session_id
+        self._engine = engine
+        self._summary = None
+        self.last_active = now
+        self.timer = None
+        self._engine.bind("finished", self._store_summary)
+
+    def _store_summary(self, summary):
+        """ Stores the summary once the engine has finished the game.
+
+        Args:
+            summary: the summary string, or None.
+        """
+        self._summary = summary
+
+    @property
+    def session_id(self):
+        """ Returns the unique id of this session.
+
+        Returns:
+            the session id string.
+        """
+        return self._session_id
+
+    @property
+    def engine(self):
+        """ Returns the engine playing this session's game.
+
+        Returns:
+            the MathEngine instance.
+        """
+        return self._engine
+
+    @property
+    def summary(self):
+        """ Returns the summary of the finished game.
+
+        Returns:
+            the summary string, or None.
+        """
+        return self._summary
+
+
+class SessionManager(object):
+
+    """ This class creates, looks up and expires game sessions. Sessions are kept
+        in least recently used order so idle sessions can be evicted cheaply, and
+        the number of live sessions is capped to keep memory bounded. Every time
+        attack countdown shares one timer wheel. """
+
+    def __init__(self, max_sessions=10000, idle_timeout=300.0, clock=time.monotonic, results_log=None, prefetch_size=0,
+                 difficulty="streak", leaderboards=None, max_level=10, levels=None):
+        """ Constructor to initialise a new SessionManager instance.
+
+        Args:
+            max_sessions: the maximum number of live sessions.
+            idle_timeout: the number of seconds after which an unused session is evicted.
+            clock: the monotonic clock function used to measure idle time and time attack games.
+            results_log: the ResultsLog to record answers to, or None.
+            prefetch_size: the number of questions to prefetch for each session, or 0 for none.
+            difficulty: the name of the difficulty model each session adapts with.
+            leaderboards: the LeaderboardStore to submit time attack and unlimited mode scores to, or None.
+            max_level: the highest maximum bound each session's level can reach.
+            levels: the LevelCache carrying each pupil's level between games, or None.
+        """
+        self._max_sessions = max_sessions
+        self._idle_timeout = idle_timeout
+        self._clock = clock
+        self._timers = TimerWheel(clock=clock)
+        self._results_log = results_log
+        self._prefetch_size = prefetch_size
+        self._prefetch_worker = PrefetchWorker() if prefetch_size else None
+        self._difficulty = difficulty
+        self._leaderboards = leaderboards
+        self._max_level = max_level
+        self._levels = levels
+        self._sessions = OrderedDict()
+
+    @property
+    def leaderboards(self):
+        """ Returns the leaderboards scores are submitted to.
+
+        Returns:
+            the LeaderboardStore, or None.
+        """
+        return self._leaderboards
+
+    def __len__(self):
+        """ Returns the number of live sessions.
+
+        Returns:
+            the session count.
+        """
+        return len(self._sessions)
+
+    def create(self, math_key, pupil=None, class_id=None):
+        """ Creates a new session playing the given game mode. Anonymous sessions, with no pupil id,
+        start at the first level and are not recorded, ranked or remembered.
+
+        Args:
+            math_key: the key of the game mode to play (1-7, or 9 for expressions).
+            pupil: the id of the pupil playing, or None if anonymous.
+            class_id: the id of the pupil's class, or None if anonymous.
+
+        Returns:
+            the new Session.
+
+        Raises:
+            ValueError: if the game mode key or an id is not valid.
+            SessionLimitError: if the server is full even after evicting idle sessions.
+        """
+        if math_key not in (1, 2, 3, 4, 5, 6, 7, 9):
+            raise ValueError("Unknown game mode: " + str(math_key))
+        anonymous = pupil is None
+        if not anonymous and not (0 <= pupil < 2 ** 32 and class_id is not None and 0 <= class_id < 2 ** 32):
+            raise ValueError("Pupil and class ids must be between 0 and " + str(2 ** 32 - 1))
+
+        if len(self._sessions) >= self._max_sessions:
+            self.evict_idle()
+            if len(self._sessions) >= self._max_sessions:
+                raise SessionLimitError("Too many sessions, try again later")
+
+        # The session is only registered once its game has started, so a failed setup leaves nothing behind
+        session = Session(uuid.uuid4().hex, MathEngine(math_key, self._clock, max_level=self._max_level), self._clock())
+        session.engine.set_difficulty(make_model(self._difficulty))
+        if self._levels is not None and not anonymous:
+            self._levels.attach(session.engine, pupil)
+        if self._results_log is not None and not anonymous:
+            self._results_log.attach(session.engine, pupil, class_id)
+        if self._leaderboards is not None and not anonymous:
+            self._leaderboards.attach(session.engine, pupil, class_id)
+        if self._prefetch_worker is not None:
+            engine = session.engine
+            engine.set_prefetcher(QuestionPrefetcher(self._prefetch_worker, engine.operator_keys, self._prefetch_size,
+                                                     seed=engine.seed + 1))
+        session.engine.start()
+        self._sessions[session.session_id] = session
+        if session.engine.timer_running:
+            self._update_timer(session)
+        return session
+
+    def get(self, session_id):
+        """ Looks up a session and marks it as recently used.
+
+        Args:
+            session_id: the id of the session.
+
+        Returns:
+            the Session.
+
+        Raises:
+            KeyError: if there is no live session with the id.
+        """
+        session = self._sessions[session_id]
+        session.last_active = self._clock()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def expire(self, session_id):
+        """ Removes a session, finishing its game and stopping any timer.
+
+        Args:
+            session_id: the id of the session.
+
+        Returns:
+            the removed Session, or None if it did not exist.
+        """
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            if session.timer is not None:
+                session.timer.cancel()
+                session.timer = None
+            session.engine.finish()
+        return session
+
+    def evict_idle(self):
+        """ Expires every session which has been idle for longer than the idle timeout.
+        Sessions are stored oldest first, so only expired sessions are visited.
+
+        Returns:
+            the number of sessions evicted.
+        """
+        cutoff = self._clock() - self._idle_timeout
+        evicted = 0
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_active > cutoff:
+                break
+            self.expire(session.session_id)
+            evicted += 1
+        return evicted
+
+    async def run_reaper(self, interval=10.0):
+        """ Evicts idle sessions periodically until cancelled, saving new leaderboard scores and levels each time.
+
+        Args:
+            interval: the number of seconds between evictions.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
+            if self._leaderboards is not None:
+                self._leaderboards.flush()
+            if self._levels is not None:
+                self._levels.flush()
+
+    async def run_timers(self):
+        """ Fires due time attack timers every tick of the timer wheel until cancelled. """
+        while True:
+            await asyncio.sleep(self._timers.tick)
+            self._timers.advance()
+
+    def _update_timer(self, session):
+        """ Updates a session's time attack timer, re-arming it while time remains.
+
+        Args:
+            session: the Session whose timer to update.
+        """
+        session.timer = None
+        delay = session.engine.update_timer()
+        if delay is not None:
+            session.timer = self._timers.call_later(delay, lambda: self._update_timer(session))
+
+
+class GameServer(object):
+
+    """ This class serves the line-based game protocol to connected clients,
+        passing each command to the session manager. """
+
+    def __init__(self, manager, max_connections=1000, max_sheet=100):
+        """ Constructor to initialise a new GameServer instance.
+
+        Args:
+            manager: the SessionManager holding the games.
+            max_connections: the maximum number of clients served at once.
+            max_sheet: the maximum number of answer sheet questions outstanding in one session.
+        """
+        self._manager = manager
+        self._max_sheet = max_sheet
+        self._connections = asyncio.Semaphore(max_connections)
+
+    def handle_command(self, line):
+        """ Runs a single protocol command.
+
+        Args:
+            line: the command line sent by the client.
+
+        Returns:
+            the response dictionary.
+        """
+        parts = line.split(None, 2)
+        if not parts:
+            return {"ok": False, "error": "Empty command"}
+        command = parts[0].upper()
+
+        try:
+            if command == "NEW" and len(line.split()) in (2, 4):
+                parts = line.split()
+                ids = [int(part) for part in parts[2:]]
+                session = self._manager.create(int(parts[1]), *ids)
+                return {"ok": True, "session": session.session_id, "question": session.engine.question.text}
+
+            if command == "ANSWER" and len(parts) == 3:
+                return self._answer(self._manager.get(parts[1]), parts[2])
+
+            if command == "SHEET" and len(parts) == 3:
+                sheet = self._manager.get(parts[1]).engine.issue_sheet(int(parts[2]), self._max_sheet)
+                return {"ok": True, "questions": [[question_id, question.text] for question_id, question in sheet]}
+
+            if command == "GRADE" and len(parts) == 3:
+                return self._grade(self._manager.get(parts[1]), json.loads(parts[2]))
+
+            if command == "END" and len(parts) == 2:
+                session = self._manager.get(parts[1])
+                self._manager.expire(session.session_id)
+                return {"ok": True, "over": True, "summary": session.summary}
+
+            if command == "STATS" and len(parts) == 1:
+                response = {"ok": True, "sessions": len(self._manager)}
+                if get_profiler() is not None:
+                    response["timings"] = get_profiler().summary()
+                return response
+
+            if command in ("TOP", "RANK") and self._manager.leaderboards is None:
+                return {"ok": False, "error": "Leaderboards are not enabled"}
+
+            if command == "TOP" and len(line.split()) in (2, 3):
+                ids = [int(part) for part in line.split()[1:]]
+                top = self._manager.leaderboards.top(ids[0], class_id=ids[1] if len(ids) == 2 else None)
+                return {"ok": True, "top": [list(entry) for entry in top]}
+
+            if command == "RANK" and len(line.split()) in (3, 4):
+                ids = [int(part) for part in line.split()[1:]]
+                rank = self._manager.leaderboards.rank(ids[0], ids[1], ids[2] if len(ids) == 3 else None)
+                if rank is None:
+                    return {"ok": True, "rank": None}
+                return {"ok": True, "rank": rank[0], "of": rank[1], "best": rank[2]}
+
+            if command == "PROFILE" and len(parts) == 2 and parts[1].upper() in ("ON", "OFF"):
+                if parts[1].upper() == "OFF":
+                    set_profiler(None)
+                elif get_profiler() is None:
+                    set_profiler(Profiler())
+                return {"ok": True, "profiling": get_profiler() is not None}
+
+        except KeyError:
+            return {"ok": False, "error": "Unknown session"}
+        except (ValueError, SessionLimitError) as e:
+            return {"ok": False, "error": str(e)}
+
+        return {"ok": False, "error": "Unknown command"}
+
+    def _grade(self, session, answers):
+        """ Grades a batch of answers for a session, expiring the session once its game is over.
+
+        Args:
+            session: the Session being answered.
+            answers: the list of [question id, entry] pairs.
+
+        Returns:
+            the response dictionary.
+
+        Raises:
+            ValueError: if the answers are not a list of pairs with whole number question ids.
+        """
+        if not isinstance(answers, list) or not all(isinstance(pair, list) and len(pair) == 2 and type(pair[0]) is int
+                                                    for pair in answers):
+            raise ValueError("Answers must be a list of [question id, entry] pairs")
+        results = session.engine.grade_batch(answers)
+        response = {"ok": True, "results": [result.correct if result.valid else None for result in results],
+                    "level": results[-1].level if results else None}
+        if session.engine.finished:
+            self._manager.expire(session.session_id)
+            response["over"] = True
+            response["summary"] = session.summary
+        return response
+
+    def _answer(self, session, entry):
+        """ Checks an entry for a session, expiring the session once its game is over.
+
+        Args:
+            session: the Session being answered.
+            entry: the user's entry string.
+
+        Returns:
+            the response dictionary.
+        """
+        if not session.engine.finished:
+            result = session.engine.check_answer(entry)
+            response = {"ok": True, "valid": result.valid, "correct": result.correct, "message": result.message}
+            if not session.engine.finished:
+                response["question"] = result.next_question.text
+                return response
+        else:
+            response = {"ok": True}
+
+        # Game over - either answered wrong in unlimited mode or time is up
+        self._manager.expire(session.session_id)
+        response["over"] = True
+        response["summary"] = session.summary
+        return response
+
+    async def handle_client(self, reader, writer):
+        """ Serves commands from one client until it disconnects.
+        Responses are written in order, waiting for the client to read them before the next command.
+
+        Args:
+            reader: the stream reader for the client.
+            writer: the stream writer for the client.
+        """
+        if self._connections.locked():
+            writer.write(b'{"ok": false, "error": "Server busy"}\n')
+            await writer.drain()
+            writer.close()
+            return
+
+        async with self._connections:
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    response = self.handle_command(line.decode("utf-8", "replace").strip())
+                    writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                    await writer.drain()
+            except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                pass
+            finally:
+                writer.close()
+
+
+async def serve(host, port, max_sessions, idle_timeout, max_connections, log_path=None, profile_path=None,
+                prefetch_size=0, difficulty="streak", leaderboard_path=None, max_level=10,
+                levels_path=None):
+    """ Runs the game server until cancelled.
+
+    Args:
+        host: the host name to listen on.
+        port: the port to listen on.
+        max_sessions: the maximum number of live sessions.
+        idle_timeout: the number of seconds after which an unused session is evicted.
+        max_connections: the maximum number of clients served at once.
+        log_path: the path of the results log to record answers to, or None.
+        profile_path: the path to export engine timings to on shutdown, or None to start with profiling off.
+        prefetch_size: the number of questions to prefetch for each session, or 0 for none.
+        difficulty: the name of the difficulty model each session adapts with.
+        leaderboard_path: the path of the leaderboard scores file, or None for no leaderboards.
+        max_level: the highest maximum bound each session's level can reach.
+        levels_path: the path of the database carrying pupils' levels between games, or None.
+    """
+    if profile_path:
+        set_profiler(Profiler())
+    results_log = ResultsLog(log_path) if log_path else None
+    leaderboards = LeaderboardStore(leaderboard_path) if leaderboard_path else None
+    levels = LevelCache(levels_path) if levels_path else None
+    manager = SessionManager(max_sessions, idle_timeout, results_log=results_log, prefetch_size=prefetch_size,
+                             difficulty=difficulty, leaderboards=leaderboards, max_level=max_level,
+                             levels=levels)
+    game_server = GameServer(manager, max_connections)
+    reaper = asyncio.ensure_future(manager.run_reaper(min(idle_timeout, 10.0)))
+    timers = asyncio.ensure_future(manager.run_timers())
+    # Lines are capped to bound memory per client, with room for a full answer sheet to be graded
+    server = await asyncio.start_server(game_server.handle_client, host, port, limit=16384)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        reaper.cancel()
+        timers.cancel()
+        if results_log is not None:
+            results_log.close()
+        if leaderboards is not None:
+            leaderboards.close()
+        if levels is not None:
+            levels.close()
+        if profile_path and get_profiler() is not None:
+            get_profiler().export(profile_path)
+
+
+# Main function to run the game server
+def main():
+    parser = argparse.ArgumentParser(description="Host many Maths Game sessions in one process.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2120)
+    parser.add_argument("--max-sessions", type=int, default=10000)
+    parser.add_argument("--idle-timeout", type=float, default=300.0)
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--log", help="results log file to record every answer to")
+    parser.add_argument("--profile", help="file to export engine timings to on shutdown")
+    parser.add_argument("--prefetch", type=int, default=0, help="questions to prefetch for each session")
+    parser.add_argument("--difficulty", choices=MODELS, default="streak", help="difficulty model for each session")
+    parser.add_argument("--leaderboard", help="file to keep time attack and unlimited mode leaderboards in")
+    parser.add_argument("--max-level", type=int, default=10, help="highest operand value, e.g. 100 for older pupils")
+    parser.add_argument("--levels", help="database to carry each pupil's level between games in")
+    args = parser.parse_args()
+    if not MathEngine._start_max <= args.max_level <= MAX_LEVEL:
+        parser.error("--max-level must be between " + str(MathEngine._start_max) + " and " + str(MAX_LEVEL))
+    asyncio.run(serve(args.host, args.port, args.max_sessions, args.idle_timeout, args.max_connections,
+                      args.log, args.profile, args.prefetch, args.difficulty, args.leaderboard, args.max_level,
+                      args.levels))
+
+# Program entry point
+if __name__ == "__main__":
+    main()
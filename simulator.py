@@ -0,0 +1,226 @@
+__author__ = "Harry Baines"
+
+import argparse
+import cProfile
+import json
+import pstats
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from difficulty import MODELS, make_model
+from mathengine import MathEngine
+from operators import get_operator
+
+""" This module provides a load generator which runs large populations of simulated players
+through the math engine in parallel, to see how the adaptive difficulty behaves at scale and
+to find hot spots in the engine's per-answer path. Each player answers questions in the random
+sums game mode with a probability of being right given by a configurable accuracy model.
+"""
+
+
+class AccuracyModel(object):
+
+    """ This class models how likely a simulated player is to answer correctly.
+        Accuracy falls as the level rises and can differ for each operator. """
+
+    def __init__(self, base=0.9, level_drop=0.04, operator_drop=None, spread=0.1):
+        """ Constructor to initialise a new AccuracyModel instance.
+
+        Args:
+            base: the chance of answering correctly at the starting level.
+            level_drop: the fall in accuracy for each level above the starting level.
+            operator_drop: the dictionary of extra accuracy falls keyed by operator key, or None for the defaults.
+            spread: the range either side of base over which each player's ability varies.
+        """
+        self._base = base
+        self._level_drop = level_drop
+        self._operator_drop = {1: 0.0, 2: 0.02, 3: 0.06, 4: 0.08} if operator_drop is None else operator_drop
+        self._spread = spread
+
+    def player_ability(self, rng):
+        """ Returns the base accuracy for a new player.
+
+        Args:
+            rng: the random number generator for the player.
+
+        Returns:
+            the player's accuracy at the starting level.
+        """
+        return self._base + rng.uniform(-self._spread, self._spread)
+
+    def accuracy(self, ability, operator, levels_above_start):
+        """ Returns the chance of a player answering a question correctly.
+
+        Args:
+            ability: the player's accuracy at the starting level.
+            operator: the operator key of the question.
+            levels_above_start: the number of levels above the starting level.
+
+        Returns:
+            the chance of a correct answer between 0 and 1.
+        """
+        p = ability - self._level_drop * levels_above_start - self._operator_drop.get(operator, 0.0)
+        return min(1.0, max(0.0, p))
+
+
+def simulate_players(first_player, count, questions, seed, model, difficulty="streak"):
+    """ Simulates a group of players, each answering a fixed number of questions.
+
+    Args:
+        first_player: the index of the first player, used to seed each player.
+        count: the number of players to simulate.
+        questions: the number of questions each player answers.
+        seed: the base random seed.
+        model: the AccuracyModel deciding whether answers are right.
+        difficulty: the name of the difficulty model each player's engine adapts with.
+
+    Returns:
+        the dictionary of aggregated results for the group.
+    """
+    final_levels = Counter()
+    time_to_max = Counter()
+    operator_mix = Counter()
+    answers = 0
+
+    for player in range(first_player, first_player + count):
+        rng = random.Random(~player ^ seed)
+        ability = model.player_ability(rng)
+
+        engine = MathEngine(5, seed=seed * 1000003 + player)
+        engine.set_difficulty(make_model(difficulty))
+        question = engine.start()
+        start_max = engine._start_max
+        reached_max = None
+
+        for i in range(questions):
+            operator_mix[question.operator] += 1
+            p = model.accuracy(ability, question.operator, engine._max_bound - start_max)
+            entry = question.answer if rng.random() < p else question.answer + 1
+            question = engine.check_answer(str(entry)).next_question
+            if reached_max is None and engine._max_bound == engine._max_level:
+                reached_max = i + 1
+
+        answers += questions
+        final_levels[engine._max_bound] += 1
+        time_to_max[reached_max] += 1
+
+    return {"answers": answers, "final_levels": final_levels, "time_to_max": time_to_max, "operator_mix": operator_mix}
+
+
+def _merge(total, part):
+    """ Adds the results for one group of players to the running totals.
+
+    Args:
+        total: the dictionary of running totals.
+        part: the dictionary of results for one group.
+    """
+    total["answers"] += part["answers"]
+    for key in ("final_levels", "time_to_max", "operator_mix"):
+        total[key].update(part[key])
+
+
+def _percentiles(counter, points):
+    """ Returns percentiles of a distribution held as value counts, ignoring None values.
+
+    Args:
+        counter: the Counter of values.
+        points: the percentiles to calculate, between 0 and 100.
+
+    Returns:
+        the dictionary of values keyed by percentile, or None for each if there are no values.
+    """
+    values = sorted((v, n) for v, n in counter.items() if v is not None)
+    total = sum(n for v, n in values)
+    result = {}
+    for point in points:
+        target = total * point / 100.0
+        seen = 0
+        result["p" + str(point)] = None
+        for value, n in values:
+            seen += n
+            if seen >= target:
+                result["p" + str(point)] = value
+                break
+    return result
+
+
+def run_simulation(players, questions, seed, workers, chunk_size, model=None, difficulty="streak"):
+    """ Runs a population of simulated players across a pool of processes.
+
+    Args:
+        players: the number of players to simulate.
+        questions: the number of questions each player answers.
+        seed: the base random seed.
+        workers: the number of worker processes, or None for one per CPU core.
+        chunk_size: the number of players simulated by each task.
+        model: the AccuracyModel to use, or None for the default model.
+        difficulty: the name of the difficulty model each player's engine adapts with.
+
+    Returns:
+        the dictionary holding the simulation report.
+    """
+    model = model or AccuracyModel()
+    total = {"answers": 0, "final_levels": Counter(), "time_to_max": Counter(), "operator_mix": Counter()}
+    starts = range(0, players, chunk_size)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(simulate_players, first, min(chunk_size, players - first), questions, seed, model,
+                               difficulty) for first in starts]
+        for future in futures:
+            _merge(total, future.result())
+    elapsed = time.perf_counter() - start
+
+    mix_total = sum(total["operator_mix"].values())
+    return {
+        "players": players,
+        "difficulty": difficulty,
+        "questions_per_player": questions,
+        "seconds": elapsed,
+        "players_per_second": players / elapsed,
+        "answers_per_second": total["answers"] / elapsed,
+        "final_levels": {str(level): n for level, n in sorted(total["final_levels"].items())},
+        "reached_max_level": players - total["time_to_max"][None],
+        "questions_to_max_level": _percentiles(total["time_to_max"], (10, 50, 90)),
+        "operator_mix": {get_operator(key).symbol: n / mix_total for key, n in sorted(total["operator_mix"].items())},
+    }
+
+
+def profile_players(players, questions, seed, limit=15, difficulty="streak"):
+    """ Profiles the per-answer path by simulating players in this process.
+
+    Args:
+        players: the number of players to simulate.
+        questions: the number of questions each player answers.
+        seed: the base random seed.
+        limit: the number of functions to print.
+        difficulty: the name of the difficulty model each player's engine adapts with.
+    """
+    profiler = cProfile.Profile()
+    profiler.runcall(simulate_players, 0, players, questions, seed, AccuracyModel(), difficulty)
+    pstats.Stats(profiler).sort_stats("tottime").print_stats(limit)
+
+
+# Main function to run the simulation and print its report
+def main():
+    parser = argparse.ArgumentParser(description="Simulate players to stress-test adaptive difficulty.")
+    parser.add_argument("--players", type=int, default=100000)
+    parser.add_argument("--questions", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=212)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--profile", action="store_true", help="profile one chunk in-process instead")
+    parser.add_argument("--difficulty", choices=MODELS, default="streak")
+    args = parser.parse_args()
+
+    if args.profile:
+        profile_players(min(args.players, args.chunk_size), args.questions, args.seed, difficulty=args.difficulty)
+    else:
+        print(json.dumps(run_simulation(args.players, args.questions, args.seed, args.workers, args.chunk_size,
+                                        difficulty=args.difficulty), indent=2))
+
+# Program entry point
+if __name__ == "__main__":
+    main()
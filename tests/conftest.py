@@ -0,0 +1,8 @@
+__author__ = "Harry Baines"
+
+import os
+import sys
+
+""" Test configuration - the modules live at the top of the repository, so it is put on the import path. """
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,49 @@
+__author__ = "Harry Baines"
+
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import analytics
+from mathengine import AnswerResult, make_question
+from resultslog import RECORD, ResultsLog
+
+""" Tests for the offline analytics job. """
+
+
+def test_analyse_matches_recorded_answers(tmp_path):
+    path = str(tmp_path / "results.log")
+    with ResultsLog(path) as log:
+        games = [log.new_game() for i in range(3)]
+        for i in range(30):
+            game = games[i % 3]
+            question = make_question(1 + i % 4, 6, 3)
+            correct = i % 5 != 0
+            log.record(1, 1, game, 6 if game != games[2] else 7,
+                       AnswerResult(True, correct, "", question, None, False, question.answer + (not correct), 0.5,
+                                    4 + i // 3), timestamp=float(i))
+
+        # The first time attack game runs until time is up, and the second is quit
+        log.record_end(1, 1, games[0], 6, 8, timestamp=30.0)
+
+    output = str(tmp_path / "out")
+    summary = analytics.analyse(path, output, workers=1, chunk_records=7, max_operand=10, max_questions=20)
+    assert analytics.RECORD_DTYPE.itemsize == RECORD.size
+    assert summary["events"] == 31 and summary["answers"] == 30 and summary["games"] == 3
+
+    def load(name):
+        return np.load(os.path.join(output, name + ".npy"))
+
+    assert list(load("operator_keys")) == [1, 2, 3, 4]
+    assert load("operator_answers").sum() == 30
+    assert abs(summary["error_rate"] - 6 / 30) < 1e-12
+    assert load("pair_answers")[1, 6, 3] == 8
+
+    # Game n's question q is record 3 * (q - 1) + n, at level 4 + q - 1
+    assert list(load("level_trajectory")[:10]) == [4.0 + q for q in range(10)]
+    assert list(load("time_attack_scores")) == [0] * 8 + [1]
+    with open(os.path.join(output, "summary.json")) as f:
+        assert json.load(f)["time_attack_games"] == 1
@@ -0,0 +1,65 @@
+__author__ = "Harry Baines"
+
+import pytest
+
+from difficulty import DifficultyModel, SkillModel, StreakModel, make_model
+from mathengine import MathEngine, generate_question
+
+""" Tests for the difficulty models. """
+
+
+class CountingPrefetcher(object):
+
+    """ This class stands in for a QuestionPrefetcher, generating every question
+        straight away and counting how often its buffer would be thrown away. """
+
+    def __init__(self, operators):
+        self._operators = operators
+        self.invalidated = 0
+        self._bounds = None
+        self._count = 0
+
+    def invalidate(self, min_bound, max_bound):
+        self.invalidated += 1
+        self._bounds = (min_bound, max_bound)
+
+    def get(self):
+        self._count += 1
+        return generate_question(self._operators[self._count % len(self._operators)], *self._bounds)
+
+    def close(self):
+        pass
+
+
+def test_difficulty_model_is_abstract():
+    with pytest.raises(TypeError):
+        DifficultyModel()
+    assert isinstance(make_model("streak"), StreakModel) and isinstance(make_model("skill"), SkillModel)
+
+
+def test_streak_model_stays_within_levels():
+    engine = MathEngine(1, seed=1, max_level=6)
+    engine.start()
+    for i in range(30):
+        engine.check_answer(str(engine.question.answer))
+    assert engine._max_bound == 6
+    for i in range(30):
+        engine.check_answer(str(engine.question.answer + 1))
+    assert engine._max_bound == MathEngine._start_max
+
+
+def test_skill_model_only_moves_bounds_on_level_change():
+    engine = MathEngine(5, seed=2, max_level=50)
+    model = SkillModel()
+    engine.set_difficulty(model)
+    prefetcher = CountingPrefetcher(engine.operator_keys)
+    engine.set_prefetcher(prefetcher)
+    engine.start()
+
+    changes = 0
+    for i in range(400):
+        question = engine.question
+        before = int(round(model.level(question.operator)))
+        engine.check_answer(str(question.answer + (i % 7 == 0)))
+        changes += int(round(model.level(question.operator))) != before
+    assert prefetcher.invalidated - 1 <= changes < 200
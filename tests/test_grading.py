@@ -0,0 +1,61 @@
+__author__ = "Harry Baines"
+
+import pytest
+
+from mathengine import MathEngine, parse_entry
+from sessionserver import GameServer, SessionManager
+
+""" Tests for answer sheets, batched grading and the server commands which use them. """
+
+
+def test_parse_entry_never_raises():
+    assert parse_entry(" 1 2 ") == 12 and parse_entry("-7") == -7 and parse_entry(5) == 5
+    for entry in ("", "x", "1.5", "١", "9" * 5000, None, [1], {"a": 1}, 1.0, True):
+        assert parse_entry(entry) is None
+
+
+def test_grade_batch_reports_each_answer():
+    engine = MathEngine(1, seed=1)
+    engine.start()
+    sheet = engine.issue_sheet(4)
+    answers = [(sheet[0][0], str(sheet[0][1].answer)), (sheet[1][0], str(sheet[1][1].answer + 1)),
+               (sheet[2][0], "x"), (999, "1"), ([1], "1")]
+    results = engine.grade_batch(answers)
+    assert [result.valid for result in results] == [True, True, False, False, False]
+    assert results[0].correct and not results[1].correct
+    assert engine.total_right == 1 and engine.total_wrong == 1
+
+    # The invalid answer stays on the sheet, answered questions do not
+    assert engine.grade_batch([(sheet[2][0], str(sheet[2][1].answer))])[0].correct
+    assert not engine.grade_batch([(sheet[0][0], str(sheet[0][1].answer))])[0].valid
+
+
+def test_outstanding_sheet_questions_are_capped():
+    engine = MathEngine(1, seed=1)
+    engine.start()
+    engine.issue_sheet(60)
+    with pytest.raises(ValueError):
+        engine.issue_sheet(60)
+    assert len(engine.issue_sheet(40)) == 40
+
+
+def _server(**kwargs):
+    return GameServer(SessionManager(**kwargs), max_sheet=10)
+
+
+def test_grade_rejects_bad_question_ids():
+    server = _server()
+    session = server.handle_command("NEW 1")["session"]
+    for answers in ('[[[1], "3"]]', '[[{"a": 1}, "3"]]', '[[1.5, "3"]]', '[1, 2]', '{"1": "3"}'):
+        response = server.handle_command("GRADE " + session + " " + answers)
+        assert response["ok"] is False and "pairs" in response["error"]
+    assert server.handle_command("GRADE " + session + ' [[1, "3"]]')["ok"]
+
+
+def test_sheet_command_rejects_requests_over_the_cap():
+    server = _server()
+    session = server.handle_command("NEW 1")["session"]
+    assert len(server.handle_command("SHEET " + session + " 6")["questions"]) == 6
+    response = server.handle_command("SHEET " + session + " 6")
+    assert response["ok"] is False and "outstanding" in response["error"]
+    assert server.handle_command("SHEET " + session + " -1")["ok"] is False
@@ -0,0 +1,68 @@
+__author__ = "Harry Baines"
+
+import json
+
+from instrumentation import Histogram, Profiler
+from mathengine import MathEngine, set_profiler
+from prefetch import QuestionPrefetcher
+
+""" Tests for the timing histograms and engine instrumentation. """
+
+
+def test_histogram_percentiles_are_close():
+    histogram = Histogram()
+    for i in range(1, 1001):
+        histogram.record(i / 1000.0)
+    summary = histogram.summary()
+    assert summary["count"] == 1000 and summary["min"] == 0.001 and summary["max"] == 1.0
+    assert 0.4 <= summary["p50"] <= 0.65 and 0.85 <= summary["p99"] <= 1.0
+    assert Histogram().summary() == {"count": 0}
+
+    profiler = Profiler()
+    profiler.record("check_answer", 0.01)
+    assert profiler.summary()["check_answer"]["count"] == 1
+
+
+def test_prefetched_questions_are_timed_where_they_are_generated():
+    class Worker(object):
+        def request(self, prefetcher):
+            pass
+
+    profiler = Profiler()
+    set_profiler(profiler)
+    try:
+        engine = MathEngine(1, seed=1)
+        prefetcher = QuestionPrefetcher(Worker(), engine.operator_keys, size=4, seed=2)
+        engine.set_prefetcher(prefetcher)
+        question = engine.start()
+        prefetcher._fill()
+        engine.check_answer(str(question.answer))
+    finally:
+        set_profiler(None)
+    summary = profiler.summary()
+    assert summary["generate.add"]["count"] == 5
+    assert summary["prefetch.get"]["count"] == 1
+
+
+def test_engine_times_answers_only_while_switched_on(tmp_path):
+    clock = [0.0]
+    engine = MathEngine(1, lambda: clock[0], seed=4)
+    question = engine.start()
+    question = engine.check_answer(str(question.answer)).next_question
+
+    profiler = Profiler()
+    set_profiler(profiler)
+    try:
+        clock[0] += 2.0
+        engine.check_answer(str(question.answer))
+    finally:
+        set_profiler(None)
+    engine.check_answer("0")
+
+    summary = profiler.summary()
+    assert summary["check_answer"]["count"] == 1 and summary["generate.add"]["count"] == 1
+    assert summary["answer_latency"]["min"] == 2.0
+    path = str(tmp_path / "timings.json")
+    profiler.export(path)
+    with open(path) as f:
+        assert json.load(f) == summary
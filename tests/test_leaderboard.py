@@ -0,0 +1,84 @@
+__author__ = "Harry Baines"
+
+import random
+
+import pytest
+
+from leaderboard import LeaderboardStore, RankedList
+from mathengine import MathEngine
+
+""" Tests for the ranked skip list and the leaderboards built on it. """
+
+
+def test_ranked_list_matches_sorted_list():
+    rng = random.Random(4)
+    ranked = RankedList(seed=1)
+    keys = []
+    for i in range(2000):
+        if keys and rng.random() < 0.3:
+            key = keys.pop(rng.randrange(len(keys)))
+            ranked.remove(key)
+        else:
+            key = rng.random()
+            keys.append(key)
+            ranked.insert(key, -key)
+    keys.sort()
+    assert len(ranked) == len(keys)
+    assert [key for key, value in ranked.items()] == keys
+    for index in range(0, len(keys), 37):
+        assert ranked.rank(keys[index]) == index
+        assert ranked.items(index, index + 1) == [(keys[index], -keys[index])]
+    with pytest.raises(KeyError):
+        ranked.remove(2.0)
+
+
+def test_bulk_load_matches_inserts():
+    entries = [(i, str(i)) for i in range(1000)]
+    loaded = RankedList()
+    loaded.load(entries)
+    assert loaded.items() == entries and loaded.rank(500) == 500 and loaded.items(998) == entries[998:]
+    with pytest.raises(ValueError):
+        loaded.load(entries)
+
+
+def test_store_ranks_best_scores_and_reloads(tmp_path):
+    path = str(tmp_path / "scores.bin")
+    with LeaderboardStore(path) as store:
+        assert store.submit(6, 1, 10, 5, timestamp=1.0)
+        assert store.submit(6, 2, 10, 9, timestamp=2.0)
+        assert store.submit(6, 3, 11, 9, timestamp=3.0)
+        assert not store.submit(6, 1, 10, 4, timestamp=4.0)
+        assert store.submit(6, 1, 10, 7, timestamp=5.0)
+        with pytest.raises(ValueError):
+            store.submit(1, 1, 10, 7)
+
+    with LeaderboardStore(path) as store:
+        assert store.top(6) == [(2, 9), (3, 9), (1, 7)]
+        assert store.top(6, class_id=10) == [(2, 9), (1, 7)]
+        assert store.rank(6, 1) == (3, 3, 7)
+        assert store.rank(6, 3, class_id=10) is None
+        assert store.top(7) == []
+
+
+def test_attached_games_submit_only_scored_results(tmp_path):
+    clock = [0.0]
+
+    def play(store, mode, pupil, right, run_out_of_time):
+        engine = MathEngine(mode, lambda: clock[0], seed=pupil)
+        store.attach(engine, pupil, 10)
+        question = engine.start()
+        for i in range(right):
+            question = engine.check_answer(str(question.answer)).next_question
+        if run_out_of_time:
+            clock[0] += MathEngine._start_time
+            engine.update_timer()
+        engine.finish()
+
+    with LeaderboardStore(str(tmp_path / "scores.bin")) as store:
+        play(store, 6, 1, 4, True)
+        play(store, 6, 2, 9, False)
+        play(store, 7, 3, 5, False)
+        play(store, 5, 4, 8, False)
+        assert store.top(6) == [(1, 4)]
+        assert store.top(7) == [(3, 5)]
+        assert store.rank(6, 2) is None
@@ -0,0 +1,73 @@
+__author__ = "Harry Baines"
+
+from levelcache import LevelCache
+from mathengine import MathEngine
+
+""" Tests for the per-pupil level cache. """
+
+
+def _state(level):
+    engine = MathEngine(1, seed=1, max_level=50)
+    engine._max_bound = level
+    return engine.pack()
+
+
+def test_states_survive_eviction_and_restart(tmp_path):
+    path = str(tmp_path / "levels.db")
+    with LevelCache(path, capacity=2, flush_every=100) as cache:
+        for pupil in range(5):
+            cache.put(pupil, _state(5 + pupil))
+        assert len(cache) == 2
+        assert MathEngine.unpack(cache.get(0))._max_bound == 5
+        assert cache.get(99) is None
+
+    with LevelCache(path, capacity=3) as cache:
+        assert len(cache) == 3
+        assert [MathEngine.unpack(cache.get(pupil))._max_bound for pupil in range(5)] == [5, 6, 7, 8, 9]
+
+
+def test_attach_carries_level_between_games(tmp_path):
+    with LevelCache(str(tmp_path / "levels.db")) as cache:
+        first = MathEngine(1, seed=1)
+        cache.attach(first, 4)
+        first.start()
+        for i in range(9):
+            first.check_answer(str(first.question.answer))
+        first.finish()
+
+        second = MathEngine(1, seed=2)
+        cache.attach(second, 4)
+        assert second._max_bound == first._max_bound == MathEngine._start_max + 3
+
+
+def test_unreadable_state_is_dropped(tmp_path):
+    path = str(tmp_path / "levels.db")
+    with LevelCache(path) as cache:
+        cache.put(4, b"not a snapshot")
+        cache.flush()
+        engine = MathEngine(1, seed=1)
+        cache.attach(engine, 4)
+        assert engine._max_bound == MathEngine._start_max
+        assert cache.get(4) is None
+        engine.start()
+        engine.finish()
+        assert MathEngine.unpack(cache.get(4))._max_bound == MathEngine._start_max
+
+
+def test_states_are_written_behind_in_batches(tmp_path):
+    path = str(tmp_path / "levels.db")
+    cache = LevelCache(path, flush_every=3, clock=lambda: 1.0)
+    cache.put(1, _state(5))
+    cache.put(2, _state(6))
+    with LevelCache(path) as other:
+        assert len(other) == 0
+    cache.put(3, _state(7))
+    cache.put(4, _state(8))
+    with LevelCache(path) as other:
+        assert len(other) == 3 and other.get(4) is None
+    cache.forget(1)
+    cache.close()
+
+    with LevelCache(path) as cache:
+        assert cache.get(1) is None
+        assert [MathEngine.unpack(cache.get(pupil))._max_bound for pupil in (2, 3, 4)] == [6, 7, 8]
@@ -0,0 +1,49 @@
+__author__ = "Harry Baines"
+
+import pytest
+
+from benchmark import SESSION_BUDGET, bench_sessions
+from mathengine import MathEngine
+
+""" Tests for the math engine's session state, snapshots and level resumption. """
+
+
+def test_session_memory_within_budget():
+    assert bench_sessions(2000, 1)["bytes_per_session"] <= SESSION_BUDGET
+
+
+@pytest.mark.parametrize("math_key", [1, 4, 5, 6, 7, 9])
+def test_pack_round_trip(math_key):
+    clock = [100.0]
+    engine = MathEngine(math_key, clock=lambda: clock[0], seed=3, max_level=1000)
+    engine.start()
+    for i in range(20):
+        engine.check_answer(str(engine.question.answer + (i % 4 == 0)))
+        if engine.finished:
+            break
+    clock[0] += 2.0
+
+    data = engine.pack()
+    restored = MathEngine.unpack(data, clock=lambda: clock[0])
+    assert restored.pack() == data
+    assert restored.question == engine.question
+    assert restored.snapshot()[1:12] == engine.snapshot()[1:12]
+
+
+def test_unpack_rejects_other_data():
+    with pytest.raises(ValueError):
+        MathEngine.unpack(b"\0" * 10)
+    with pytest.raises(ValueError):
+        MathEngine(1).resume_level(b"\2" + MathEngine(1).pack()[1:])
+
+
+def test_resume_level_clamps_and_restarts_totals():
+    engine = MathEngine(1, seed=1, max_level=50)
+    engine._max_bound, engine._min_bound, engine._total_right = 40, 10, 7
+    data = engine.pack()
+
+    resumed = MathEngine(1, seed=2, max_level=20)
+    resumed.resume_level(data)
+    assert (resumed._min_bound, resumed._max_bound, resumed.total_right) == (10, 20, 0)
+    resumed.resume_level(None)
+    assert resumed._max_bound == 20
@@ -0,0 +1,78 @@
+__author__ = "Harry Baines"
+
+import random
+
+import pytest
+
+import operators
+from mathengine import MathEngine, SessionRandom
+from operators import (Expression, Operator, TABLE_SPAN, any_pair, basic_keys, expression_keys, get_operator,
+                       get_pair_table)
+from worksheet import write_shard
+
+""" Tests for the operator registry and expression templates. """
+
+
+@pytest.mark.parametrize("bounds", [(1, 4), (1, TABLE_SPAN + 10), (50, 10 ** 6)])
+def test_generated_operands_meet_constraints(bounds):
+    rng = SessionRandom(1)
+    for key in (1, 2, 3, 4):
+        operator = get_operator(key)
+        for i in range(500):
+            question = operator.generate(bounds[0], bounds[1], rng)
+            assert bounds[0] <= question.left <= bounds[1] and bounds[0] <= question.right <= bounds[1]
+            assert operator.valid(question.left, question.right)
+            assert question.answer == operator.apply(question.left, question.right)
+
+
+def test_expressions_follow_order_of_operations():
+    assert get_operator(11).make((2, 3, 4)).answer == 14
+    assert get_operator(15).make((2, 3, 4)).answer == 20
+    assert get_operator(15).make((2, 3, 4)).text == "(2 + 3) x 4 = ?"
+    with pytest.raises(ValueError):
+        get_operator(13).make((1, 1, 5))
+
+    rng = random.Random(2)
+    for key in expression_keys():
+        for i in range(200):
+            question = get_operator(key).generate(1, 12, rng)
+            assert question.answer >= 0 and len(question.operands) == 3
+
+
+def test_unknown_operator_and_pair_table():
+    with pytest.raises(ValueError):
+        get_operator(99)
+    with pytest.raises(ValueError):
+        get_pair_table("+", 1, 4)
+    assert set(get_pair_table("/", 1, 6)) == {(a, b) for a in range(1, 7) for b in range(1, 7) if a % b == 0}
+
+
+def test_expression_keys_are_registered_templates():
+    keys = expression_keys()
+    assert keys == tuple(sorted(keys)) and all(isinstance(get_operator(key), Expression) for key in keys)
+    assert not set(keys) & {1, 2, 3, 4}
+
+
+def test_basic_keys_follow_the_registry():
+    assert basic_keys() == (1, 2, 3, 4)
+    assert not set(basic_keys()) & set(expression_keys())
+    assert "".join(get_operator(key).symbol for key in basic_keys()) == "+-x/"
+
+
+def test_registered_operators_reach_every_mixed_mode(monkeypatch, tmp_path):
+    mod = Operator(20, "mod", "%", 2, lambda left, right: left % right, lambda left, right: True, any_pair)
+    monkeypatch.setitem(operators._registry, 20, mod)
+    monkeypatch.setattr(operators, "_basic_keys", None)
+    assert basic_keys() == (1, 2, 3, 4, 20)
+
+    engine = MathEngine(5, seed=6)
+    engine.start()
+    asked = {question.operator for question_id, question in engine.issue_sheet(100)}
+    for i in range(100):
+        asked.add(engine.check_answer(str(engine.question.answer)).next_question.operator)
+    assert 20 in asked and asked <= set(basic_keys())
+
+    sheet = str(tmp_path / "sheet.csv")
+    write_shard(0, 1, 10, 5, 9, (20,), 1, "csv", sheet, None)
+    with open(sheet) as f:
+        assert [line.split(",")[2] for line in f.read().splitlines()] == ["%"] * 10
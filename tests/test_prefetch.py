@@ -0,0 +1,87 @@
+__author__ = "Harry Baines"
+
+import time
+
+from prefetch import PrefetchWorker, QuestionPrefetcher
+
+""" Tests for the background question prefetcher. """
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return condition()
+
+
+def test_buffer_fills_in_background_and_follows_level():
+    worker = PrefetchWorker()
+    try:
+        prefetcher = QuestionPrefetcher(worker, (1, 3), size=6, seed=1)
+        prefetcher.invalidate(1, 4)
+        assert _wait_for(lambda: len(prefetcher) == 6)
+        assert all(1 <= prefetcher.get().left <= 4 for i in range(20))
+
+        prefetcher.invalidate(100, 200)
+        assert all(100 <= prefetcher.get().left <= 200 for i in range(20))
+        prefetcher.close()
+        assert len(prefetcher) == 0
+    finally:
+        worker.stop()
+
+
+def test_thrown_away_questions_are_discarded_to_source():
+    class Worker(object):
+        def request(self, prefetcher):
+            pass
+
+    discarded = []
+    drawn = []
+
+    def source(operator, min_bound, max_bound):
+        drawn.append((operator, min_bound, len(drawn)))
+        return drawn[-1]
+
+    prefetcher = QuestionPrefetcher(Worker(), (1,), size=3, source=source, discard=discarded.extend)
+    prefetcher.invalidate(1, 4)
+    prefetcher._fill()
+    assert len(prefetcher) == 3
+    prefetcher.invalidate(2, 5)
+    assert discarded == drawn[:3]
+
+
+class CountingWorker(object):
+
+    def __init__(self):
+        self.requests = 0
+
+    def request(self, prefetcher):
+        self.requests += 1
+
+
+def test_seeded_prefetchers_buffer_the_same_questions():
+    buffers = []
+    for i in range(2):
+        prefetcher = QuestionPrefetcher(CountingWorker(), (1, 2, 3, 4), size=10, seed=42)
+        prefetcher.invalidate(3, 30)
+        prefetcher._fill()
+        buffers.append([prefetcher.get() for j in range(10)])
+    assert buffers[0] == buffers[1]
+    assert len({question.operator for question in buffers[0]}) > 1
+
+
+def test_empty_buffer_generates_now_and_requests_one_refill():
+    worker = CountingWorker()
+    prefetcher = QuestionPrefetcher(worker, (3,), size=4, seed=1)
+    prefetcher.invalidate(5, 9)
+    assert worker.requests == 1
+    question = prefetcher.get()
+    assert question.operator == 3 and 5 <= question.left <= 9 and worker.requests == 1
+
+    prefetcher._fill()
+    assert len(prefetcher) == 4
+    prefetcher.close()
+    prefetcher._fill()
+    assert len(prefetcher) == 0
+    prefetcher.get()
+    assert worker.requests == 1
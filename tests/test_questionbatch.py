@@ -0,0 +1,33 @@
+__author__ = "Harry Baines"
+
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from questionbatch import generate_batch
+
+""" Tests for vectorised question batches. """
+
+
+@pytest.mark.parametrize("max_bound", [10, 40, 100000])
+def test_batch_follows_operator_rules(max_bound):
+    batch = generate_batch(20000, 1, max_bound, seed=1)
+    ops, left, right, answers = batch.operators, batch.left, batch.right, batch.answers
+    assert ((left >= 1) & (left <= max_bound) & (right >= 1) & (right <= max_bound)).all()
+    assert (left[ops == 2] >= right[ops == 2]).all()
+    assert (left[ops == 4] % right[ops == 4] == 0).all()
+    expected = np.select([ops == 1, ops == 2, ops == 3], [left + right, left - right, left * right], left // right)
+    assert (answers == expected).all()
+
+
+def test_wide_division_does_not_build_pair_table():
+    start = time.perf_counter()
+    generate_batch(1000, 1, 10 ** 7, operators=(4,), seed=1)
+    assert time.perf_counter() - start < 1.0
+
+
+def test_batches_are_reproducible():
+    first, second = generate_batch(100, 1, 50, seed=3), generate_batch(100, 1, 50, seed=3)
+    assert list(first.iter_questions()) == list(second.iter_questions())
@@ -0,0 +1,103 @@
+__author__ = "Harry Baines"
+
+from render import RenderBatcher
+
+""" Tests for the render batcher. """
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeVariable(object):
+
+    def __init__(self, name):
+        self._name = name
+        self.value = ""
+        self.sets = 0
+
+    def __str__(self):
+        return self._name
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+        self.sets += 1
+
+
+class FakeWidget(object):
+
+    def __init__(self):
+        self.idle = []
+        self.focused = None
+
+    def after_idle(self, callback):
+        self.idle.append(callback)
+
+    def focus_get(self):
+        return self.focused
+
+
+def test_render_batcher_coalesces_updates():
+    widget = FakeWidget()
+    batcher = RenderBatcher(widget, clock=FakeClock())
+    question, info = FakeVariable("question"), FakeVariable("info")
+    batcher.set(question, "1 + 1 = ?")
+    batcher.set(question, "2 + 2 = ?")
+    batcher.set(info, "")
+    assert len(widget.idle) == 1 and question.sets == 0
+
+    widget.idle.pop()()
+    assert question.value == "2 + 2 = ?" and question.sets == 1 and info.sets == 0
+    stats = batcher.stats()
+    assert stats["frames"] == 1 and stats["sets"] == 1 and stats["skipped"] == 1
+
+
+def test_render_batcher_keeps_scheduling_after_an_error():
+    class BrokenVariable(FakeVariable):
+        def set(self, value):
+            raise RuntimeError("window destroyed")
+
+    widget = FakeWidget()
+    batcher = RenderBatcher(widget, clock=FakeClock())
+    batcher.set(BrokenVariable("gone"), "x")
+    try:
+        widget.idle.pop()()
+    except RuntimeError:
+        pass
+
+    question = FakeVariable("question")
+    batcher.set(question, "3 + 4 = ?")
+    assert len(widget.idle) == 1
+    widget.idle.pop()()
+    assert question.value == "3 + 4 = ?"
+
+
+def test_render_batcher_only_moves_focus_when_needed():
+    class FakeEntry(object):
+        def __init__(self, widget):
+            self._widget = widget
+
+        def focus(self):
+            self._widget.focused = self
+
+    widget = FakeWidget()
+    clock = FakeClock()
+    batcher = RenderBatcher(widget, clock=clock)
+    entry = FakeEntry(widget)
+    batcher.focus(entry)
+    clock.now = 0.25
+    widget.idle.pop()()
+    batcher.focus(entry)
+    widget.idle.pop()()
+    assert widget.focused is entry
+    stats = batcher.stats()
+    assert stats["frames"] == 2 and stats["focus_calls"] == 1
+    assert stats["latency_seconds"]["max"] == 0.25
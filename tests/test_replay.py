@@ -0,0 +1,77 @@
+__author__ = "Harry Baines"
+
+from replay import SessionRecorder, load_recording, save_recording, verify
+
+""" Tests for exact session replay. """
+
+
+def test_recorded_game_replays_exactly(tmp_path):
+    clock = [0.0]
+
+    def tick():
+        clock[0] += 0.37
+        return clock[0]
+
+    recorder = SessionRecorder(6, seed=12345, clock=tick)
+    question = recorder.start()
+    for i in range(25):
+        recorder.check_answer(str(question.answer + (i % 3 == 0)) if i % 7 else "x")
+        recorder.update_timer()
+        question = recorder.engine.question
+        if recorder.engine.finished:
+            break
+    recorder.finish()
+
+    path = str(tmp_path / "game.json")
+    save_recording(recorder.recording(), path)
+    recording = load_recording(path)
+    assert verify(recording)
+
+    tampered = recording._replace(seed=recording.seed + 1)
+    assert not verify(tampered)
+
+
+def test_replay_uses_recorded_max_level_and_difficulty(tmp_path):
+    clock = [0.0]
+
+    def tick():
+        clock[0] += 0.5
+        return clock[0]
+
+    recorder = SessionRecorder(5, seed=99, clock=tick, max_level=50, difficulty="skill")
+    question = recorder.start()
+    for i in range(200):
+        result = recorder.check_answer(str(question.answer))
+        question = result.next_question
+    recorder.finish()
+
+    path = str(tmp_path / "game.json")
+    save_recording(recorder.recording(), path)
+    recording = load_recording(path)
+    assert recording.max_level == 50 and recording.difficulty == "skill"
+    assert max(result[-1] for result in recording.results) > 10
+    assert verify(recording)
+    assert not verify(recording._replace(max_level=10))
+    assert not verify(recording._replace(difficulty="streak"))
+
+
+def test_replay_detects_divergence_from_the_recorded_clock():
+    clock = [0.0]
+
+    def tick():
+        clock[0] += 1.0
+        return clock[0]
+
+    recorder = SessionRecorder(6, seed=5, clock=tick)
+    question = recorder.start()
+    for i in range(20):
+        if recorder.engine.finished:
+            break
+        question = recorder.check_answer(str(question.answer)).next_question or question
+        recorder.update_timer()
+    recorder.finish()
+    recording = recorder.recording()
+    assert recorder.engine.score is not None and verify(recording)
+
+    assert not verify(recording._replace(clock_readings=recording.clock_readings[:-2]))
+    assert not verify(recording._replace(actions=[["answer", "x"]] + recording.actions))
@@ -0,0 +1,79 @@
+__author__ = "Harry Baines"
+
+import pytest
+
+from mathengine import AnswerResult, MathEngine, make_question
+from resultslog import END_OPERATOR, HEADER, MAX_LEVEL, RECORD, ResultsLog, read_records
+
+""" Tests for the binary results log. """
+
+
+def _result(question, given, level, correct=None):
+    correct = given == question.answer if correct is None else correct
+    return AnswerResult(True, correct, "", question, None, False, given, 0.5, level)
+
+
+def test_records_round_trip(tmp_path):
+    path = str(tmp_path / "results.log")
+    question = make_question(3, 3 * 10 ** 9, 3 * 10 ** 9)
+    with ResultsLog(path) as log:
+        game = log.new_game()
+        log.record(2 ** 32 - 1, 7, game, 1, _result(question, question.answer, MAX_LEVEL), timestamp=1.0)
+        log.record(2 ** 32 - 1, 7, game, 1, _result(question, 10 ** 30, 100000), timestamp=2.0)
+        log.record(2 ** 32 - 1, 7, game, 1, AnswerResult(False, False, "", question, question, False, None, None, 4))
+
+    records = list(read_records(path))
+    assert len(records) == 2
+    assert records[0].level == MAX_LEVEL and records[0].answer == 9 * 10 ** 18 and records[0].correct
+    assert records[1].level == 100000 and records[1].given == 2 ** 63 - 1 and not records[1].correct
+
+
+def test_reopen_keeps_totals_and_drops_partial_record(tmp_path):
+    path = str(tmp_path / "results.log")
+    question = make_question(1, 2, 2)
+    with ResultsLog(path, rollup_every=1) as log:
+        log.record(1, 1, log.new_game(), 1, _result(question, 4, 4))
+    with ResultsLog(path) as log:
+        log.record(1, 1, log.new_game(), 1, _result(question, 5, 4))
+    with open(path, "ab") as f:
+        f.write(b"\0" * (RECORD.size // 2))
+
+    log = ResultsLog(path)
+    assert log.pupil_stats(1)["right"] == 1 and log.pupil_stats(1)["wrong"] == 1
+    assert log.new_game() == 3
+    log.close()
+    assert len(list(read_records(path))) == 2
+
+
+def test_old_layout_is_refused(tmp_path):
+    path = tmp_path / "results.log"
+    path.write_bytes(b"\0" * 45 * 3)
+    with pytest.raises(ValueError):
+        ResultsLog(str(path))
+    path.write_bytes(HEADER.pack(b"MGRL", 1))
+    with pytest.raises(ValueError):
+        list(read_records(str(path)))
+
+
+def test_scored_games_end_with_an_end_record(tmp_path):
+    path = str(tmp_path / "results.log")
+    clock = [0.0]
+    with ResultsLog(path) as log:
+        for quit_early in (False, True):
+            engine = MathEngine(6, lambda: clock[0], seed=3)
+            log.attach(engine, 5, 2)
+            question = engine.start()
+            for i in range(3):
+                question = engine.check_answer(str(question.answer)).next_question
+            if not quit_early:
+                clock[0] += MathEngine._start_time
+                engine.update_timer()
+            engine.finish()
+        assert log.pupil_stats(5)["right"] == 6
+
+    records = list(read_records(path))
+    ends = [record for record in records if record.operator == END_OPERATOR]
+    assert len(records) == 7 and len(ends) == 1
+    assert ends[0].game == records[0].game and ends[0].given == 3 and ends[0].mode == 6
+    with ResultsLog(path) as log:
+        assert log.pupil_stats(5)["right"] == 6
@@ -0,0 +1,77 @@
+__author__ = "Harry Baines"
+
+import random
+
+from mathengine import MathEngine
+from prefetch import QuestionPrefetcher
+from scheduler import QuestionScheduler
+
+""" Tests for the question scheduler and its use through a prefetcher. """
+
+
+class ManualWorker(object):
+
+    """ This class stands in for a PrefetchWorker, refilling buffers only when told to,
+        so tests can control exactly when questions are drawn. """
+
+    def __init__(self):
+        self._pending = []
+
+    def request(self, prefetcher):
+        self._pending.append(prefetcher)
+
+    def run(self):
+        while self._pending:
+            self._pending.pop(0)._fill()
+
+
+def test_deck_deals_every_pair_before_repeating():
+    scheduler = QuestionScheduler(rng=random.Random(1))
+    pairs = [scheduler.next_question(1, 1, 4)[1:3] for i in range(16)]
+    assert sorted(pairs) == [(a, b) for a in range(1, 5) for b in range(1, 5)]
+
+
+def test_wrong_answer_is_reviewed():
+    scheduler = QuestionScheduler(review_gap=2, rng=random.Random(1))
+    question = scheduler.next_question(3, 1, 10)
+    scheduler.record(question, False)
+    asked = [scheduler.next_question(3, 1, 10) for i in range(3)]
+    assert asked[1] == question
+
+
+def test_requeue_returns_unasked_reviews():
+    scheduler = QuestionScheduler(review_gap=0, rng=random.Random(1))
+    question = scheduler.next_question(1, 1, 4)
+    scheduler.record(question, False)
+    assert scheduler.next_question(1, 1, 4) == question
+    scheduler.requeue([question])
+    assert scheduler.next_question(1, 1, 4) == question
+
+    # Answered reviews and ordinary questions are not taken back
+    scheduler.record(question, True)
+    other = scheduler.next_question(1, 1, 4)
+    scheduler.requeue([question, other])
+    assert scheduler.next_question(1, 1, 4) not in (question, other)
+
+
+def test_review_survives_level_change_with_prefetcher():
+    for seed in range(20):
+        worker = ManualWorker()
+        scheduler = QuestionScheduler(rng=random.Random(seed))
+        engine = MathEngine(1, seed=seed)
+        engine.set_scheduler(scheduler)
+        engine.set_prefetcher(QuestionPrefetcher(worker, engine.operator_keys, source=scheduler.next_question,
+                                                 discard=scheduler.requeue))
+        worker.run()
+        first = engine.start()
+        engine.check_answer(str(first.answer + 1))
+
+        # Three right answers raise the level while the review sits in the buffer
+        asked = []
+        for i in range(30):
+            worker.run()
+            question = engine.question
+            asked.append(question)
+            engine.check_answer(str(question.answer))
+        assert engine._max_bound > MathEngine._start_max
+        assert first in asked, seed
@@ -0,0 +1,93 @@
+__author__ = "Harry Baines"
+
+import json
+
+from levelcache import LevelCache
+from mathengine import MathEngine
+from operators import expression_keys
+from resultslog import ResultsLog, read_records
+from sessionserver import GameServer, SessionManager
+
+""" Tests for the session manager and the line-based game protocol. """
+
+
+def test_out_of_range_ids_are_rejected(tmp_path):
+    path = str(tmp_path / "results.log")
+    with ResultsLog(path) as log:
+        server = GameServer(SessionManager(results_log=log))
+        for command in ("NEW 5 -1 0", "NEW 5 0 -1", "NEW 5 4294967296 0", "NEW 5 0 4294967296"):
+            response = server.handle_command(command)
+            assert response["ok"] is False and "ids" in response["error"]
+        assert len(server._manager) == 0
+
+        response = server.handle_command("NEW 1 4294967295 4294967295")
+        assert response["ok"]
+        answer = server.handle_command("ANSWER " + response["session"] + " 1")
+        assert answer["ok"] and answer["valid"]
+    assert [record.pupil for record in read_records(path)] == [2 ** 32 - 1]
+
+
+def _finished_engine(level, model=None):
+    engine = MathEngine(5, seed=1)
+    if model is not None:
+        engine.set_difficulty(model)
+    engine._max_bound = level
+    engine.finish()
+    return engine
+
+
+def test_anonymous_sessions_are_not_attributed(tmp_path):
+    path = str(tmp_path / "results.log")
+    with ResultsLog(path) as log, LevelCache(str(tmp_path / "levels.db")) as levels:
+        levels.put(0, _finished_engine(8).pack())
+        server = GameServer(SessionManager(results_log=log, levels=levels))
+        session = server.handle_command("NEW 1")["session"]
+        assert server._manager.get(session).engine._max_bound == MathEngine._start_max
+        server.handle_command("ANSWER " + session + " 1")
+        server.handle_command("END " + session)
+        assert MathEngine.unpack(levels.get(0))._max_bound == 8
+    assert list(read_records(path)) == []
+
+
+def test_skill_model_resumes_cached_level(tmp_path):
+    with LevelCache(str(tmp_path / "levels.db")) as levels:
+        levels.put(7, _finished_engine(8).pack())
+        server = GameServer(SessionManager(difficulty="skill", levels=levels))
+        session = server.handle_command("NEW 5 7 1")["session"]
+        engine = server._manager.get(session).engine
+        assert engine._max_bound == 8
+        question = engine.question
+        server.handle_command("ANSWER " + session + " " + str(question.answer))
+        assert engine._max_bound >= 8
+
+
+def test_expression_mode_sheets_ask_expressions():
+    for difficulty in ("streak", "skill"):
+        server = GameServer(SessionManager(difficulty=difficulty))
+        session = server.handle_command("NEW 9")["session"]
+        sheet = server.handle_command("SHEET " + session + " 40")
+        assert sheet["ok"] and len(sheet["questions"]) == 40
+        engine = server._manager.get(session).engine
+        questions = [engine._sheet[question_id][0] for question_id, text in sheet["questions"]]
+        assert all(question.operator in expression_keys() for question in questions)
+        assert len({question.operator for question in questions}) > 1
+        answers = [[question_id, str(question.answer)]
+                   for (question_id, text), question in zip(sheet["questions"], questions)]
+        assert all(server.handle_command("GRADE " + session + " " + json.dumps(answers))["results"])
+
+
+def test_failed_setup_leaves_no_session(tmp_path):
+    class BrokenLevels(object):
+        def attach(self, engine, pupil):
+            raise ValueError("Unreadable level")
+
+    server = GameServer(SessionManager(levels=BrokenLevels()))
+    response = server.handle_command("NEW 5 7 1")
+    assert response["ok"] is False and len(server._manager) == 0
+
+    with LevelCache(str(tmp_path / "levels.db")) as levels:
+        levels.put(7, b"\x00" * 3)
+        server = GameServer(SessionManager(levels=levels))
+        session = server.handle_command("NEW 5 7 1")["session"]
+        answer = server.handle_command("ANSWER " + session + " 1")
+        assert answer["ok"] and answer["valid"]
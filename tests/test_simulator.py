@@ -0,0 +1,33 @@
+__author__ = "Harry Baines"
+
+import pytest
+
+from simulator import AccuracyModel, run_simulation, simulate_players
+
+""" Tests for the population simulator. """
+
+
+@pytest.mark.parametrize("difficulty", ["streak", "skill"])
+def test_simulation_report_is_reproducible(difficulty):
+    reports = [run_simulation(40, 30, 5, 1, 15, difficulty=difficulty) for i in range(2)]
+    for report in reports:
+        report.pop("seconds"), report.pop("players_per_second"), report.pop("answers_per_second")
+    assert reports[0] == reports[1]
+    assert sum(reports[0]["final_levels"].values()) == 40
+    assert abs(sum(reports[0]["operator_mix"].values()) - 1.0) < 1e-9
+
+
+def test_perfect_players_reach_the_max_level_and_hopeless_ones_stay_at_the_start():
+    perfect = simulate_players(0, 10, 40, 3, AccuracyModel(base=1.0, level_drop=0.0, operator_drop={}, spread=0.0))
+    assert perfect["final_levels"] == {10: 10} and perfect["answers"] == 400
+    assert perfect["time_to_max"] == {3 * 6: 10}
+
+    hopeless = simulate_players(0, 10, 40, 3, AccuracyModel(base=0.0, spread=0.0))
+    assert hopeless["final_levels"] == {4: 10} and hopeless["time_to_max"] == {None: 10}
+
+
+def test_results_do_not_depend_on_how_players_are_chunked():
+    whole = run_simulation(30, 20, 9, 1, 30)
+    chunked = run_simulation(30, 20, 9, 1, 7)
+    for key in ("final_levels", "reached_max_level", "questions_to_max_level", "operator_mix"):
+        assert whole[key] == chunked[key]
@@ -0,0 +1,56 @@
+__author__ = "Harry Baines"
+
+from timerwheel import TimerWheel
+
+""" Tests for the hashed timer wheel. """
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_timer_wheel_fires_due_timers_once():
+    clock = FakeClock()
+    wheel = TimerWheel(tick=0.1, slots=8, clock=clock)
+    fired = []
+    wheel.call_later(0.25, lambda: fired.append("short"))
+    wheel.call_later(2.0, lambda: fired.append("long"))
+    wheel.call_later(0.5, lambda: fired.append("cancelled")).cancel()
+    assert len(wheel) == 2
+
+    clock.now = 0.35
+    wheel.advance()
+    assert fired == ["short"]
+    clock.now = 1.9
+    wheel.advance()
+    assert fired == ["short"]
+    clock.now = 2.05
+    wheel.advance()
+    assert fired == ["short", "long"] and len(wheel) == 0
+
+
+def test_timers_armed_while_firing_wait_for_their_own_tick():
+    clock = FakeClock()
+    wheel = TimerWheel(tick=0.1, slots=8, clock=clock)
+    fired = []
+
+    def rearm():
+        fired.append(clock.now)
+        if len(fired) < 2:
+            wheel.call_later(0.1, rearm)
+
+    handle = wheel.call_later(0.25, rearm)
+    clock.now = 0.35
+    assert wheel.advance() == 1 and handle.cancelled
+    handle.cancel()
+    assert len(wheel) == 1
+
+    clock.now = 0.45
+    assert wheel.advance() == 0
+    clock.now = 0.55
+    assert wheel.advance() == 1 and fired == [0.35, 0.55] and len(wheel) == 0
@@ -0,0 +1,47 @@
+__author__ = "Harry Baines"
+
+import json
+import os
+
+import pytest
+
+from worksheet import export
+
+""" Tests for sharded worksheet export. """
+
+
+def test_export_is_reproducible_and_answers_match(tmp_path):
+    outputs = []
+    for run in range(2):
+        sheet, key = str(tmp_path / ("sheet%d.csv" % run)), str(tmp_path / ("key%d.csv" % run))
+        export(250, 1, 12, (1, 2, 3, 4), 7, "csv", sheet, key, workers=2, shard_size=60)
+        with open(sheet) as f, open(key) as g:
+            outputs.append((f.read(), g.read()))
+    assert outputs[0] == outputs[1]
+
+    questions = outputs[0][0].splitlines()[1:]
+    answers = outputs[0][1].splitlines()[1:]
+    assert len(questions) == len(answers) == 250
+    apply = {"+": lambda a, b: a + b, "-": lambda a, b: a - b, "x": lambda a, b: a * b, "/": lambda a, b: a // b}
+    for number, (question, answer) in enumerate(zip(questions, answers), 1):
+        index, left, symbol, right = question.split(",")
+        assert int(index) == number and answer == "%d,%d" % (number, apply[symbol](int(left), int(right)))
+
+
+def test_jsonl_export_without_answer_key_leaves_no_shards(tmp_path):
+    sheet = str(tmp_path / "sheet.jsonl")
+    export(25, 5, 9, (2,), 3, "jsonl", sheet, workers=1, shard_size=10)
+    with open(sheet) as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["number"] for line in lines] == list(range(1, 26))
+    assert all(line["operator"] == "-" and 5 <= line["right"] <= line["left"] <= 9 for line in lines)
+    assert os.listdir(str(tmp_path)) == ["sheet.jsonl"]
+
+
+@pytest.mark.parametrize("fmt, operators, bounds", [("pdf", (1,), (1, 12)), ("csv", (), (1, 12)),
+                                                    ("csv", (11,), (1, 12)), ("csv", (1,), (0, 12)),
+                                                    ("csv", (1,), (12, 1))])
+def test_invalid_exports_are_refused(tmp_path, fmt, operators, bounds):
+    with pytest.raises(ValueError):
+        export(5, bounds[0], bounds[1], operators, 1, fmt, str(tmp_path / "sheet"))
+    assert os.listdir(str(tmp_path)) == []
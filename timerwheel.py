@@ -0,0 +1,138 @@
+__author__ = "Harry Baines"
+
+import math
+import time
+
+""" This module provides a hashed timer wheel, a scheduler which can run every time attack
+countdown in the program from one shared driver. Timers are armed and cancelled in O(1)
+and deadlines are measured with a monotonic clock, so countdowns stay accurate when the
+driver is called late under load.
+"""
+
+
+class TimerHandle(object):
+
+    """ This class represents a timer armed on a TimerWheel, which can be used to cancel it. """
+
+    __slots__ = ("_wheel", "_callback", "_slot", "_rounds", "_cancelled")
+
+    def __init__(self, wheel, callback, slot, rounds):
+        """ Constructor to initialise a new TimerHandle instance.
+
+        Args:
+            wheel: the TimerWheel the timer is armed on.
+            callback: the function to call when the timer fires.
+            slot: the index of the wheel slot holding the timer.
+            rounds: the number of full turns of the wheel before the timer fires.
+        """
+        self._wheel = wheel
+        self._callback = callback
+        self._slot = slot
+        self._rounds = rounds
+        self._cancelled = False
+
+    def cancel(self):
+        """ Cancels the timer if it has not already fired. """
+        if not self._cancelled:
+            self._cancelled = True
+            self._wheel._remove(self)
+
+    @property
+    def cancelled(self):
+        """ Returns whether the timer has been cancelled or has fired.
+
+        Returns:
+            True if the timer will no longer fire.
+        """
+        return self._cancelled
+
+
+class TimerWheel(object):
+
+    """ This class implements a hashed timer wheel. Time is divided into ticks and
+        each timer is stored in the slot for the tick it is due in, along with the
+        number of turns of the wheel left before it fires. The wheel is driven by
+        calling advance() regularly, for example from Tk's after() or an asyncio task. """
+
+    def __init__(self, tick=0.05, slots=512, clock=time.monotonic):
+        """ Constructor to initialise a new TimerWheel instance.
+
+        Args:
+            tick: the length of one tick in seconds.
+            slots: the number of slots in the wheel.
+            clock: the monotonic clock function used to measure time.
+        """
+        self._tick = tick
+        self._slots = [dict() for i in range(slots)]
+        self._clock = clock
+        self._start = clock()
+        self._current_tick = 0
+        self._count = 0
+
+    def __len__(self):
+        """ Returns the number of timers waiting to fire.
+
+        Returns:
+            the number of armed timers.
+        """
+        return self._count
+
+    def call_later(self, delay, callback):
+        """ Arms a timer to call the callback after the given delay.
+
+        Args:
+            delay: the delay in seconds.
+            callback: the function to call with no arguments.
+
+        Returns:
+            the TimerHandle which can cancel the timer.
+        """
+        due_tick = math.ceil((self._clock() + delay - self._start) / self._tick)
+        ticks = max(1, due_tick - self._current_tick)
+        slot = (self._current_tick + ticks) % len(self._slots)
+        handle = TimerHandle(self, callback, slot, (ticks - 1) // len(self._slots))
+        self._slots[slot][handle] = None
+        self._count += 1
+        return handle
+
+    def _remove(self, handle):
+        """ Removes a timer from its slot.
+
+        Args:
+            handle: the TimerHandle to remove.
+        """
+        del self._slots[handle._slot][handle]
+        self._count -= 1
+
+    def advance(self):
+        """ Fires every timer which has become due since the wheel was last advanced.
+
+        Returns:
+            the number of timers fired.
+        """
+        now_tick = int((self._clock() - self._start) / self._tick)
+        fired = 0
+        while self._current_tick < now_tick:
+            self._current_tick += 1
+            slot = self._slots[self._current_tick % len(self._slots)]
+            if not slot:
+                continue
+
+            for handle in list(slot):
+                if handle._rounds > 0:
+                    handle._rounds -= 1
+                elif not handle._cancelled:
+                    handle._cancelled = True
+                    self._remove(handle)
+                    handle._callback()
+                    fired += 1
+        return fired
+
+    @property
+    def tick(self):
+        """ Returns the length of one tick in seconds.
+
+        Returns:
+            the tick length.
+        """
+        return self._tick
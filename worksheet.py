@@ -0,0 +1,201 @@
+__author__ = "Harry Baines"
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from mathengine import generate_question
+from operators import basic_keys, get_operator
+
+""" This module provides a command line tool which exports large sets of questions as plain-text
+worksheets with matching answer keys, straight from the math engine generators without any UI.
+Generation is split into shards which run in parallel across CPU cores, each with its own seed
+so the output is the same on every run. Shards stream to files through buffered writers and are
+joined in order at the end, so memory use stays flat however many questions are exported:
+
+    python worksheet.py --count 200000 --max 10 --format text --output sheet.txt --answers key.txt
+"""
+
+# Formats a worksheet can be written in, and the file headers for each
+FORMATS = ("csv", "jsonl", "text")
+_HEADERS = {"csv": ("number,left,operator,right\n", "number,answer\n"), "jsonl": ("", ""), "text": ("", "")}
+
+# Size of the write buffer for each output file
+_BUFFER_SIZE = 1 << 20
+
+
+def _format_question(fmt, number, question):
+    """ Formats one question as a worksheet line.
+
+    Args:
+        fmt: the output format.
+        number: the question number.
+        question: the Question.
+
+    Returns:
+        the line of text.
+    """
+    symbol = get_operator(question.operator).symbol
+    if fmt == "csv":
+        return "%d,%d,%s,%d\n" % (number, question.left, symbol, question.right)
+    if fmt == "jsonl":
+        return json.dumps({"number": number, "left": question.left, "operator": symbol, "right": question.right}) + "\n"
+    return "%7d)  %6d %s %-6d = ________\n" % (number, question.left, symbol, question.right)
+
+
+def _format_answer(fmt, number, question):
+    """ Formats one question's answer as an answer key line.
+
+    Args:
+        fmt: the output format.
+        number: the question number.
+        question: the Question.
+
+    Returns:
+        the line of text.
+    """
+    if fmt == "csv":
+        return "%d,%d\n" % (number, question.answer)
+    if fmt == "jsonl":
+        return json.dumps({"number": number, "answer": question.answer}) + "\n"
+    return "%7d)  %8d\n" % (number, question.answer)
+
+
+def shard_seed(seed, shard):
+    """ Returns the seed for one shard, so each shard is reproducible on its own.
+
+    Args:
+        seed: the seed for the whole export.
+        shard: the index of the shard.
+
+    Returns:
+        the shard's seed.
+    """
+    return seed * 1000003 + shard
+
+
+def write_shard(shard, first, count, min_bound, max_bound, operators, seed, fmt, question_path, answer_path):
+    """ Generates one shard of questions, streaming them to a question file and an answer file.
+
+    Args:
+        shard: the index of the shard.
+        first: the number of the shard's first question.
+        count: the number of questions in the shard.
+        min_bound: the minimum operand value.
+        max_bound: the maximum operand value.
+        operators: the keys of registered operators to choose from.
+        seed: the seed for the whole export.
+        fmt: the output format.
+        question_path: the path of the shard's question file.
+        answer_path: the path of the shard's answer file, or None.
+
+    Returns:
+        the number of questions written.
+    """
+    rng = random.Random(shard_seed(seed, shard))
+    answers = open(answer_path, "w", buffering=_BUFFER_SIZE) if answer_path else None
+    try:
+        with open(question_path, "w", buffering=_BUFFER_SIZE) as questions:
+            for number in range(first, first + count):
+                question = generate_question(rng.choice(operators), min_bound, max_bound, rng)
+                questions.write(_format_question(fmt, number, question))
+                if answers is not None:
+                    answers.write(_format_answer(fmt, number, question))
+    finally:
+        if answers is not None:
+            answers.close()
+    return count
+
+
+def _join(path, header, parts):
+    """ Joins shard files in order into one output file, deleting the shard files.
+
+    Args:
+        path: the path of the output file.
+        header: the text written before the first shard.
+        parts: the list of shard file paths in order.
+    """
+    with open(path, "w", buffering=_BUFFER_SIZE) as out:
+        out.write(header)
+        out.flush()
+        for part in parts:
+            with open(part) as f:
+                shutil.copyfileobj(f, out, _BUFFER_SIZE)
+            os.remove(part)
+
+
+def export(count, min_bound, max_bound, operators, seed, fmt, output, answers=None, workers=None, shard_size=50000):
+    """ Exports a worksheet, and optionally its answer key, using a pool of worker processes.
+
+    Args:
+        count: the number of questions.
+        min_bound: the minimum operand value.
+        max_bound: the maximum operand value.
+        operators: the keys of registered operators to choose from.
+        seed: the seed for the whole export.
+        fmt: the output format - 'csv', 'jsonl' or 'text'.
+        output: the path of the worksheet file.
+        answers: the path of the answer key file, or None.
+        workers: the number of worker processes, or None for one per CPU core.
+        shard_size: the number of questions in each shard.
+
+    Raises:
+        ValueError: if the format, operators or bounds are not valid.
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unknown format: " + str(fmt))
+    if not operators or any(key not in basic_keys() for key in operators):
+        raise ValueError("Operators must be keys of registered operators " + str(basic_keys()))
+    if not 1 <= min_bound <= max_bound:
+        raise ValueError("Bounds must satisfy 1 <= min <= max")
+
+    tmp_dir = tempfile.mkdtemp(prefix="worksheet-", dir=os.path.dirname(os.path.abspath(output)))
+    question_parts = []
+    answer_parts = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for shard, first in enumerate(range(0, count, shard_size)):
+                question_parts.append(os.path.join(tmp_dir, "q%06d" % shard))
+                answer_parts.append(os.path.join(tmp_dir, "a%06d" % shard) if answers else None)
+                futures.append(pool.submit(write_shard, shard, first + 1, min(shard_size, count - first), min_bound,
+                                           max_bound, tuple(operators), seed, fmt, question_parts[-1], answer_parts[-1]))
+            for future in futures:
+                future.result()
+
+        _join(output, _HEADERS[fmt][0], question_parts)
+        if answers:
+            _join(answers, _HEADERS[fmt][1], answer_parts)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Main function to export a worksheet from the command line
+def main():
+    parser = argparse.ArgumentParser(description="Export Maths Game worksheets and answer keys.")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--min", type=int, default=1, dest="min_bound")
+    parser.add_argument("--max", type=int, default=10, dest="max_bound")
+    parser.add_argument("--operators", default="1,2,3,4", help="comma-separated operator keys (1=+, 2=-, 3=x, 4=/)")
+    parser.add_argument("--seed", type=int, default=212)
+    parser.add_argument("--format", choices=FORMATS, default="text")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--answers", help="file to write the answer key to")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    operators = [int(key) for key in args.operators.split(",")]
+    export(args.count, args.min_bound, args.max_bound, operators, args.seed, args.format, args.output,
+           args.answers, args.workers, args.shard_size)
+    print("Exported " + str(args.count) + " questions in " + format(time.perf_counter() - start, ".2f") + " s")
+
+# Program entry point
+if __name__ == "__main__":
+    main()